@@ -0,0 +1,458 @@
+# alarm_engine.py
+import threading
+import time
+import weakref
+from collections import namedtuple
+import numpy as np
+from change_events import ChangeNotifier, READINGS_ADDED, SENSOR_CHANGED, SETTINGS_CHANGED
+from database_connector import DatabaseConnector
+from time_series import to_epoch
+from trends import RollingRegression
+
+# Alarm states, in order of severity (the engine stores the index)
+NORMAL = "Normal"
+WARNING = "Warning"
+CRITICAL = "Critical"
+STATES = (NORMAL, WARNING, CRITICAL)
+
+# Why a sensor is in its state: its level, a fast rising level, or a level
+# forecast to reach critical soon
+LEVEL = "level"
+RISE = "rise"
+FORECAST = "forecast"
+
+# A sensor's alarm state changed; ts is epoch seconds of the reading that
+# caused it (or of the evaluation, if no new reading did) and reason is
+# LEVEL, RISE or FORECAST
+AlarmTransition = namedtuple("AlarmTransition",
+                             ["sensor_id", "old_state", "new_state", "level", "ts", "reason"])
+
+
+class AlarmEngine:
+    """
+    Alarm evaluation without any widgets. Keeps each sensor's thresholds,
+    last level and alarm state in NumPy arrays, evaluates any number of
+    sensors in one vectorized pass and reports only state changes, as
+    lists of AlarmTransitions published through `transitions`.
+
+    To keep a level hovering at a threshold from flapping, a state is
+    entered at its threshold but only left below threshold - deadband,
+    and a new state has to persist for dwell seconds (reading time)
+    before it is taken.
+
+    Each sensor's trend is the least-squares slope of its readings over
+    the last rise_window seconds, kept by a RollingRegression that
+    add_readings() feeds with new readings, O(1) per reading.
+    time_to_threshold() extrapolates it. With rise_rate
+    set (%/h) a sensor rising at least that fast is raised to Warning
+    early, and with forecast set (seconds) so is a sensor expected to
+    reach its critical threshold within that time.
+
+    for_database() gives the engine that follows a database: it evaluates
+    every committed change, whether or not a screen shows the sensor,
+    from the readings its change events carry (see apply_events()).
+    Widgets only render state() and the transitions.
+    """
+
+    DEFAULT_WARNING = 75
+    DEFAULT_CRITICAL = 85
+    DEFAULT_DEADBAND = 2         # Percentage points
+    DEFAULT_DWELL = 0            # Seconds
+    DEFAULT_RISE_RATE = 0        # %/h, 0 = no rate-of-rise alarm
+    DEFAULT_RISE_WINDOW = 3600   # Seconds
+    DEFAULT_FORECAST = 0         # Seconds, 0 = no forecast alarm
+    RISE_RELEASE = 0.5           # A rise alarm ends below this share of rise_rate
+    FORECAST_RELEASE = 1.5       # A forecast alarm ends above this share of forecast
+
+    # One engine per database
+    _engines = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def for_database(db=None):
+        """Engine following db, by default the shared DatabaseConnector database"""
+        if db is None:
+            db = DatabaseConnector.get_instance()
+        engine = AlarmEngine._engines.get(db)
+        if engine is None:
+            engine = AlarmEngine()
+            engine.sync(db)
+            # Runs on the thread that committed the change, before the GUI
+            # is told about it, so views always read an up-to-date state
+            db.events.subscribe(lambda events: engine.apply_events(db, events), first=True)
+            AlarmEngine._engines[db] = engine
+        return engine
+
+    def __init__(self, warning_threshold=None, critical_threshold=None):
+        self.warning_threshold = self.DEFAULT_WARNING if warning_threshold is None else warning_threshold
+        self.critical_threshold = self.DEFAULT_CRITICAL if critical_threshold is None else critical_threshold
+        self.deadband = self.DEFAULT_DEADBAND
+        self.dwell = self.DEFAULT_DWELL
+        self.rise_rate = self.DEFAULT_RISE_RATE
+        self.forecast = self.DEFAULT_FORECAST
+        self.trends = RollingRegression(self.DEFAULT_RISE_WINDOW)
+        self.transitions = ChangeNotifier()
+        self._lock = threading.Lock()
+        self._rows = {}   # sensor_id -> row in the arrays
+        self._ids = []
+        self._stamps = {}  # sensor_id -> (last_updated as stored, epoch seconds)
+        self._warning = np.empty(0)
+        self._critical = np.empty(0)
+        self._level = np.empty(0)                 # Last level, NaN before the first
+        self._ts = np.empty(0)                    # Time of the last level
+        self._state = np.empty(0, dtype=np.int8)  # Index into STATES
+        self._rising = np.empty(0, dtype=bool)    # In a rate-of-rise alarm
+        self._forecasting = np.empty(0, dtype=bool)  # In a forecast alarm
+        self._pending = np.empty(0, dtype=np.int8)  # State waiting out the dwell, -1: none
+        self._pending_since = np.empty(0)
+
+    def _row_numbers(self, sensor_ids):
+        """Rows of sensor_ids, adding rows for sensors not seen before (lock held)"""
+        new = [sensor_id for sensor_id in dict.fromkeys(sensor_ids) if sensor_id not in self._rows]
+        if new:
+            for sensor_id in new:
+                self._rows[sensor_id] = len(self._ids)
+                self._ids.append(sensor_id)
+            count = len(new)
+            self._warning = np.append(self._warning, np.full(count, float(self.warning_threshold)))
+            self._critical = np.append(self._critical, np.full(count, float(self.critical_threshold)))
+            self._level = np.append(self._level, np.full(count, np.nan))
+            self._ts = np.append(self._ts, np.full(count, np.nan))
+            self._state = np.append(self._state, np.zeros(count, dtype=np.int8))
+            self._rising = np.append(self._rising, np.zeros(count, dtype=bool))
+            self._forecasting = np.append(self._forecasting, np.zeros(count, dtype=bool))
+            self._pending = np.append(self._pending, np.full(count, -1, dtype=np.int8))
+            self._pending_since = np.append(self._pending_since, np.full(count, np.nan))
+        return np.array([self._rows[sensor_id] for sensor_id in sensor_ids], dtype=np.int64)
+
+    def set_thresholds(self, warning, critical, sensor_ids=None):
+        """
+        Set the thresholds of sensor_ids, or of every sensor (and the
+        default for new ones) when None. Sensors are evaluated again with
+        their last level; returns the transitions.
+        """
+        with self._lock:
+            if sensor_ids is None:
+                self.warning_threshold = warning
+                self.critical_threshold = critical
+                rows = np.arange(len(self._ids))
+            else:
+                rows = self._row_numbers(list(sensor_ids))
+            self._warning[rows] = warning
+            self._critical[rows] = critical
+            transitions = self._evaluate_rows(rows, self._level[rows], self._ts[rows])
+        self.transitions.publish(transitions)
+        return transitions
+
+    def set_filtering(self, deadband=None, dwell=None, rise_rate=None, rise_window=None,
+                      forecast=None):
+        """Change the deadband, dwell, rise_rate, rise_window or forecast; None keeps a value"""
+        with self._lock:
+            if deadband is not None:
+                self.deadband = deadband
+            if dwell is not None:
+                self.dwell = dwell
+            if rise_rate is not None:
+                self.rise_rate = rise_rate
+            if rise_window is not None:
+                # A shorter window drops older samples with the next reading
+                self.trends.window = rise_window
+            if forecast is not None:
+                self.forecast = forecast
+
+    def evaluate(self, sensor_ids, levels, ts=None):
+        """
+        Evaluate new levels of sensor_ids (parallel sequences). ts is the
+        time of the readings, one value or one per sensor, by default now.
+        Levels that are None or NaN leave the sensor's state alone.
+        Returns the transitions, which are also published.
+        """
+        levels = np.array(levels, dtype=np.float64)
+        ts = np.broadcast_to(np.array(time.time() if ts is None else ts, dtype=np.float64),
+                             levels.shape)
+        with self._lock:
+            rows = self._row_numbers(list(sensor_ids))
+            transitions = self._evaluate_rows(rows, levels, ts)
+        self.transitions.publish(transitions)
+        return transitions
+
+    def _evaluate_rows(self, rows, levels, ts):
+        """Vectorized check of rows: thresholds, deadband, trend and dwell (lock held)"""
+        known = ~np.isnan(levels)
+        rows, levels, ts = rows[known], levels[known], ts[known]
+
+        # Only readings newer than the last one go into the trend
+        last_ts = self._ts[rows]
+        newer = np.flatnonzero(np.isnan(last_ts) | (ts > last_ts))
+        for i in newer.tolist():
+            self.trends.add(int(rows[i]), float(ts[i]), float(levels[i]))
+        self._level[rows] = levels
+        self._ts[rows] = ts
+
+        warning, critical = self._warning[rows], self._critical[rows]
+        current = self._state[rows]
+        # Go up at a threshold, come down only below threshold - deadband
+        up = (levels >= warning).astype(np.int8) + (levels >= critical)
+        down = ((levels >= warning - self.deadband).astype(np.int8)
+                + (levels >= critical - self.deadband))
+        target = np.where(up > current, up, np.where(down < current, down, current))
+
+        rising = np.zeros(len(rows), dtype=bool)
+        forecasting = np.zeros(len(rows), dtype=bool)
+        if (self.rise_rate > 0 or self.forecast > 0) and len(rows):
+            slope = self._slopes(rows)
+            if self.rise_rate > 0:
+                limit = np.where(self._rising[rows], self.rise_rate * self.RISE_RELEASE, self.rise_rate)
+                rising = slope * 3600.0 >= limit
+            if self.forecast > 0:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    eta = (critical - levels) / slope
+                horizon = np.where(self._forecasting[rows], self.forecast * self.FORECAST_RELEASE,
+                                   self.forecast)
+                forecasting = (slope > 0) & (levels < critical) & (eta <= horizon)
+            target = np.maximum(target, (rising | forecasting).astype(np.int8))
+        self._rising[rows] = rising
+        self._forecasting[rows] = forecasting
+
+        if self.dwell > 0:
+            # A new state starts a timer; it is taken once it has lasted dwell seconds
+            pending, since = self._pending[rows], self._pending_since[rows]
+            changing = target != current
+            restart = changing & (target != pending)
+            since = np.where(restart, ts, since)
+            pending = np.where(changing, target, -1).astype(np.int8)
+            done = changing & (ts - since >= self.dwell)
+            new_state = np.where(done, target, current).astype(np.int8)
+            pending[done] = -1
+            self._pending[rows] = pending
+            self._pending_since[rows] = np.where(pending >= 0, since, np.nan)
+        else:
+            new_state = target.astype(np.int8)
+            self._pending[rows] = -1
+
+        self._state[rows] = new_state
+        changed = np.flatnonzero(new_state != current)
+        # A change without a new reading (new thresholds) happens now
+        when = np.full(len(rows), time.time())
+        when[newer] = ts[newer]
+        return [AlarmTransition(self._ids[rows[i]], STATES[current[i]], STATES[new_state[i]],
+                                float(levels[i]), float(when[i]),
+                                self._cause(new_state[i] > max(up[i], current[i]),
+                                            rising[i], forecasting[i]))
+                for i in changed.tolist()]
+
+    @staticmethod
+    def _cause(early, rising, forecasting):
+        if early and rising:
+            return RISE
+        if early and forecasting:
+            return FORECAST
+        return LEVEL
+
+    def _slopes(self, rows):
+        """Trend of rows in level per second; NaN until the readings span half a window (lock held)"""
+        slope = self.trends.slopes(rows)
+        slope[self.trends.spans(rows) < self.trends.window / 2] = np.nan
+        return slope
+
+    def _recent_readings(self, db, sensor_ids, times):
+        """
+        (timestamps, levels) per sensor over the trend window up to its
+        last reading, for sensors seen for the first time. Later readings
+        come from the change events; history is not read again.
+        """
+        readings = {}
+        for sensor_id, ts in zip(sensor_ids, times):
+            if ts is None:
+                continue
+            try:
+                stamps, levels, _ = db.get_history_arrays(sensor_id, ts - self.trends.window)
+            except Exception as e:
+                print(f"Error reading recent levels of {sensor_id}: {e}")
+                continue
+            # Copies: the arrays may be views into the database's columns
+            readings[sensor_id] = (np.array(stamps, dtype=np.float64), np.array(levels, dtype=np.float64))
+        return readings
+
+    def _reading_time(self, sensor_id, last_updated):
+        """Epoch seconds of a sensor's last_updated, parsed once per value"""
+        stamp = self._stamps.get(sensor_id)
+        if stamp is None or stamp[0] != last_updated:
+            try:
+                stamp = (last_updated, to_epoch(last_updated))
+            except ValueError as e:
+                print(f"Error reading last_updated of {sensor_id}: {e}")
+                stamp = (last_updated, None)
+            self._stamps[sensor_id] = stamp
+        return stamp[1]
+
+    def add_readings(self, readings):
+        """
+        Evaluate new readings, {sensor_id: [(ts, level), ...]} with ts in
+        epoch seconds. Each reading newer than a sensor's last evaluated
+        one goes into its trend, and the newest is evaluated. Returns the
+        transitions, which are also published.
+        """
+        sensor_ids = list(readings)
+        levels = np.full(len(sensor_ids), np.nan)
+        times = np.full(len(sensor_ids), np.nan)
+        with self._lock:
+            rows = self._row_numbers(sensor_ids)
+            for i, sensor_id in enumerate(sensor_ids):
+                row = int(rows[i])
+                last = self._ts[row]
+                for t, y in sorted(readings[sensor_id]):
+                    if y is None or y != y or t <= last:  # NaN levels and older readings are skipped
+                        continue
+                    if times[i] == times[i]:
+                        # _evaluate_rows adds the newest reading itself
+                        self.trends.add(row, float(times[i]), float(levels[i]))
+                    times[i], levels[i] = t, y
+            transitions = self._evaluate_rows(rows, levels, times)
+        self.transitions.publish(transitions)
+        return transitions
+
+    def apply_events(self, db, events):
+        """
+        Follow a list of committed ChangeEvents of db. Readings carried by
+        READINGS_ADDED events are evaluated without reading the database;
+        the settings and sensor config are only read again (by sync())
+        after SETTINGS_CHANGED or SENSOR_CHANGED, or when an event does not
+        carry its readings. Returns the transitions.
+        """
+        readings = {}
+        resync = False
+        for event in events:
+            if event.kind == READINGS_ADDED and event.readings is not None:
+                readings.setdefault(event.sensor_id, []).extend(event.readings)
+            elif event.kind in (READINGS_ADDED, SETTINGS_CHANGED, SENSOR_CHANGED):
+                resync = True
+        transitions = self.add_readings(readings) if readings else []
+        if resync:
+            transitions = transitions + self.sync(db)
+        return transitions
+
+    def _configure(self, snapshot):
+        """Thresholds and alarm filtering from a db.get_snapshot() result"""
+        settings = snapshot["settings"] or {}
+        sensors = snapshot["sensors"]
+        sensor_ids = list(sensors)
+        warning = settings.get("warning_threshold", self.DEFAULT_WARNING)
+        critical = settings.get("critical_threshold", self.DEFAULT_CRITICAL)
+        self.set_filtering(deadband=settings.get("alarm_deadband", self.DEFAULT_DEADBAND),
+                           dwell=settings.get("alarm_dwell", self.DEFAULT_DWELL),
+                           rise_rate=settings.get("rise_rate_alarm", self.DEFAULT_RISE_RATE),
+                           rise_window=settings.get("rise_window", self.DEFAULT_RISE_WINDOW),
+                           forecast=settings.get("critical_forecast", self.DEFAULT_FORECAST / 60) * 60)
+        with self._lock:
+            self.warning_threshold = warning
+            self.critical_threshold = critical
+            rows = self._row_numbers(sensor_ids)
+            self._warning[rows] = [sensors[sensor_id].get("warning_threshold", warning)
+                                   for sensor_id in sensor_ids]
+            self._critical[rows] = [sensors[sensor_id].get("critical_threshold", critical)
+                                    for sensor_id in sensor_ids]
+
+    def sync(self, db, snapshot=None):
+        """
+        Evaluate every sensor of db with its current level, thresholds from
+        the settings and optional per-sensor warning_threshold and
+        critical_threshold config. The deadband, dwell, rate-of-rise and
+        forecast alarms follow the alarm_deadband, alarm_dwell,
+        rise_rate_alarm, rise_window and critical_forecast (minutes)
+        settings. A sensor seen for the first time gets the readings of
+        the last trend window into its trend.
+        snapshot is a db.get_snapshot() result if the caller already has one.
+        """
+        if snapshot is None:
+            snapshot = db.get_snapshot()
+        sensors = snapshot["sensors"]
+        sensor_ids = list(sensors)
+        now = time.time()
+        with self._lock:
+            times = [self._reading_time(sensor_id, sensors[sensor_id].get("last_updated"))
+                     for sensor_id in sensor_ids]
+            new = [(sensor_id, ts) for sensor_id, ts in zip(sensor_ids, times)
+                   if sensor_id not in self._rows]
+        # Read outside the lock; the database may be busy on another thread
+        history = self._recent_readings(db, [sensor_id for sensor_id, _ in new],
+                                        [ts for _, ts in new])
+        self._configure(snapshot)
+        with self._lock:
+            for sensor_id, (stamps, water) in history.items():
+                row = self._row_numbers([sensor_id])[0]
+                for t, y in zip(stamps.tolist(), water.tolist()):
+                    if y == y:  # Skip NaN levels
+                        self.trends.add(int(row), t, y)
+            rows = self._row_numbers(sensor_ids)
+            levels = np.array([sensors[sensor_id].get("current_water_level") for sensor_id in sensor_ids],
+                              dtype=np.float64)
+            ts = np.array([now if t is None else t for t in times], dtype=np.float64)
+            # last_updated has whole seconds; a reading the events already
+            # brought keeps its exact time
+            known = ts <= self._ts[rows]
+            levels[known] = self._level[rows][known]
+            ts[known] = self._ts[rows][known]
+            transitions = self._evaluate_rows(rows, levels, ts)
+        self.transitions.publish(transitions)
+        return transitions
+
+    def state(self, sensor_id):
+        """(state, level) of a sensor; (None, None) before its first level"""
+        with self._lock:
+            row = self._rows.get(sensor_id)
+            if row is None or np.isnan(self._level[row]):
+                return None, None
+            return STATES[self._state[row]], float(self._level[row])
+
+    def states(self):
+        """{sensor_id: (state, level)} of every sensor that has a level"""
+        with self._lock:
+            return {sensor_id: (STATES[self._state[row]], float(self._level[row]))
+                    for sensor_id, row in self._rows.items() if not np.isnan(self._level[row])}
+
+    def reason(self, sensor_id):
+        """RISE or FORECAST while a sensor is in such an alarm, otherwise LEVEL"""
+        with self._lock:
+            row = self._rows.get(sensor_id)
+            if row is None:
+                return LEVEL
+            return self._cause(True, self._rising[row], self._forecasting[row])
+
+    def trend(self, sensor_id):
+        """Level change of a sensor in %/h over the rise window; None without enough readings"""
+        with self._lock:
+            row = self._rows.get(sensor_id)
+            if row is None:
+                return None
+            rate = self._slopes([row])[0] * 3600.0
+            return None if np.isnan(rate) else float(rate)
+
+    def time_to_threshold(self, sensor_id, threshold=None, now=None):
+        """
+        Seconds from now (default time.time()) until the sensor's level is
+        expected to reach threshold (by default its critical threshold),
+        following the trend from its last reading. 0 if the level is
+        already there; None if it is not rising or the trend is unknown.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._rows.get(sensor_id)
+            if row is None or np.isnan(self._level[row]):
+                return None
+            if threshold is None:
+                threshold = self._critical[row]
+            level = self._level[row]
+            if level >= threshold:
+                return 0.0
+            slope = self._slopes([row])[0]
+            if not slope > 0:
+                return None
+            return float(max(0.0, self._ts[row] + (threshold - level) / slope - now))
+
+    def thresholds(self, sensor_id):
+        """(warning, critical) that apply to a sensor"""
+        with self._lock:
+            row = self._rows.get(sensor_id)
+            if row is None:
+                return self.warning_threshold, self.critical_threshold
+            return float(self._warning[row]), float(self._critical[row])
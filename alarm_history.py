@@ -0,0 +1,259 @@
+# alarm_history.py
+import time
+from datetime import datetime
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                             QComboBox, QTableView, QHeaderView, QAbstractItemView)
+from PyQt5.QtGui import QPalette, QColor, QFont
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from db_events import DatabaseEvents
+from change_events import READINGS_ADDED, SETTINGS_CHANGED
+from alarm_engine import WARNING, CRITICAL
+from alarm_journal import journal_for_database
+
+
+class AlarmHistoryModel(QAbstractTableModel):
+    """
+    Alarm journal events as table rows, newest first. Rows are loaded a
+    page at a time through canFetchMore()/fetchMore() as the view scrolls,
+    so a long journal is never read as a whole.
+    """
+
+    PAGE = 200
+    COLUMNS = ["Time", "Sensor", "Event", "State", "Level", "Message"]
+    STATE_COLORS = {WARNING: QColor('#FFE0B2'), CRITICAL: QColor('#FFCDD2')}
+
+    def __init__(self, journal, parent=None):
+        super().__init__(parent)
+        self.journal = journal
+        self.sensor_ids = None  # Filters, None means all
+        self.start = None
+        self._events = []
+        self._more = True
+        self.total = 0          # Events matching the filters in the journal
+
+    def set_filter(self, sensor_ids=None, start=None):
+        """Show the events of sensor_ids (all if None) from start (epoch seconds) on"""
+        self.sensor_ids = sensor_ids
+        self.start = start
+        self.reload()
+
+    def reload(self):
+        """Drop the loaded rows; the view fetches the first page again"""
+        self.beginResetModel()
+        self._events = []
+        self._more = True
+        self.total = self.journal.count(self.sensor_ids, self.start)
+        self.endResetModel()
+
+    def refresh(self):
+        """Add events recorded since the rows were loaded at the top"""
+        total = self.journal.count(self.sensor_ids, self.start)
+        if total == self.total:
+            return
+        if not self._events:
+            self.reload()
+            return
+        newest = self._events[0]
+        newer = [event for event in self.journal.query(self.sensor_ids, start=newest.ts,
+                                                       limit=total - self.total + self.PAGE)
+                 if (event.ts, event.event_id) > (newest.ts, newest.event_id)]
+        if len(newer) != total - self.total:
+            # Events were recorded with older times; start over
+            self.reload()
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(newer) - 1)
+        self._events[:0] = newer
+        self.total = total
+        self.endInsertRows()
+
+    def event(self, row):
+        return self._events[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._events)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._more:
+            return
+        before = self._events[-1] if self._events else None
+        try:
+            page = self.journal.query(self.sensor_ids, start=self.start, before=before, limit=self.PAGE)
+        except Exception as e:
+            print(f"Error loading alarm history: {e}")
+            page = []
+        self._more = len(page) == self.PAGE
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self._events), len(self._events) + len(page) - 1)
+            self._events.extend(page)
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        event = self._events[index.row()]
+        if role == Qt.DisplayRole:
+            column = index.column()
+            if column == 0:
+                return datetime.fromtimestamp(event.ts).strftime("%Y-%m-%d %H:%M:%S")
+            if column == 1:
+                return event.sensor_id
+            if column == 2:
+                return event.kind.capitalize()
+            if column == 3:
+                return event.state or ""
+            if column == 4:
+                return "" if event.level is None else f"{event.level:.1f}%"
+            return event.message
+        if role == Qt.BackgroundRole:
+            return self.STATE_COLORS.get(event.state)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+
+class AlarmHistoryScreen(QWidget):
+    """
+    The alarm journal as a table with sensor and time filters. Operators
+    acknowledge the selected sensor's alarm from here; the acknowledgement
+    is journaled as an event of its own.
+    """
+
+    RANGES = [("All", None), ("Day", 1), ("Week", 7), ("Month", 30), ("Year", 365)]
+
+    def __init__(self, dashboard_window, db):
+        super().__init__()
+        self.dashboard_window = dashboard_window
+        self.db = db
+        self.journal = journal_for_database(db)
+
+        self.setWindowTitle("Alarm History")
+        # Deleted on close, which also ends its change subscription
+        self.setAttribute(Qt.WA_DeleteOnClose)
+
+        # Set background color
+        palette = self.palette()
+        palette.setColor(QPalette.Window, QColor('#00486F'))
+        self.setPalette(palette)
+        self.setAutoFillBackground(True)
+        self.setStyleSheet("QLabel { color: white; }")
+
+        main_layout = QVBoxLayout(self)
+        main_layout.setSpacing(15)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+
+        button_style = """
+            QPushButton {
+                background-color: #A8D3EF; color: black;
+                border: 1px solid #ccc; border-radius: 5px;
+                font-weight: bold;
+                font-size: 16px;
+            }
+            QPushButton:hover { background-color: #f0f0f0; }
+            QPushButton:disabled { color: #777; }
+        """
+        top_bar_layout = QHBoxLayout()
+        back_btn = QPushButton("← Back")
+        back_btn.setFixedSize(100, 40)
+        back_btn.setStyleSheet(button_style)
+        back_btn.clicked.connect(self.go_back)
+        top_bar_layout.addWidget(back_btn, alignment=Qt.AlignLeft)
+        top_bar_layout.addStretch()
+
+        combo_style = "QComboBox { font-size: 16px; padding: 5px; background-color: white; }"
+        self.sensor_combo = QComboBox()
+        self.sensor_combo.setStyleSheet(combo_style)
+        self.sensor_combo.addItem("All sensors", None)
+        for sensor_id in self.db.get_sensors():
+            self.sensor_combo.addItem(sensor_id, sensor_id)
+        self.sensor_combo.currentIndexChanged.connect(self.apply_filter)
+        top_bar_layout.addWidget(self.sensor_combo)
+
+        self.range_combo = QComboBox()
+        self.range_combo.setStyleSheet(combo_style)
+        for name, days in self.RANGES:
+            self.range_combo.addItem(name, days)
+        self.range_combo.currentIndexChanged.connect(self.apply_filter)
+        top_bar_layout.addWidget(self.range_combo)
+
+        self.ack_btn = QPushButton("Acknowledge")
+        self.ack_btn.setFixedSize(160, 40)
+        self.ack_btn.setStyleSheet(button_style)
+        self.ack_btn.setEnabled(False)
+        self.ack_btn.clicked.connect(self.acknowledge_selected)
+        top_bar_layout.addWidget(self.ack_btn)
+        main_layout.addLayout(top_bar_layout)
+
+        title = QLabel("Alarm History")
+        title.setFont(QFont("Arial", 20, QFont.Bold))
+        title.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(title)
+
+        self.count_label = QLabel()
+        self.count_label.setFont(QFont("Arial", 12))
+        main_layout.addWidget(self.count_label)
+
+        self.model = AlarmHistoryModel(self.journal, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        for column, width in enumerate((170, 100, 110, 90, 80)):
+            self.table.setColumnWidth(column, width)
+        self.table.setStyleSheet("QTableView { background-color: white; font-size: 14px; }")
+        self.table.selectionModel().selectionChanged.connect(self.update_ack_button)
+        self.model.modelReset.connect(self.update_count)
+        self.model.rowsInserted.connect(self.update_count)
+        main_layout.addWidget(self.table)
+
+        self.apply_filter()
+
+        # New readings and threshold changes may have journaled new events
+        DatabaseEvents.for_database(self.db).subscribe(
+            lambda events: self.model.refresh(), kinds=[READINGS_ADDED, SETTINGS_CHANGED], owner=self)
+
+    def apply_filter(self):
+        sensor_id = self.sensor_combo.currentData()
+        days = self.range_combo.currentData()
+        self.model.set_filter(None if sensor_id is None else [sensor_id],
+                              None if days is None else time.time() - days * 86400)
+        self.update_ack_button()
+
+    def update_count(self):
+        self.count_label.setText(f"{self.model.total} events")
+
+    def selected_event(self):
+        rows = self.table.selectionModel().selectedRows()
+        return self.model.event(rows[0].row()) if rows else None
+
+    def update_ack_button(self):
+        event = self.selected_event()
+        self.ack_btn.setEnabled(event is not None and self.journal.unacknowledged(event.sensor_id))
+
+    def acknowledge_selected(self):
+        """Journal an acknowledgement of the selected row's sensor"""
+        event = self.selected_event()
+        if event is None:
+            return
+        try:
+            self.journal.acknowledge(event.sensor_id)
+        except Exception as e:
+            print(f"Error acknowledging alarm of {event.sensor_id}: {e}")
+        self.model.refresh()
+        self.update_ack_button()
+
+    def go_back(self):
+        """Returns to the dashboard view"""
+        self.dashboard_window.showFullScreen()
+        self.close()
@@ -0,0 +1,394 @@
+# alarm_journal.py
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import namedtuple
+import numpy as np
+from alarm_engine import AlarmEngine, NORMAL, WARNING, CRITICAL, RISE, FORECAST
+from background_writer import BackgroundWriter
+from database_connector import DatabaseConnector
+
+# Event kinds
+TRIGGER = "trigger"          # A sensor entered or changed alarm state
+CLEAR = "clear"              # A sensor went back to Normal
+ACKNOWLEDGE = "acknowledge"  # An operator acknowledged a sensor's alarm
+KINDS = (TRIGGER, CLEAR, ACKNOWLEDGE)
+
+# One journal entry. ts is epoch seconds; state is the sensor's alarm state
+# after the event and level its water level (None if unknown)
+AlarmEvent = namedtuple("AlarmEvent", ["event_id", "ts", "sensor_id", "kind", "state", "level", "message"])
+
+# Journals of open databases
+_journals = weakref.WeakKeyDictionary()
+
+
+def journal_for_database(db=None):
+    """
+    The alarm journal of db (by default the shared DatabaseConnector
+    database), opened with db.open_alarm_journal() and recording the
+    transitions of the database's AlarmEngine from then on.
+    """
+    if db is None:
+        db = DatabaseConnector.get_instance()
+    journal = _journals.get(db)
+    if journal is None:
+        journal = db.open_alarm_journal()
+        engine = AlarmEngine.for_database(db)
+        engine.transitions.subscribe(journal.record)
+        # States the engine reached before the journal was listening
+        journal.record_states(engine.states())
+        _journals[db] = journal
+    return journal
+
+
+def transition_message(transition):
+    """Journal text for an AlarmTransition"""
+    if transition.new_state == NORMAL:
+        return f"Water level back to normal: {transition.level:.2f}%"
+    if transition.reason == RISE:
+        return f"Water level rising fast: {transition.level:.2f}%"
+    if transition.reason == FORECAST:
+        return f"Critical level expected soon: {transition.level:.2f}%"
+    if transition.new_state == CRITICAL:
+        return f"Critical water level: {transition.level:.2f}%"
+    return f"Warning water level: {transition.level:.2f}%"
+
+
+class _Journal:
+    """Recording shared by the journal backends; subclasses store the events"""
+
+    def __init__(self):
+        self._newest = {}  # sensor_id -> (kind, state) of its newest event
+
+    def append(self, sensor_id, kind, state=None, level=None, message="", ts=None):
+        """Add an event and return it as an AlarmEvent"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown alarm event kind: {kind}")
+        ts = time.time() if ts is None else float(ts)
+        level = None if level is None else float(level)
+        event = self._store(ts, str(sensor_id), kind, state, level, str(message))
+        self._newest[event.sensor_id] = (kind, state)
+        return event
+
+    def record(self, transitions):
+        """Append a TRIGGER or CLEAR event per AlarmTransition (engine listener)"""
+        for transition in transitions:
+            if self.last_state(transition.sensor_id) == transition.new_state:
+                continue
+            kind = CLEAR if transition.new_state == NORMAL else TRIGGER
+            try:
+                self.append(transition.sensor_id, kind, transition.new_state, transition.level,
+                            transition_message(transition), transition.ts)
+            except Exception as e:
+                print(f"Error recording alarm event for {transition.sensor_id}: {e}")
+
+    def record_states(self, states):
+        """Record {sensor_id: (state, level)} where it differs from the journal"""
+        for sensor_id, (state, level) in states.items():
+            if self.last_state(sensor_id) != state:
+                kind = CLEAR if state == NORMAL else TRIGGER
+                self.append(sensor_id, kind, state, level, f"{state} at startup: {level:.2f}%")
+
+    def acknowledge(self, sensor_id, message="Acknowledged"):
+        """Record that the operator acknowledged sensor_id's current alarm"""
+        return self.append(sensor_id, ACKNOWLEDGE, self.last_state(sensor_id), message=message)
+
+    def last_state(self, sensor_id):
+        """Alarm state of a sensor's newest event (Normal without events)"""
+        return self._newest.get(sensor_id, (None, NORMAL))[1] or NORMAL
+
+    def unacknowledged(self, sensor_id):
+        """True while a sensor is in alarm and nobody has acknowledged it since"""
+        kind, state = self._newest.get(sensor_id, (None, NORMAL))
+        return kind != ACKNOWLEDGE and state in (WARNING, CRITICAL)
+
+
+class AlarmJournal(_Journal):
+    """
+    Append-only alarm event log in a text file, one tab-separated line per
+    event. The event_id is the line's byte offset.
+
+    Like MockDatabase, appends are queued and written (and fsynced) by a
+    BackgroundWriter thread, so the thread that records an alarm never
+    waits for the disk. The index is updated at once and queries take
+    lines that are not written yet from memory; flush() waits for them.
+
+    The file is read once when opened, to build an in-memory index of
+    NumPy arrays (time, sensor code, offset) sorted by time. Queries find
+    their time range by binary search and filter sensors vectorized over
+    that range; only the lines of the requested page are read from disk,
+    so a long history is never loaded as a whole.
+    """
+
+    FILENAME = "alarm_journal.log"
+    SYNC = True  # fsync each write (survives power loss)
+    FLUSH_INTERVAL = 0.2  # Minimum seconds between background writes
+    SCAN_CHUNK = 4096  # Index rows filtered per step while paging by sensor
+
+    def __init__(self, filename=None):
+        super().__init__()
+        self.filename = filename or self.FILENAME
+        self._lock = threading.Lock()
+        self._size = 0
+        self._ts = np.empty(1024)
+        self._codes = np.empty(1024, dtype=np.int32)  # Index into self._sensors
+        self._offsets = np.empty(1024, dtype=np.int64)
+        self._sensors = []
+        self._sensor_codes = {}  # sensor_id -> code
+        self._unwritten = {}  # offset -> line appended but not on disk yet
+
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._file = open(self.filename, "ab")  # Only touched by the writer thread
+        self._reader = open(self.filename, "rb")
+        self._end = os.path.getsize(self.filename)  # Offset of the next event
+        self._writer = BackgroundWriter(self._flush_pending, self.FLUSH_INTERVAL, name="alarm-journal")
+        atexit.register(self.close)
+
+    def flush(self):
+        """Write all events appended so far to disk and wait for it"""
+        return self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                self._reader.close()
+
+    @staticmethod
+    def _clean(text):
+        return str(text).replace("\t", " ").replace("\n", " ").replace("\r", " ")
+
+    def _load(self):
+        """Index the existing file; cut off a line torn by a crash"""
+        if not os.path.exists(self.filename):
+            return
+        offset = 0
+        with open(self.filename, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    event = self._parse(offset, line)
+                except (ValueError, IndexError) as e:
+                    print(f"Error reading alarm journal line at {offset}: {e}")
+                else:
+                    self._index(event.ts, event.sensor_id, offset)
+                    self._newest[event.sensor_id] = (event.kind, event.state)
+                offset += len(line)
+        if offset < os.path.getsize(self.filename):
+            with open(self.filename, "r+b") as f:
+                f.truncate(offset)
+
+    @staticmethod
+    def _parse(offset, line):
+        ts, sensor_id, kind, state, level, message = line.decode("utf-8").rstrip("\n").split("\t", 5)
+        return AlarmEvent(offset, float(ts), sensor_id, kind, state or None,
+                          float(level) if level else None, message)
+
+    def _index(self, ts, sensor_id, offset):
+        """Add an event to the index, keeping it sorted by time (lock held)"""
+        code = self._sensor_codes.get(sensor_id)
+        if code is None:
+            code = self._sensor_codes[sensor_id] = len(self._sensors)
+            self._sensors.append(sensor_id)
+        if self._size == len(self._ts):
+            self._ts = np.resize(self._ts, 2 * self._size)
+            self._codes = np.resize(self._codes, 2 * self._size)
+            self._offsets = np.resize(self._offsets, 2 * self._size)
+        n = self._size
+        # Events normally arrive in time order; an older one is inserted
+        i = n if n == 0 or ts >= self._ts[n - 1] else int(np.searchsorted(self._ts[:n], ts, side="right"))
+        for column in (self._ts, self._codes, self._offsets):
+            column[i + 1:n + 1] = column[i:n]
+        self._ts[i], self._codes[i], self._offsets[i] = ts, code, offset
+        self._size = n + 1
+
+    def _store(self, ts, sensor_id, kind, state, level, message):
+        fields = (repr(ts), self._clean(sensor_id), kind, state or "",
+                  "" if level is None else repr(level), self._clean(message))
+        line = ("\t".join(fields) + "\n").encode("utf-8")
+        with self._lock:
+            offset = self._end
+            self._end += len(line)
+            self._unwritten[offset] = line
+            self._index(ts, self._clean(sensor_id), offset)
+        self._writer.mark_dirty()
+        return self._parse(offset, line)
+
+    def _flush_pending(self):
+        """Append queued lines to the file (runs on the writer thread)"""
+        with self._lock:
+            lines = sorted(self._unwritten.items())
+        if not lines:
+            return True
+        try:
+            self._file.write(b"".join(line for _, line in lines))
+            self._file.flush()
+            if self.SYNC:
+                os.fsync(self._file.fileno())
+        except Exception as e:
+            print(f"Error writing alarm journal: {e}")
+            # Cut off a partial write so the retry appends whole lines
+            try:
+                self._file.close()
+                os.truncate(self.filename, lines[0][0])
+                self._file = open(self.filename, "ab")
+            except Exception as e:
+                print(f"Error truncating alarm journal: {e}")
+            return False
+        with self._lock:
+            for offset, _ in lines:
+                del self._unwritten[offset]
+        return True
+
+    def _range(self, start, end, before):
+        """Index rows from start (inclusive) to end and before (exclusive) (lock held)"""
+        ts = self._ts[:self._size]
+        low = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        high = self._size if end is None else int(np.searchsorted(ts, end, side="left"))
+        if before is not None:
+            # Rows with the same time are in file order
+            first = int(np.searchsorted(ts, before.ts, side="left"))
+            last = int(np.searchsorted(ts, before.ts, side="right"))
+            same = int(np.count_nonzero(self._offsets[first:last] < before.event_id))
+            high = min(high, first + same)
+        return low, max(low, high)
+
+    def _wanted(self, sensor_ids):
+        return np.array([self._sensor_codes[sensor_id] for sensor_id in sensor_ids
+                         if sensor_id in self._sensor_codes], dtype=np.int32)
+
+    def count(self, sensor_ids=None, start=None, end=None):
+        """Number of events of sensor_ids (all if None) with start <= ts < end"""
+        with self._lock:
+            low, high = self._range(start, end, None)
+            if sensor_ids is None:
+                return high - low
+            return int(np.count_nonzero(np.isin(self._codes[low:high], self._wanted(sensor_ids))))
+
+    def query(self, sensor_ids=None, start=None, end=None, before=None, limit=100):
+        """
+        Up to limit events of sensor_ids (all if None) with start <= ts < end,
+        newest first. Pass the last event of a page as before to get the next.
+        """
+        with self._lock:
+            low, high = self._range(start, end, before)
+            if sensor_ids is None:
+                offsets = self._offsets[max(low, high - limit):high][::-1]
+            else:
+                # Filter backwards from the newest row until the page is full
+                wanted = self._wanted(sensor_ids)
+                found = []
+                count = 0
+                while high > low and count < limit:
+                    chunk_low = max(low, high - self.SCAN_CHUNK)
+                    rows = np.flatnonzero(np.isin(self._codes[chunk_low:high], wanted))[::-1]
+                    found.append(self._offsets[chunk_low:high][rows[:limit - count]])
+                    count += len(found[-1])
+                    high = chunk_low
+                offsets = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+            events = []
+            for offset in offsets.tolist():
+                line = self._unwritten.get(offset)
+                if line is None:
+                    self._reader.seek(offset)
+                    line = self._reader.readline()
+                events.append(self._parse(offset, line))
+        return events
+
+
+class SQLiteAlarmJournal(_Journal):
+    """
+    Alarm event log in an alarm_events table of a SQLite database file,
+    opened on its own connection. Rows are only ever inserted; indexes on
+    (ts) and (sensor_id, ts) make time range and per-sensor queries index
+    seeks, and pages continue after the previous page's last event.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS alarm_events (
+            event_id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            sensor_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            state TEXT,
+            level REAL,
+            message TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS alarm_events_ts ON alarm_events (ts, event_id);
+        CREATE INDEX IF NOT EXISTS alarm_events_sensor ON alarm_events (sensor_id, ts, event_id);
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # As in SQLiteDatabase: commits do not wait for an fsync
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+        with self._lock:
+            # Each sensor's newest event, by insertion like the file journal
+            rows = self._conn.execute(
+                "SELECT sensor_id, kind, state FROM alarm_events "
+                "WHERE event_id IN (SELECT MAX(event_id) FROM alarm_events GROUP BY sensor_id)").fetchall()
+        self._newest.update((sensor_id, (kind, state)) for sensor_id, kind, state in rows)
+        atexit.register(self.close)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _store(self, ts, sensor_id, kind, state, level, message):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO alarm_events (ts, sensor_id, kind, state, level, message) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (ts, sensor_id, kind, state, level, message))
+        return AlarmEvent(cursor.lastrowid, ts, sensor_id, kind, state, level, message)
+
+    @staticmethod
+    def _where(sensor_ids, start, end, before):
+        """WHERE clause and parameters for the filters"""
+        clauses, params = [], []
+        if sensor_ids is not None:
+            sensor_ids = list(sensor_ids)
+            clauses.append(f"sensor_id IN ({', '.join('?' * len(sensor_ids))})")
+            params.extend(sensor_ids)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        if before is not None:
+            clauses.append("(ts, event_id) < (?, ?)")
+            params.extend((before.ts, before.event_id))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, sensor_ids=None, start=None, end=None):
+        """Number of events of sensor_ids (all if None) with start <= ts < end"""
+        where, params = self._where(sensor_ids, start, end, None)
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM alarm_events" + where, params).fetchone()[0]
+
+    def query(self, sensor_ids=None, start=None, end=None, before=None, limit=100):
+        """
+        Up to limit events of sensor_ids (all if None) with start <= ts < end,
+        newest first. Pass the last event of a page as before to get the next.
+        """
+        where, params = self._where(sensor_ids, start, end, before)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT event_id, ts, sensor_id, kind, state, level, message FROM alarm_events"
+                + where + " ORDER BY ts DESC, event_id DESC LIMIT ?", params + [limit]).fetchall()
+        return [AlarmEvent(*row) for row in rows]
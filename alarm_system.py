@@ -4,22 +4,37 @@ from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QFrame, QMainWindow, QSlider, QCheckBox)
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer
+from ui_styles import install_style, set_style_state, set_text, format_duration
+from alarm_engine import AlarmEngine, NORMAL, WARNING, CRITICAL, RISE, FORECAST
 
 class AlarmSystem(QWidget):
     """
     Displays alarm status for water levels with color-coded indicators.
     Changes from green (Normal) to orange (Warning) to red (Critical).
+
+    The state comes from an AlarmEngine: the database's engine when one
+    is passed (show_sensor() then just renders it), otherwise a private
+    engine fed by check_water_level().
+    """
+
+    # Installed once in the application stylesheet. The state property on
+    # the status frame selects its color, so changing state re-polishes
+    # only that frame and never re-parses a sheet
+    STYLE = """
+        AlarmSystem QFrame#alarmFrame { background-color: green; border-radius: 8px; }
+        AlarmSystem QFrame#alarmFrame[state="Warning"] { background-color: orange; }
+        AlarmSystem QFrame#alarmFrame[state="Critical"] { background-color: red; }
+        AlarmSystem QLabel#alarmStatus { color: white; }
+        AlarmSystem QLabel#alarmMessage { font-size: 10pt; }
     """
 
     # Signals for other components to react to alarm state changes
     alarm_triggered = pyqtSignal(str, str)  # (sensor_id, message)
     alarm_cleared = pyqtSignal(str)         # (sensor_id)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, engine=None):
         super().__init__(parent)
-        # Default thresholds (configurable)
-        self.warning_threshold = 75
-        self.critical_threshold = 85
+        self.engine = engine if engine is not None else AlarmEngine()
         self.alarm_state = "Normal"
         
         self.init_ui()
@@ -33,34 +48,42 @@ class AlarmSystem(QWidget):
         """Creates the alarm status display"""
         layout = QVBoxLayout(self)
         layout.setContentsMargins(5, 0, 5, 5)
+        install_style(self.STYLE)
 
         # Status indicator with color background
         self.status_frame = QFrame()
+        self.status_frame.setObjectName("alarmFrame")
+        self.status_frame.setProperty("state", "Normal")
         self.status_frame.setFrameShape(QFrame.StyledPanel)
         self.status_frame.setLineWidth(0)
-        self.status_frame.setStyleSheet("background-color: green; border-radius: 8px;")
         self.status_frame.setMinimumHeight(40)
 
         # Status text
         status_layout = QVBoxLayout(self.status_frame)
         self.status_label = QLabel("Normal")
+        self.status_label.setObjectName("alarmStatus")
         self.status_label.setFont(QFont("Arial", 14, QFont.Bold))
         self.status_label.setAlignment(Qt.AlignCenter)
-        self.status_label.setStyleSheet("color: white;")
         status_layout.addWidget(self.status_label)
 
         # Message below status indicator
         self.message_label = QLabel("Water level within safe limits")
+        self.message_label.setObjectName("alarmMessage")
         self.message_label.setAlignment(Qt.AlignCenter)
-        self.message_label.setStyleSheet("font-size: 10pt;")
 
         layout.addWidget(self.status_frame)
         layout.addWidget(self.message_label)
 
-    def check_water_level(self, sensor_id, water_level):
-        """Updates alarm state based on water level"""
-        old_state = self.alarm_state
+    @property
+    def warning_threshold(self):
+        return self.engine.warning_threshold
+
+    @property
+    def critical_threshold(self):
+        return self.engine.critical_threshold
 
+    def check_water_level(self, sensor_id, water_level):
+        """Evaluates a new water level with the engine and shows the result"""
         # Ensure water_level is treated as a float for comparison and formatting
         try:
             level = float(water_level)
@@ -70,47 +93,61 @@ class AlarmSystem(QWidget):
              print(f"Warning: Invalid water level data for {sensor_id}: {water_level}")
              return # Stop processing if data is invalid
 
-        if level >= self.critical_threshold:
-            # --- FORMATTING APPLIED HERE ---
+        self.engine.evaluate([sensor_id], [level])
+        self.show_sensor(sensor_id)
+
+    def show_sensor(self, sensor_id):
+        """Show the engine's state for a sensor"""
+        old_state = self.alarm_state
+        state, level = self.engine.state(sensor_id)
+
+        if state == CRITICAL:
             self.set_critical_alarm(f"CRITICAL: Water level at {level:.2f}%")
-            if old_state != "Critical":
+            if old_state != CRITICAL:
                 self.alarm_triggered.emit(sensor_id, f"Critical water level: {level:.2f}%")
-        elif level >= self.warning_threshold:
-            # --- FORMATTING APPLIED HERE ---
+        elif state == WARNING and self.engine.reason(sensor_id) == RISE:
+            rate = self.engine.trend(sensor_id) or 0.0
+            self.set_warning_alarm(f"WARNING: Rising {rate:.1f}%/h (level {level:.2f}%)")
+            if old_state != WARNING:
+                self.alarm_triggered.emit(sensor_id, f"Water level rising {rate:.1f}%/h")
+        elif state == WARNING and self.engine.reason(sensor_id) == FORECAST:
+            eta = self.engine.time_to_threshold(sensor_id)
+            expected = "soon" if eta is None else f"in {format_duration(eta)}"
+            self.set_warning_alarm(f"WARNING: Critical level expected {expected} (level {level:.2f}%)")
+            if old_state != WARNING:
+                self.alarm_triggered.emit(sensor_id, f"Critical water level expected {expected}")
+        elif state == WARNING:
             self.set_warning_alarm(f"WARNING: Water level at {level:.2f}%")
-            if old_state != "Warning":
+            if old_state != WARNING:
                 self.alarm_triggered.emit(sensor_id, f"Warning water level: {level:.2f}%")
         else:
             # No need to display the level in the 'Normal' message typically
             self.clear_alarm("Water level within safe limits")
-            if old_state != "Normal":
+            if old_state != NORMAL:
                 self.alarm_cleared.emit(sensor_id)
 
     def set_warning_alarm(self, message):
         """Sets alarm to Warning state (orange)"""
-        self.alarm_state = "Warning"
-        self.status_frame.setStyleSheet("background-color: orange; border-radius: 8px;")
-        self.status_label.setText("Warning")
-        self.message_label.setText(message)
+        self._show_state("Warning", message)
 
     def set_critical_alarm(self, message):
         """Sets alarm to Critical state (red)"""
-        self.alarm_state = "Critical"
-        self.status_frame.setStyleSheet("background-color: red; border-radius: 8px;")
-        self.status_label.setText("Critical")
-        self.message_label.setText(message)
+        self._show_state("Critical", message)
 
     def clear_alarm(self, message="Normal operation"):
         """Sets alarm to Normal state (green)"""
-        self.alarm_state = "Normal"
-        self.status_frame.setStyleSheet("background-color: green; border-radius: 8px;")
-        self.status_label.setText("Normal")
-        self.message_label.setText(message)
+        self._show_state("Normal", message)
+
+    def _show_state(self, state, message):
+        """Restyle only on a real state change; update texts that differ"""
+        self.alarm_state = state
+        set_style_state(self.status_frame, "state", state)
+        set_text(self.status_label, state)
+        set_text(self.message_label, message)
 
     def set_thresholds(self, warning=75, critical=85):
-        """Updates warning and critical thresholds"""
-        self.warning_threshold = warning
-        self.critical_threshold = critical
+        """Updates warning and critical thresholds (of every sensor in the engine)"""
+        self.engine.set_thresholds(warning, critical)
 
     def enable_demo_mode(self, enabled=True):
         """Cycles through alarm states automatically for demonstration"""
@@ -0,0 +1,94 @@
+# background_writer.py
+import threading
+import time
+
+
+class BackgroundWriter:
+    """
+    Runs a flush callback on a dedicated thread whenever work has been
+    marked as pending. Marks that arrive while a write is waiting or running
+    are coalesced into the next call, and calls are spaced at least
+    `interval` seconds apart unless flush() asks for an immediate write.
+
+    The callback returns False to have the write retried after the interval.
+    Marks only count as done once a write covering them has succeeded.
+    """
+
+    def __init__(self, flush, interval=0.5, name="db-writer"):
+        self._flush_callback = flush
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._requested = 0   # Number of marks so far
+        self._done = 0        # Marks covered by a successful write
+        self._attempts = 0    # Writes finished, successful or not
+        self._failed = False  # The last write failed
+        self._urgent = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self):
+        """Schedule a write; returns immediately"""
+        with self._cond:
+            self._requested += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Write everything marked so far now and wait until it is done.
+        Returns False if that write failed (it is retried later) or the
+        timeout passed first.
+        """
+        with self._cond:
+            target = self._requested
+            if self._done >= target or not self._thread.is_alive():
+                return self._done >= target
+            self._urgent = True
+            self._cond.notify_all()
+            attempts = self._attempts
+            self._cond.wait_for(
+                lambda: (self._done >= target or not self._thread.is_alive()
+                         or (self._attempts > attempts and self._failed)), timeout)
+            return self._done >= target
+
+    def close(self):
+        """Flush pending work and stop the thread; returns whether everything was written"""
+        if self._closed:
+            return self._done >= self._requested
+        flushed = self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        return flushed
+
+    def _run(self):
+        last_write = 0.0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._requested > self._done or self._closed)
+                # A failing write is not retried after close
+                if self._closed and (self._requested <= self._done or self._failed):
+                    return
+
+                # Bound the write rate; more marks may be coalesced meanwhile
+                delay = last_write + self.interval - time.monotonic()
+                if delay > 0 and not self._urgent:
+                    self._cond.wait_for(lambda: self._urgent or self._closed, delay)
+                target = self._requested
+                self._urgent = False
+
+            try:
+                succeeded = self._flush_callback() is not False
+            except Exception as e:
+                print(f"Error in background writer: {e}")
+                succeeded = False
+            last_write = time.monotonic()
+
+            with self._cond:
+                # Marks stay pending after a failure, so the next round retries
+                if succeeded:
+                    self._done = max(self._done, target)
+                self._failed = not succeeded
+                self._attempts += 1
+                self._cond.notify_all()
@@ -0,0 +1,77 @@
+# change_events.py
+import threading
+from collections import namedtuple
+
+# Kinds of change published by the databases
+READINGS_ADDED = "readings_added"      # New readings stored for a sensor
+SENSOR_CHANGED = "sensor_changed"      # A sensor's configuration changed
+SETTINGS_CHANGED = "settings_changed"  # Application settings changed
+
+# sensor_id is None for changes that do not belong to one sensor (settings).
+# readings is set on READINGS_ADDED: a tuple of the (ts, water_level) pairs
+# the change stored for the sensor, ts in epoch seconds; None if the
+# database does not pass them on
+ChangeEvent = namedtuple("ChangeEvent", ["kind", "sensor_id", "readings"], defaults=(None,))
+
+
+def merge_events(events):
+    """
+    ChangeEvents without repeats of the same (kind, sensor_id), in order of
+    first appearance. The readings of repeated events are joined; if one
+    of them has none, neither has the merged event.
+    """
+    merged = {}  # (kind, sensor_id) -> [event, list of readings or None]
+    for event in events:
+        entry = merged.get((event.kind, event.sensor_id))
+        if entry is None:
+            merged[(event.kind, event.sensor_id)] = [
+                event, None if event.readings is None else list(event.readings)]
+        elif entry[1] is not None:
+            if event.readings is None:
+                entry[1] = None
+            else:
+                entry[1].extend(event.readings)
+    return [event._replace(readings=None if readings is None else tuple(readings))
+            for event, readings in merged.values()]
+
+
+class ChangeNotifier:
+    """
+    Passes lists of ChangeEvents from a database to its listeners.
+    Plain Python, so the databases do not depend on Qt. Listeners are
+    called on the thread that made the change, after it is committed, and
+    must return quickly; db_events.DatabaseEvents forwards them to the GUI.
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener, first=False):
+        """
+        Call listener(events) after every committed change. With first the
+        listener runs before those already subscribed, for state derived
+        from the data that other listeners read.
+        """
+        with self._lock:
+            if first:
+                self._listeners.insert(0, listener)
+            else:
+                self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def publish(self, events):
+        if not events:
+            return
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                print(f"Error in change listener: {e}")
+
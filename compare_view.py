@@ -0,0 +1,166 @@
+# compare_view.py
+from datetime import datetime, timedelta
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton
+from PyQt5.QtGui import QPalette, QColor, QFont
+from PyQt5.QtCore import Qt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+import matplotlib.dates as mdates
+from dateutil import tz
+from db_events import DatabaseEvents
+from change_events import READINGS_ADDED, SETTINGS_CHANGED
+from time_series import to_epoch
+from water_level_chart import epoch_to_datenum
+
+
+class CompareView(QWidget):
+    """
+    Water level history of all sensors (up to MAX_SENSORS) in one chart
+    on a shared time axis.
+
+    The history comes from one get_aligned_history() call that returns
+    every sensor's mean level on the same time grid, at a rollup tier
+    matching the chart width. The figure and its lines are created once;
+    a refresh only replaces the line data.
+    """
+
+    MAX_SENSORS = 12
+    RANGES = [("Day", 1), ("Week", 7), ("Month", 30), ("Year", 365)]
+    # One distinguishable color per sensor
+    COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b',
+              '#e377c2', '#7f7f7f', '#bcbd22', '#17becf', '#000080', '#808000']
+
+    def __init__(self, dashboard_window, db):
+        super().__init__()
+        self.dashboard_window = dashboard_window
+        self.db = db
+        self.days = 7
+        self._legend_labels = None  # Sensors in the legend
+
+        self.setWindowTitle("Compare Sensors")
+        # Deleted on close, which also ends its change subscription
+        self.setAttribute(Qt.WA_DeleteOnClose)
+
+        # Set background color
+        palette = self.palette()
+        palette.setColor(QPalette.Window, QColor('#00486F'))
+        self.setPalette(palette)
+        self.setAutoFillBackground(True)
+        self.setStyleSheet("QLabel { color: white; }")
+
+        main_layout = QVBoxLayout(self)
+        main_layout.setSpacing(15)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+
+        # Back button and range buttons
+        button_style = """
+            QPushButton {
+                background-color: #A8D3EF; color: black;
+                border: 1px solid #ccc; border-radius: 5px;
+                font-weight: bold;
+                font-size: 16px;
+            }
+            QPushButton:hover { background-color: #f0f0f0; }
+        """
+        top_bar_layout = QHBoxLayout()
+        back_btn = QPushButton("← Back")
+        back_btn.setFixedSize(100, 40)
+        back_btn.setStyleSheet(button_style)
+        back_btn.clicked.connect(self.go_back)
+        top_bar_layout.addWidget(back_btn, alignment=Qt.AlignLeft)
+        top_bar_layout.addStretch()
+        for name, days in self.RANGES:
+            range_btn = QPushButton(name)
+            range_btn.setFixedSize(80, 40)
+            range_btn.setStyleSheet(button_style)
+            range_btn.clicked.connect(lambda checked, days=days: self.show_last_days(days))
+            top_bar_layout.addWidget(range_btn)
+        main_layout.addLayout(top_bar_layout)
+
+        title = QLabel("Compare Sensors")
+        title.setFont(QFont("Arial", 20, QFont.Bold))
+        title.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(title)
+
+        self.figure = Figure(figsize=(10, 6), dpi=100)
+        self.canvas = FigureCanvas(self.figure)
+        self.canvas.setMinimumHeight(400)
+        main_layout.addWidget(self.canvas)
+        self.create_artists()
+
+        self.refresh()
+
+        # Redraw when any sensor gets readings or the thresholds change
+        DatabaseEvents.for_database(self.db).subscribe(
+            lambda events: self.refresh(), kinds=[READINGS_ADDED, SETTINGS_CHANGED], owner=self)
+
+    def create_artists(self):
+        """Create the axes, one line per possible sensor and the threshold lines, once"""
+        ax = self.ax = self.figure.add_subplot(111)
+        self.lines = [ax.plot([], [], color=color, linewidth=1.5, visible=False)[0]
+                      for color in self.COLORS[:self.MAX_SENSORS]]
+        self.warning_line = ax.axhline(y=75, color='orange', linestyle='--', linewidth=1, alpha=0.8)
+        self.critical_line = ax.axhline(y=85, color='red', linestyle='--', linewidth=1, alpha=0.8)
+
+        ax.set_xlabel('Date', fontsize=10)
+        ax.set_ylabel('Water Level (%)', fontsize=10)
+        ax.set_ylim(0, 105)
+        ax.grid(True, linestyle=':', alpha=0.6)
+
+        local_tz = tz.tzlocal()
+        locator = mdates.AutoDateLocator(tz=local_tz, minticks=3, maxticks=8)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator, tz=local_tz))
+        self.figure.subplots_adjust(left=0.06, right=0.85, top=0.95, bottom=0.1)
+
+    def show_last_days(self, days):
+        self.days = days
+        self.refresh()
+
+    def time_window(self, snapshot):
+        """Last self.days days up to the end of the newest reading's day, epoch seconds"""
+        newest = max([to_epoch(sensor.get("last_updated")) or 0
+                      for sensor in snapshot["sensors"].values()] or [0])
+        if not newest:
+            newest = datetime.now().timestamp()
+        day = datetime.fromtimestamp(newest).replace(hour=0, minute=0, second=0, microsecond=0)
+        end = (day + timedelta(days=1)).timestamp()
+        return end - self.days * 86400, end
+
+    def refresh(self):
+        """Load all sensors' history in one query and update the lines"""
+        snapshot = self.db.get_snapshot()
+        sensor_ids = self.db.get_sensors()[:self.MAX_SENSORS]
+        start, end = self.time_window(snapshot)
+        history = self.db.get_aligned_history(sensor_ids, start, end,
+                                              max_points=max(self.canvas.width(), 200))
+
+        x = epoch_to_datenum(history["ts"])
+        for row, line in enumerate(self.lines):
+            if row < len(sensor_ids):
+                # Readings sparser than the buckets leave empty buckets; join across them
+                levels = history["mean"][row]
+                filled = ~np.isnan(levels)
+                line.set_data(x[filled], levels[filled])
+                line.set_label(sensor_ids[row])
+                line.set_visible(True)
+            else:
+                line.set_visible(False)
+
+        # The legend only changes when sensors are added or removed
+        if sensor_ids != self._legend_labels:
+            self._legend_labels = sensor_ids
+            self.ax.legend(handles=self.lines[:len(sensor_ids)], fontsize=9,
+                           loc='upper left', bbox_to_anchor=(1.01, 1.0))
+
+        settings = snapshot["settings"]
+        self.warning_line.set_ydata([settings.get("warning_threshold", 75)] * 2)
+        self.critical_line.set_ydata([settings.get("critical_threshold", 85)] * 2)
+        self.ax.set_xlim(epoch_to_datenum(start), epoch_to_datenum(end))
+        self.canvas.draw_idle()
+
+    def go_back(self):
+        """Returns to the dashboard view"""
+        self.dashboard_window.showFullScreen()
+        self.close()
@@ -0,0 +1,98 @@
+# csv_export.py
+import csv
+import os
+from datetime import datetime
+import numpy as np
+from time_series import to_epoch
+
+CHUNK_SIZE = 50000  # Readings per chunk, about 1 MB of columns
+# The Date column holds the full local time of each reading; the header
+# is kept as it was, for tools that read earlier exports
+HEADER = ["Sensor", "Date", "Water Level (%)", "Battery Level (%)"]
+
+
+def local_stamps(ts):
+    """
+    Format epoch seconds as local "YYYY-MM-DD HH:MM:SS" strings. Vectorized
+    when the whole chunk has one UTC offset, row by row across a DST change.
+    """
+    if not len(ts):
+        return []
+    first = datetime.fromtimestamp(float(ts[0])).astimezone().utcoffset().total_seconds()
+    last = datetime.fromtimestamp(float(ts[-1])).astimezone().utcoffset().total_seconds()
+    if first != last:
+        return [datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S") for t in ts.tolist()]
+    local = (np.floor(ts) + first).astype("datetime64[s]")
+    return np.char.replace(np.datetime_as_string(local, unit="s"), "T", " ").tolist()
+
+
+def _column(values):
+    """Values as a list, with None (an empty field) in place of NaN"""
+    if np.isnan(values).any():
+        return np.where(np.isnan(values), None, values.astype(object)).tolist()
+    return values.tolist()
+
+
+def iter_rows(db, sensor_ids=None, start=None, end=None, chunk_size=None):
+    """
+    Yield the export rows chunk by chunk, as lists of (sensor name,
+    timestamp, water level, battery level) tuples. Readings are read with
+    db.iter_history_arrays(), so only one chunk is held at a time however
+    long the history is.
+    """
+    if sensor_ids is None:
+        sensor_ids = db.get_sensors()
+    kwargs = {} if chunk_size is None else {"chunk_size": chunk_size}
+    for sensor_id in sensor_ids:
+        sensor = db.get_sensor_data(sensor_id)
+        if sensor is None:
+            continue
+        name = sensor.get("name", sensor_id)
+        for ts, water, battery in db.iter_history_arrays(sensor_id, start, end, **kwargs):
+            yield list(zip([name] * len(ts), local_stamps(ts), _column(water), _column(battery)))
+
+
+def export_csv(db, filename, sensor_ids=None, start=None, end=None,
+               progress=None, cancelled=None, chunk_size=None):
+    """
+    Stream the readings of sensor_ids (all if None) between start and end
+    (anything to_epoch() takes, None for open ends) to a CSV file.
+
+    The file is written as filename + ".part" and renamed when complete,
+    so a cancelled or failed export never leaves a half file under the
+    real name. progress(done, total) is called after every chunk and
+    cancelled() is checked before each one. Returns the number of rows
+    written, or None if the export was cancelled. Errors are raised.
+    """
+    start = to_epoch(start)
+    end = to_epoch(end)
+    if sensor_ids is None:
+        sensor_ids = db.get_sensors()
+    total = sum(db.count_readings(sensor_id, start, end) for sensor_id in sensor_ids)
+    if progress:
+        progress(0, total)
+
+    part = filename + ".part"
+    done = 0
+    stopped = False
+    try:
+        with open(part, "w", newline="", buffering=1 << 20) as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(HEADER)
+            for rows in iter_rows(db, sensor_ids, start, end, chunk_size):
+                if cancelled and cancelled():
+                    stopped = True
+                    break
+                writer.writerows(rows)
+                done += len(rows)
+                if progress:
+                    progress(done, max(total, done))
+        if stopped:
+            os.remove(part)
+            return None
+        os.replace(part, filename)
+        return done
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
@@ -1,14 +1,16 @@
 # dashboard.py
 import sys
+import importlib
+import startup_timing
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel,
     QScrollArea, QPushButton, QHBoxLayout, QGridLayout, QFrame
 )
 from PyQt5.QtGui import QPalette, QColor, QFont
-from PyQt5.QtCore import Qt, pyqtSlot
-from sensor_card import SensorCard
-from settings_screen import SettingsScreen
+from PyQt5.QtCore import Qt, QTimer, pyqtSlot
 from database_connector import DatabaseConnector
+from db_events import DatabaseEvents
+from change_events import SETTINGS_CHANGED
 from PyQt5.QtGui import QFont, QCursor
 
 
@@ -16,13 +18,97 @@ from PyQt5.QtGui import QFont, QCursor
 class Dashboard(QWidget):
     """
     Main screen displaying all sensors and access to settings.
+
+    Startup is staged so the window paints as early as possible: the frame
+    is built without the database, the first paint schedules
+    load_sensors() (database, cards), and once the cards are up the
+    screens opened from here are imported while the app is idle.
     """
+
+    # Imported after the cards are shown, so opening them later is quick
+    PRELOAD_MODULES = ("sensor_detail", "settings_screen", "alarm_history")
+
     def __init__(self):
         super().__init__()
         self.settings_screen = None
-        self.db = DatabaseConnector.get_instance()
+        self.db = None           # Opened by load_sensors()
+        self.alarms = None       # The database's AlarmEngine, from load_sensors()
+        self.journal = None      # The database's alarm journal, from load_sensors()
+        self.cards = {}  # sensor_id -> SensorCard
+        self._load_scheduled = False
+
+        # Cards follow their sensor through change events. The timer is a
+        # full resync every update_interval minutes, for changes made outside
+        # this process (e.g. another writer on the SQLite file)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
         self.init_ui()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._load_scheduled:
+            # First paint is done: load the sensors from the event loop
+            self._load_scheduled = True
+            startup_timing.mark("first paint")
+            QTimer.singleShot(0, self.load_sensors)
+
+    def load_sensors(self):
+        """Open the database and fill the grid with sensor cards (once)"""
+        if self.db is not None:
+            return
+        from sensor_card import SensorCard
+        from alarm_engine import AlarmEngine
+        from alarm_journal import journal_for_database
+        self.db = DatabaseConnector.get_instance()
+        # Alarms are evaluated and journaled for every sensor from here on,
+        # whichever screen is shown
+        self.alarms = AlarmEngine.for_database(self.db)
+        self.journal = journal_for_database(self.db)
+        startup_timing.mark("database")
+
+        sensor_ids = self.db.get_sensors()
+        total_cards = 12
+        sensors_to_display = sensor_ids[:total_cards]  # max 12
+
+        # Fyll med None för tomma slotar
+        while len(sensors_to_display) < total_cards:
+            sensors_to_display.append(None)
+
+        for i in range(total_cards):
+            row = i // 4
+            col = i % 4
+            sensor_id = sensors_to_display[i]
+
+            if sensor_id:
+                card = SensorCard(sensor_id, self, db=self.db)
+                self.cards[sensor_id] = card
+            else:
+                card = self.create_empty_slot()
+
+            self.grid_layout.addWidget(card, row, col)
+
+        self.apply_update_interval(self.db.get_settings())
+        self.refresh_timer.start()
+        DatabaseEvents.for_database(self.db).subscribe(
+            lambda events: self.apply_update_interval(self.db.get_settings()),
+            kinds=[SETTINGS_CHANGED], owner=self)
+        startup_timing.mark("sensors loaded")
+        startup_timing.print_report()
+        QTimer.singleShot(0, self.preload)
+
+    def preload(self):
+        """Import the screens opened from the dashboard ahead of first use"""
+        for name in self.PRELOAD_MODULES:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                print(f"Error preloading {name}: {e}")
+
+    def close_database(self):
+        """Write out anything the database still has queued"""
+        if self.db is not None:
+            self.db.close()
+
     def init_ui(self):
         # Set background
         palette = self.palette()
@@ -41,9 +127,7 @@ class Dashboard(QWidget):
         header_layout.addWidget(title)
         header_layout.addStretch()
 
-        settings_btn = QPushButton("Settings")
-        settings_btn.setFixedSize(140, 40)
-        settings_btn.setStyleSheet("""
+        button_style = """
             QPushButton {
                 background-color: #A8D3EF;
                 color: black;
@@ -54,7 +138,22 @@ class Dashboard(QWidget):
                 font-weight: bold;
             }
             QPushButton:hover { background-color: #f0f0f0; }
-        """)
+        """
+        compare_btn = QPushButton("Compare")
+        compare_btn.setFixedSize(140, 40)
+        compare_btn.setStyleSheet(button_style)
+        compare_btn.clicked.connect(self.open_compare)
+        header_layout.addWidget(compare_btn)
+
+        alarms_btn = QPushButton("Alarms")
+        alarms_btn.setFixedSize(140, 40)
+        alarms_btn.setStyleSheet(button_style)
+        alarms_btn.clicked.connect(self.open_alarm_history)
+        header_layout.addWidget(alarms_btn)
+
+        settings_btn = QPushButton("Settings")
+        settings_btn.setFixedSize(140, 40)
+        settings_btn.setStyleSheet(button_style)
         settings_btn.clicked.connect(self.open_settings)
         header_layout.addWidget(settings_btn)
         main_layout.addLayout(header_layout)
@@ -81,36 +180,35 @@ class Dashboard(QWidget):
         scroll_content_widget = QWidget()
         scroll_content_widget.setObjectName("scrollContainer")
 
-        # Grid: 3 rows x 4 columns
-        grid_layout = QGridLayout(scroll_content_widget)
-        grid_layout.setSpacing(20)
-        grid_layout.setContentsMargins(10, 10, 10, 10)
-
-        sensor_ids = self.db.get_sensors()
-        total_cards = 12
-        sensors_to_display = sensor_ids[:total_cards]  # max 12
-
-        # Fyll med None för tomma slotar
-        while len(sensors_to_display) < total_cards:
-            sensors_to_display.append(None)
-
-        for i in range(total_cards):
-            row = i // 4
-            col = i % 4
-            sensor_id = sensors_to_display[i]
-
-            if sensor_id:
-                card = SensorCard(sensor_id, self, db=self.db)
-            else:
-                card = self.create_empty_slot()
-
-            grid_layout.addWidget(card, row, col)
+        # Grid: 3 rows x 4 columns, filled by load_sensors()
+        self.grid_layout = QGridLayout(scroll_content_widget)
+        self.grid_layout.setSpacing(20)
+        self.grid_layout.setContentsMargins(10, 10, 10, 10)
 
         scroll_area.setWidget(scroll_content_widget)
         main_layout.addWidget(scroll_area)
 
         self.setLayout(main_layout)
 
+    def refresh(self):
+        """Read all sensors in one call and update the cards that changed"""
+        if self.db is None:
+            return
+        snapshot = self.db.get_snapshot()
+        settings = snapshot["settings"]
+        self.alarms.sync(self.db, snapshot)
+        for sensor_id, card in self.cards.items():
+            sensor_data = snapshot["sensors"].get(sensor_id)
+            card.update_from(sensor_data)
+            card.update_sparkline(sensor_data)
+        self.apply_update_interval(settings)
+
+    def apply_update_interval(self, settings):
+        """Follow the update_interval setting (minutes)"""
+        interval = max(1, settings.get("update_interval", 15)) * 60 * 1000
+        if interval != self.refresh_timer.interval():
+            self.refresh_timer.setInterval(interval)
+
     def create_empty_slot(self):
         """Create a clickable slot to add a new sensor"""
         frame = QFrame()
@@ -146,6 +244,8 @@ class Dashboard(QWidget):
         return frame
 
     def open_settings(self):
+        from settings_screen import SettingsScreen
+        self.load_sensors()
         if self.settings_screen is None or not self.settings_screen.isVisible():
             self.settings_screen = SettingsScreen(parent=self, db=self.db)
             self.settings_screen.closed.connect(self.show_dashboard)
@@ -153,13 +253,38 @@ class Dashboard(QWidget):
             self.settings_screen.setWindowFlags(Qt.Window)
             self.settings_screen.showFullScreen()
 
+    def open_compare(self):
+        """Show all sensors' history in one chart"""
+        try:
+            # Imported here: the compare chart needs matplotlib, which is optional
+            from compare_view import CompareView
+        except ImportError as e:
+            print(f"Error opening compare view: {e}")
+            return
+        self.load_sensors()
+        self.hide()
+        self.compare_view = CompareView(self, self.db)
+        self.compare_view.showFullScreen()
+
+    def open_alarm_history(self):
+        """Show the alarm journal"""
+        from alarm_history import AlarmHistoryScreen
+        self.load_sensors()
+        self.hide()
+        self.alarm_history = AlarmHistoryScreen(self, self.db)
+        self.alarm_history.showFullScreen()
+
     @pyqtSlot()
     def show_dashboard(self):
         self.showFullScreen()
 
 
 if __name__ == "__main__":
+    startup_timing.mark("imports")
     app = QApplication(sys.argv)
     dashboard = Dashboard()
+    # Write out anything the database still has queued before exiting
+    app.aboutToQuit.connect(dashboard.close_database)
+    startup_timing.mark("window created")
     dashboard.showFullScreen()
     sys.exit(app.exec_())
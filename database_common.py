@@ -0,0 +1,114 @@
+# database_common.py
+import json
+import random
+from datetime import datetime, timedelta
+import numpy as np
+import csv_export
+
+# Code shared by MockDatabase and SQLiteDatabase. Works through the public
+# database methods only, so both backends seed, export and simulate alike.
+
+
+def initial_data():
+    """
+    Demo data for an empty database: three sensors with a reading per day
+    for the last 7 days, and the default settings. Readings are a list of
+    dicts with "date", "water_level" and "battery_level".
+    """
+    sensors = {
+        "Sensor 1": {"name": "Main Tank", "enabled": True, "max_level": 100, "offset": 0},
+        "Sensor 2": {"name": "Reserve Tank", "enabled": True, "max_level": 100, "offset": 0},
+        "Sensor 3": {"name": "Overflow Tank", "enabled": True, "max_level": 100, "offset": 0}
+    }
+
+    # Generate 7 days of historical data for each sensor
+    now = datetime.now()
+    for sensor_id, sensor in sensors.items():
+        # Create readings array for historical data
+        sensor["readings"] = []
+
+        # Generate different patterns for each sensor
+        seed = int(sensor_id.split()[-1])
+        np.random.seed(seed)
+
+        for i in range(7):
+            date = (now - timedelta(days=6-i)).strftime("%Y-%m-%d")
+            # More variation for interesting charts
+            base_level = 50 + seed * 5
+            level = base_level + np.random.normal(0, 5) + i * 2
+            level = max(10, min(95, level))  # Keep within reasonable range
+
+            # Add a reading for this day
+            sensor["readings"].append({
+                "date": date,
+                "water_level": round(level, 1),
+                "battery_level": round(90 - i * (3 - seed), 1)
+            })
+
+        # Current readings
+        sensor["current_water_level"] = sensor["readings"][-1]["water_level"]
+        sensor["current_battery_level"] = sensor["readings"][-1]["battery_level"]
+        sensor["last_updated"] = now.strftime("%Y-%m-%d %H:%M:%S")
+
+    data = {
+        "sensors": sensors,
+        "settings": {
+            "warning_threshold": 75,
+            "critical_threshold": 85,
+            "update_interval": 15  # minutes
+        }
+    }
+
+    return data
+
+
+def export_to_csv(db, filename=None, sensor_ids=None, start=None, end=None,
+                  progress=None, cancelled=None):
+    """
+    Export sensor data of db to a CSV file, optionally only some sensors
+    and a time window. Streams the readings chunk by chunk through
+    csv_export, see export_csv() there for progress and cancelled.
+    """
+    if not filename:
+        filename = f"water_level_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+    try:
+        return csv_export.export_csv(db, filename, sensor_ids, start, end,
+                                     progress, cancelled) is not None
+    except Exception as e:
+        print(f"Error exporting to CSV: {e}")
+        return False
+
+
+def export_to_json(db, filename=None):
+    """Export settings and all sensor data of db as human-readable JSON"""
+    if not filename:
+        filename = f"water_level_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    try:
+        export = db.get_snapshot()
+        for sensor_id, sensor in export["sensors"].items():
+            sensor["readings"] = db.get_range(sensor_id)
+        with open(filename, 'w') as f:
+            json.dump(export, f, indent=2)
+        return True
+    except Exception as e:
+        print(f"Error exporting to JSON: {e}")
+        return False
+
+
+def simulate_update(db):
+    """Simulate data update for all enabled sensors of db, stored as one batch"""
+    batch = []
+    for sensor_id, sensor in db.get_snapshot()["sensors"].items():
+        if sensor["enabled"]:
+            # Small random change to water level
+            water_change = random.uniform(-2, 2)
+            new_water = max(10, min(95, sensor["current_water_level"] + water_change))
+
+            # Small decrease in battery
+            new_battery = max(0, sensor["current_battery_level"] - random.uniform(0, 0.1))
+
+            batch.append((sensor_id, None, new_water, new_battery))
+    accepted, _ = db.update_sensor_readings(batch)
+    return accepted == len(batch)
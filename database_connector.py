@@ -1,12 +1,47 @@
 # database_connector.py
-from mock_database import MockDatabase
+import os
+
+# Backend used when nothing else is configured: "mock" (JSON file) or "sqlite"
+DEFAULT_BACKEND = "mock"
+
+
+def _create_mock(**options):
+    from mock_database import MockDatabase
+    return MockDatabase(**options)
+
+
+def _create_sqlite(**options):
+    from sqlite_database import SQLiteDatabase
+    return SQLiteDatabase(**options)
+
+
+BACKENDS = {
+    "mock": _create_mock,
+    "sqlite": _create_sqlite,
+}
+
 
 # Singleton pattern - one database instance for the whole app
 class DatabaseConnector:
     _instance = None
-    
+    # The WATER_MONITOR_DB environment variable selects the backend unless
+    # configure() is called before the first get_instance()
+    _backend = os.environ.get("WATER_MONITOR_DB", DEFAULT_BACKEND)
+    _options = {}
+
+    @staticmethod
+    def configure(backend, **options):
+        """Select the backend and its constructor options"""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown database backend: {backend}")
+        if DatabaseConnector._instance is not None:
+            raise RuntimeError("Database backend must be configured before first use")
+        DatabaseConnector._backend = backend
+        DatabaseConnector._options = options
+
     @staticmethod
     def get_instance():
         if DatabaseConnector._instance is None:
-            DatabaseConnector._instance = MockDatabase()
-        return DatabaseConnector._instance
\ No newline at end of file
+            create = BACKENDS[DatabaseConnector._backend]
+            DatabaseConnector._instance = create(**DatabaseConnector._options)
+        return DatabaseConnector._instance
@@ -0,0 +1,90 @@
+# db_events.py
+import threading
+import weakref
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from change_events import merge_events
+from database_connector import DatabaseConnector
+
+
+class DatabaseEvents(QObject):
+    """
+    Qt bridge for database change events.
+    The database publishes ChangeEvents on whatever thread made the change;
+    they are collected here and delivered on the GUI thread once per
+    event-loop tick, with repeats of the same (kind, sensor) folded into
+    one (their readings joined). Subscribers can limit delivery to some
+    sensors and event kinds, so a widget only hears about what it shows.
+    """
+
+    # All events of one tick, as a list of ChangeEvents
+    changed = pyqtSignal(list)
+    _wake = pyqtSignal()
+
+    # One bridge per database
+    _bridges = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def for_database(db=None):
+        """Bridge for db, by default the shared DatabaseConnector database"""
+        if db is None:
+            db = DatabaseConnector.get_instance()
+        bridge = DatabaseEvents._bridges.get(db)
+        if bridge is None:
+            bridge = DatabaseEvents(db)
+            DatabaseEvents._bridges[db] = bridge
+        return bridge
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._pending = {}      # (kind, sensor_id) -> ChangeEvent, in arrival order
+        self._subscribers = []  # (callback, sensor_ids, kinds)
+        # Queued: the delivery runs on this object's (GUI) thread, in the next tick
+        self._wake.connect(self._deliver, Qt.QueuedConnection)
+        db.events.subscribe(self._on_events)
+
+    def subscribe(self, callback, sensor_ids=None, kinds=None, owner=None):
+        """
+        Call callback(events) with the events of each tick that match.
+        sensor_ids and kinds limit what is delivered (None means all);
+        events without a sensor, such as settings changes, pass any sensor
+        filter. With an owner QObject the subscription ends when it is destroyed.
+        """
+        entry = (callback,
+                 None if sensor_ids is None else set(sensor_ids),
+                 None if kinds is None else set(kinds))
+        self._subscribers.append(entry)
+        if owner is not None:
+            owner.destroyed.connect(lambda *args: self.unsubscribe(callback))
+
+    def unsubscribe(self, callback):
+        self._subscribers = [entry for entry in self._subscribers if entry[0] != callback]
+
+    def _on_events(self, events):
+        # Any thread: queue the events and wake the GUI thread once per tick
+        with self._lock:
+            first = not self._pending
+            for event in events:
+                key = (event.kind, event.sensor_id)
+                if key in self._pending:
+                    event = merge_events([self._pending[key], event])[0]
+                self._pending[key] = event
+        if first:
+            self._wake.emit()
+
+    def _deliver(self):
+        with self._lock:
+            events, self._pending = list(self._pending.values()), {}
+        if not events:
+            return
+        self.changed.emit(events)
+        for callback, sensor_ids, kinds in list(self._subscribers):
+            matching = [event for event in events
+                        if (kinds is None or event.kind in kinds)
+                        and (sensor_ids is None or event.sensor_id is None
+                             or event.sensor_id in sensor_ids)]
+            if matching:
+                try:
+                    callback(matching)
+                except Exception as e:
+                    print(f"Error in change subscriber: {e}")
@@ -0,0 +1,59 @@
+# downsample.py
+import numpy as np
+
+
+def visible_slice(x, x_range=None):
+    """
+    Index range [lo:hi] of the sorted array x inside x_range, widened by one
+    point on each side so a line drawn from it continues past the edges.
+    """
+    if x_range is None:
+        return 0, len(x)
+    start, end = x_range
+    lo = max(0, int(np.searchsorted(x, start, side="left")) - 1)
+    hi = min(len(x), int(np.searchsorted(x, end, side="right")) + 1)
+    return lo, hi
+
+
+def _first_per_bucket(mask, bucket_of_row):
+    """Index of the first True row of mask in every bucket that has one"""
+    rows = np.flatnonzero(mask)
+    _, first = np.unique(bucket_of_row[rows], return_index=True)
+    return rows[first]
+
+
+def m4(x, y, buckets, x_range=None):
+    """
+    M4 decimation: split x_range (default: all of x) into equally wide
+    buckets and keep the first, last, minimum and maximum point of each.
+    Every local peak and dip survives, so a line drawn from the result
+    looks the same as one drawn from all points when there is about one
+    bucket per pixel column.
+
+    x must be sorted. Returns (x, y) with at most 4 * buckets points
+    (plus the two edge points) in x order; short series are returned as is.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    lo, hi = visible_slice(x, x_range)
+    x, y = x[lo:hi], y[lo:hi]
+    count = len(x)
+    buckets = max(1, int(buckets))
+    if count <= 4 * buckets:
+        return x, y
+
+    start, end = x_range if x_range is not None else (x[0], x[-1])
+    span = (end - start) or 1.0
+    bucket = np.clip(((x - start) / span * buckets).astype(np.int64), -1, buckets)
+
+    # x is sorted, so each bucket is one run of rows
+    firsts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    lasts = np.r_[firsts[1:], count] - 1
+    run = np.repeat(np.arange(len(firsts)), np.diff(np.r_[firsts, count]))
+    lows = np.minimum.reduceat(y, firsts)
+    highs = np.maximum.reduceat(y, firsts)
+    mins = _first_per_bucket(y == lows[run], run)
+    maxs = _first_per_bucket(y == highs[run], run)
+
+    keep = np.unique(np.concatenate((firsts, lasts, mins, maxs)))
+    return x[keep], y[keep]
@@ -0,0 +1,66 @@
+# history_tiles.py
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class HistoryTiles:
+    """
+    LRU cache of one sensor's history, split into fixed time tiles per
+    resolution (raw readings or a rollup tier). A view fetches only the
+    tiles it does not have yet, so panning back and forth or zooming
+    between the same levels is served from memory.
+
+    Tiles that still covered the future when fetched are "open"; call
+    invalidate_open() when new readings arrive so they are fetched again.
+    """
+
+    POINTS_PER_TILE = 512   # Buckets per tile for rollup tiers
+    RAW_TILE = 6 * 3600     # Seconds per tile of raw readings
+    CAPACITY = 128          # Tiles kept before the least recently used is dropped
+
+    def __init__(self, db, sensor_id, capacity=None):
+        self.db = db
+        self.sensor_id = sensor_id
+        self.capacity = capacity or self.CAPACITY
+        self._tiles = OrderedDict()  # (resolution, index) -> (ts, levels, complete)
+        self.fetches = 0             # Storage queries made so far
+
+    def tile_span(self, resolution):
+        return resolution * self.POINTS_PER_TILE if resolution else self.RAW_TILE
+
+    def get(self, start, end, resolution):
+        """Return (ts, water_levels) for start..end (epoch seconds) at resolution"""
+        span = self.tile_span(resolution)
+        tiles = [self._tile(resolution, index, span)
+                 for index in range(int(start // span), int(end // span) + 1)]
+        return (np.concatenate([tile[0] for tile in tiles]),
+                np.concatenate([tile[1] for tile in tiles]))
+
+    def _tile(self, resolution, index, span):
+        key = (resolution, index)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+
+        start = index * span
+        end = start + span
+        result = self.db.get_rollup_arrays(self.sensor_id, start, end, resolution=resolution)
+        self.fetches += 1
+        # The query includes both ends; a value at `end` belongs to the next tile
+        inside = (result["ts"] >= start) & (result["ts"] < end)
+        tile = (result["ts"][inside], result["mean"][inside], end <= time.time())
+
+        self._tiles[key] = tile
+        while len(self._tiles) > self.capacity:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def invalidate_open(self):
+        """Forget tiles that were still filling up when fetched"""
+        for key in [key for key, tile in self._tiles.items() if not tile[2]]:
+            del self._tiles[key]
+
+    def clear(self):
+        self._tiles.clear()
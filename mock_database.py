@@ -1,89 +1,542 @@
 # mock_database.py
+import atexit
 import json
 import os
-import random
+import re
+import threading
+import weakref
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import numpy as np
+from time_series import SensorSeries, ReadingsView, to_epoch, validate_batch
+from rollups import RollupPyramid, align_buckets, rollup_records
+from background_writer import BackgroundWriter
+import csv_export
+import database_common
+from change_events import (ChangeEvent, ChangeNotifier, READINGS_ADDED,
+                           SENSOR_CHANGED, SETTINGS_CHANGED, merge_events)
+
+# Marks a setting that did not exist before a transaction changed it
+_MISSING = object()
+
+# Databases not closed yet; closed at exit so pending changes get written.
+# Weak, so a closed database is not kept alive until the interpreter exits.
+_open_databases = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_databases():
+    for db in list(_open_databases):
+        db.close()
+
 
 class MockDatabase:
     """
     Simulates a database for sensor data with generated placeholder values.
     Stores and retrieves water level, battery level, and historical data.
+
+    Readings are kept per sensor in a columnar SensorSeries. sensor["readings"]
+    is a ReadingsView over it, and get_history_arrays() gives zero-copy access
+    to the underlying NumPy columns. Every reading is stored with its full
+    timestamp; get_range() selects a time window by binary search.
+    Minute/hour/day rollups are built per sensor on first use and then kept
+    up to date as readings arrive; history queries given a max_points budget
+    are served from the coarsest tier that still fills it.
+
+    Changes are applied to the in-memory data under a lock and handed to a
+    background writer thread, so callers (the Qt GUI thread) never wait for
+    disk I/O. The writer coalesces changes and writes at most once per
+    FLUSH_INTERVAL; flush() forces a write and close() flushes and stops it.
+    Changes made inside `with db.transaction():` are persisted together as
+    one log record when the block exits, or rolled back if it raises.
+    Committed changes are announced as ChangeEvents through self.events.
+
+    Persistence modes:
+    - "wal" (default): every change is appended as one compact record to a
+      write-ahead log next to the snapshot. The log is folded into a new
+      snapshot once it grows past COMPACT_AFTER records.
+    - "snapshot": the whole data tree is rewritten after changes.
+
+    Snapshot formats:
+    - "binary" (default): a small JSON header (HISTORY_DIR/snapshot.json)
+      with settings and sensor metadata, plus raw float64 column files per
+      sensor. The column files are memory-mapped rather than read, so
+      startup does not depend on the length of the history; new readings
+      are appended in place and a snapshot only syncs the mapped pages and
+      rewrites the header.
+    - "json": everything in FILENAME as compact JSON.
+    An existing snapshot in the other format (such as a legacy
+    sensor_data.json) is loaded and converted. export_to_json() writes a
+    human-readable copy.
     """
     
     FILENAME = "sensor_data.json"
+    HISTORY_DIR = "sensor_history"
+    HEADER_NAME = "snapshot.json"
+    SNAPSHOT_FORMAT = "binary"  # "binary" or "json"
+    LOG_SUFFIX = ".wal"
+    COMPACT_AFTER = 1000  # Log records before the log is folded into a snapshot
+    SYNC_LOG = True       # fsync each log write (survives power loss)
+    FLUSH_INTERVAL = 0.5  # Minimum seconds between background writes
+    LEVEL_RANGE = (0, 100)  # Valid water and battery levels (%) for bulk ingest
     
-    def __init__(self):
-        self.data = self._load_data() or self._create_initial_data()
+    def __init__(self, persistence="wal", snapshot_format=None):
+        self.persistence = persistence
+        self.snapshot_format = snapshot_format or self.SNAPSHOT_FORMAT
+        self._generation = 0    # Bumped for every binary snapshot written
+        self._lock = threading.RLock()  # Guards self.data and the pending state
+        self._log_file = None           # Only touched by the writer thread
+        self._log_seq = 0       # Sequence number of the last logged change
+        self._log_records = 0   # Records in the log since the last snapshot
+        self._pending = []      # Serialized log records not yet written
+        self._dirty = False     # "snapshot" mode: data changed since last save
+        self._rollups = {}      # sensor_id -> RollupPyramid, built on first use
+        self._txn = None        # Open transaction: queued records and undo info
+        self.events = ChangeNotifier()
+
+        self.data = self._load_data()
+        if self.data is None:
+            self.data = self._create_initial_data()
+            if self.persistence == "wal":
+                self._save_data()
+
+        self._writer = BackgroundWriter(self._flush_pending, self.FLUSH_INTERVAL)
+        _open_databases.add(self)
         
+    @property
+    def log_filename(self):
+        return self.FILENAME + self.LOG_SUFFIX
+
+    @property
+    def rotated_log_filename(self):
+        return self.log_filename + ".1"
+
+    @property
+    def header_filename(self):
+        return os.path.join(self.HISTORY_DIR, self.HEADER_NAME)
+
     def _load_data(self):
-        """Load existing data from file if available"""
-        if os.path.exists(self.FILENAME):
+        """Load the latest snapshot if available, then replay the log"""
+        data, loaded_format = self._read_snapshot()
+        if data is None:
+            return None
+
+        self._log_seq = data.pop("wal_seq", 0)
+        replayed = 0
+        for path in (self.rotated_log_filename, self.log_filename):
+            replayed += self._replay_log(data, path)
+
+        # Fold the replayed records into a fresh snapshot so the log starts
+        # empty, and convert a snapshot stored in the other format
+        if (replayed or os.path.exists(self.rotated_log_filename)
+                or loaded_format != self.snapshot_format):
+            self.data = data
+            self._save_data()
+        return data
+
+    def _read_snapshot(self):
+        """Return (data, format) of the snapshot to start from, or (None, None)"""
+        readers = {"binary": self._read_binary_snapshot, "json": self._read_json_snapshot}
+        order = [self.snapshot_format] + [name for name in readers if name != self.snapshot_format]
+        for name in order:
             try:
-                with open(self.FILENAME, 'r') as f:
-                    return json.load(f)
+                data = readers[name]()
             except Exception as e:
-                print(f"Error loading data: {e}")
-        return None
-    
+                print(f"Error loading {name} snapshot: {e}")
+                continue
+            if data is not None:
+                return data, name
+        return None, None
+
+    def _read_json_snapshot(self):
+        if not os.path.exists(self.FILENAME):
+            return None
+        with open(self.FILENAME, 'r') as f:
+            data = json.load(f)
+        self._attach_series(data)
+        return data
+
+    def _read_binary_snapshot(self):
+        if not os.path.exists(self.header_filename):
+            return None
+        with open(self.header_filename, 'r') as f:
+            data = json.load(f)
+        self._generation = data.pop("generation", 0)
+        data.pop("format", None)
+        for sensor in data["sensors"].values():
+            history = sensor["readings"]
+            prefix = os.path.join(self.HISTORY_DIR, history["file"])
+            series = SensorSeries.map_files(prefix, history["rows"])
+            sensor["readings"] = ReadingsView(series)
+        return data
+
+    def _replay_log(self, data, path):
+        """Apply log records newer than the snapshot. Returns number applied."""
+        if not os.path.exists(path):
+            return 0
+
+        applied = 0
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash - nothing after it was committed
+                        break
+                    if record.get("seq", 0) <= self._log_seq:
+                        continue
+                    self._apply(data, record)
+                    self._log_seq = record["seq"]
+                    applied += 1
+        except Exception as e:
+            print(f"Error replaying log {path}: {e}")
+        return applied
+
+    @staticmethod
+    def _attach_series(data):
+        """Replace stored readings (legacy list or columns) with series views"""
+        for sensor in data["sensors"].values():
+            readings = sensor.get("readings", [])
+            if isinstance(readings, dict):
+                series = SensorSeries.from_dict(readings)
+            else:
+                series = SensorSeries.from_records(readings)
+            sensor["readings"] = ReadingsView(series)
+
+    @staticmethod
+    def _serializable(data):
+        """Copy of the data tree with readings stored as plain columns"""
+        sensors = {}
+        for sensor_id, sensor in data["sensors"].items():
+            sensors[sensor_id] = dict(sensor, readings=sensor["readings"].series.to_dict())
+        return dict(data, sensors=sensors)
+
     def _save_data(self):
         """Save current data to file"""
+        return self._write_snapshot()
+
+    def _write_snapshot(self):
+        """
+        Write a snapshot atomically and drop the log it replaces.
+        Runs on the writer thread (or before it is started).
+        """
         try:
-            with open(self.FILENAME, 'w') as f:
-                json.dump(self.data, f, indent=2)
+            with self._lock:
+                if self.snapshot_format == "binary":
+                    header, mapped, written = self._binary_snapshot()
+                else:
+                    snapshot = dict(self._serializable(self.data), wal_seq=self._log_seq)
+                    payload = json.dumps(snapshot, separators=(",", ":"))
+                # Records not yet written are covered by the snapshot
+                self._pending = []
+
+            # Start a new log; records up to wal_seq now live in the rotated one
+            self._close_log()
+            if os.path.exists(self.log_filename):
+                self._rotate_log()
+            self._log_records = 0
+
+            if self.snapshot_format == "binary":
+                self._write_binary_snapshot(header, mapped, written)
+            else:
+                self._replace_file(self.FILENAME, payload)
+
+            if os.path.exists(self.rotated_log_filename):
+                os.remove(self.rotated_log_filename)
             return True
         except Exception as e:
             print(f"Error saving data: {e}")
             return False
+
+    def _binary_snapshot(self):
+        """
+        Header for a binary snapshot, plus the work to make it true on disk.
+        Called with self._lock held.
+
+        Memory-mapped series only need their mapped pages synced: their files
+        already hold every row. Series held in memory (new, or with rows moved
+        since they were mapped) are copied here - a memcpy - and written to
+        new files after the lock is released.
+        """
+        self._generation += 1
+        sensors = {}
+        mapped = []     # Column arrays to sync
+        written = []    # (series, prefix, copy, rewrites) to write out
+        for i, (sensor_id, sensor) in enumerate(self.data["sensors"].items()):
+            series = sensor["readings"].series
+            if series.path is not None:
+                prefix = os.path.basename(series.path)
+                mapped.extend(series.mapped_columns())
+            else:
+                name = re.sub(r"\W+", "_", sensor_id).strip("_").lower()
+                prefix = f"{i:02d}_{name}.g{self._generation}"
+                written.append((series, prefix, series.copy(), series.rewrites))
+            history = {"file": prefix, "rows": len(series)}
+            sensors[sensor_id] = dict(sensor, readings=history)
+        header = dict(self.data, sensors=sensors, wal_seq=self._log_seq,
+                      generation=self._generation, format=1)
+        return header, mapped, written
+
+    def _write_binary_snapshot(self, header, mapped, written):
+        """Get the column files onto disk, then switch to them by replacing the header"""
+        os.makedirs(self.HISTORY_DIR, exist_ok=True)
+        for column in mapped:
+            column.flush()
+        for series, prefix, copy, rewrites in written:
+            copy.write_files(os.path.join(self.HISTORY_DIR, prefix))
+        self._replace_file(self.header_filename, json.dumps(header, separators=(",", ":")))
+
+        # Serve the new files memory-mapped too, unless rows moved meanwhile
+        with self._lock:
+            for series, prefix, copy, rewrites in written:
+                series.attach_files(os.path.join(self.HISTORY_DIR, prefix), len(copy), rewrites)
+
+        # Column files of older snapshots are no longer referenced
+        current = {sensor["readings"]["file"] + suffix for sensor in header["sensors"].values()
+                   for suffix in SensorSeries.FILE_SUFFIXES}
+        for name in os.listdir(self.HISTORY_DIR):
+            if name.endswith(SensorSeries.FILE_SUFFIXES) and name not in current:
+                os.remove(os.path.join(self.HISTORY_DIR, name))
+
+    @staticmethod
+    def _replace_file(filename, payload):
+        """Write a file atomically: temporary file, fsync, rename"""
+        tmp_name = filename + ".tmp"
+        with open(tmp_name, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, filename)
+
+    def _rotate_log(self):
+        """Move the live log aside; keep records left over from a failed snapshot"""
+        if not os.path.exists(self.rotated_log_filename):
+            os.replace(self.log_filename, self.rotated_log_filename)
+            return
+        with open(self.log_filename, 'r') as src, open(self.rotated_log_filename, 'a') as dst:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.remove(self.log_filename)
+
+    def _record_change(self, record):
+        """
+        Apply a change record to self.data, queue it for persistence and
+        announce it (inside a transaction: when the transaction commits)
+        """
+        with self._lock:
+            if self._txn is not None:
+                self._remember(record)
+            self._apply(self.data, record)
+            result = self._commit(record)
+            in_transaction = self._txn is not None
+        if not in_transaction:
+            self.events.publish(self._events_for(record))
+        return result
+
+    @classmethod
+    def _events_for(cls, record):
+        """ChangeEvents announcing a change record, without duplicates"""
+        op = record["op"]
+        if op == "batch":
+            events = [event for inner in record["records"] for event in cls._events_for(inner)]
+        elif op == "reading":
+            # Without a water level the reading repeats the current one,
+            # which the record does not hold
+            readings = None
+            if record.get("water_level") is not None:
+                readings = ((to_epoch(record.get("ts", record.get("time"))), record["water_level"]),)
+            events = [ChangeEvent(READINGS_ADDED, record["sensor"], readings)]
+        elif op == "readings":
+            readings = {}
+            for sensor_id, ts, water_level in zip(record["sensor"], record["ts"], record["water_level"]):
+                readings.setdefault(sensor_id, []).append((ts, water_level))
+            events = [ChangeEvent(READINGS_ADDED, sensor_id, tuple(pairs))
+                      for sensor_id, pairs in readings.items()]
+        elif op == "settings":
+            events = [ChangeEvent(SETTINGS_CHANGED, None)]
+        elif op == "sensor_settings":
+            events = [ChangeEvent(SENSOR_CHANGED, record["sensor"])]
+        else:
+            events = []
+        return merge_events(events)
+
+    def _commit(self, record):
+        """
+        Queue a change for the writer thread. Must be called while holding
+        self._lock, right after the change was applied to self.data, so a
+        snapshot never sees a change without its sequence number.
+        """
+        if self._txn is not None:
+            self._txn["records"].append(record)
+            return True
+        if self.persistence == "wal":
+            self._log_seq += 1
+            record["seq"] = self._log_seq
+            self._pending.append(json.dumps(record, separators=(",", ":")))
+        else:
+            self._dirty = True
+        self._writer.mark_dirty()
+        return True
+
+    def _flush_pending(self):
+        """Write queued changes to disk (runs on the writer thread)"""
+        if self.persistence != "wal":
+            with self._lock:
+                dirty, self._dirty = self._dirty, False
+            if dirty and not self._save_data():
+                with self._lock:
+                    self._dirty = True
+                return False
+            return True
+
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if lines:
+            try:
+                if self._log_file is None:
+                    self._log_file = open(self.log_filename, 'a')
+                self._log_file.write("\n".join(lines) + "\n")
+                self._log_file.flush()
+                if self.SYNC_LOG:
+                    os.fsync(self._log_file.fileno())
+                self._log_records += len(lines)
+            except Exception as e:
+                print(f"Error writing log: {e}")
+                with self._lock:
+                    self._pending = lines + self._pending
+                return False
+
+        if self._log_records >= self.COMPACT_AFTER:
+            return self._write_snapshot()
+        return True
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group changes so they are persisted with a single write:
+
+            with db.transaction():
+                db.save_settings(...)
+                db.update_sensor_settings(...)
+
+        Other threads see either none or all of the changes. If the block
+        raises, every change made in it is undone and nothing is written.
+        A nested transaction() joins the outer one.
+        """
+        batch = None
+        with self._lock:
+            if self._txn is not None:
+                yield self
+                return
+
+            self._txn = {"records": [], "undo": [], "saved_series": set()}
+            try:
+                yield self
+            except BaseException:
+                self._rollback()
+                raise
+            else:
+                records = self._txn["records"]
+                self._txn = None
+                if records:
+                    batch = {"op": "batch", "records": records}
+                    self._commit(batch)
+            finally:
+                self._txn = None
+        if batch is not None:
+            self.events.publish(self._events_for(batch))
+
+    def _remember(self, record):
+        """Save what a record is about to change so the transaction can undo it"""
+        undo = self._txn["undo"]
+        op = record["op"]
+        if op == "settings":
+            settings = self.data["settings"]
+            undo.append(("settings", None, {key: settings.get(key, _MISSING)
+                                            for key in record["values"]}))
+        elif op == "sensor_settings":
+            sensor = self.data["sensors"].get(record["sensor"])
+            if sensor is not None:
+                undo.append(("sensor", record["sensor"], {key: sensor.get(key, _MISSING)
+                                                          for key in record["values"]}))
+        elif op in ("reading", "readings"):
+            sensor_ids = record["sensor"] if op == "readings" else [record["sensor"]]
+            for sensor_id in dict.fromkeys(sensor_ids):
+                sensor = self.data["sensors"].get(sensor_id)
+                if sensor is None or sensor_id in self._txn["saved_series"]:
+                    continue
+                # Readings may be merged anywhere in the series, so keep a copy
+                self._txn["saved_series"].add(sensor_id)
+                saved = {key: sensor[key] for key in
+                         ["current_water_level", "current_battery_level", "last_updated"]}
+                saved["readings"] = sensor["readings"].series.copy()
+                undo.append(("series", sensor_id, saved))
+
+    def _rollback(self):
+        """Undo the changes of the open transaction, newest first"""
+        for kind, sensor_id, saved in reversed(self._txn["undo"]):
+            if kind == "settings":
+                target = self.data["settings"]
+            else:
+                target = self.data["sensors"][sensor_id]
+            if kind == "series":
+                target["readings"].series = saved.pop("readings")
+                # Rollups are rebuilt from the restored series on next use
+                self._rollups.pop(sensor_id, None)
+            for key, value in saved.items():
+                if value is _MISSING:
+                    target.pop(key, None)
+                else:
+                    target[key] = value
+
+    def _close_log(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    def flush(self):
+        """Write all changes made so far to disk and wait for it"""
+        return self._writer.flush()
+
+    def close(self):
+        """Flush pending changes and stop the writer thread; False if they could not be written"""
+        flushed = self._writer.close()
+        self._close_log()
+        _open_databases.discard(self)
+        return flushed
+
+    def _apply(self, data, record):
+        """Apply one change record to a data tree (used live and on replay)"""
+        op = record["op"]
+        if op == "reading":
+            sensor = data["sensors"].get(record["sensor"])
+            if sensor is not None:
+                self._apply_reading(record["sensor"], sensor, record.get("water_level"),
+                                    record.get("battery_level"),
+                                    to_epoch(record.get("ts", record.get("time"))))
+        elif op == "readings":
+            self._apply_readings(data, record["sensor"], record["ts"],
+                                 record["water_level"], record["battery_level"])
+        elif op == "batch":
+            for inner in record["records"]:
+                self._apply(data, inner)
+        elif op == "settings":
+            data["settings"].update(record["values"])
+        elif op == "sensor_settings":
+            sensor = data["sensors"].get(record["sensor"])
+            if sensor is not None:
+                for key, value in record["values"].items():
+                    if key not in ["readings", "current_water_level", "current_battery_level", "last_updated"]:
+                        sensor[key] = value
     
     def _create_initial_data(self):
         """Generate initial data structure with sensor info"""
-        sensors = {
-            "Sensor 1": {"name": "Main Tank", "enabled": True, "max_level": 100, "offset": 0},
-            "Sensor 2": {"name": "Reserve Tank", "enabled": True, "max_level": 100, "offset": 0},
-            "Sensor 3": {"name": "Overflow Tank", "enabled": True, "max_level": 100, "offset": 0}
-        }
-        
-        # Generate 7 days of historical data for each sensor
-        now = datetime.now()
-        for sensor_id, sensor in sensors.items():
-            # Create readings array for historical data
-            sensor["readings"] = []
-            
-            # Generate different patterns for each sensor
-            seed = int(sensor_id.split()[-1])
-            np.random.seed(seed)
-            
-            for i in range(7):
-                date = (now - timedelta(days=6-i)).strftime("%Y-%m-%d")
-                # More variation for interesting charts
-                base_level = 50 + seed * 5
-                level = base_level + np.random.normal(0, 5) + i * 2
-                level = max(10, min(95, level))  # Keep within reasonable range
-                
-                # Add a reading for this day
-                sensor["readings"].append({
-                    "date": date,
-                    "water_level": round(level, 1),
-                    "battery_level": round(90 - i * (3 - seed), 1)
-                })
-            
-            # Current readings
-            sensor["current_water_level"] = sensor["readings"][-1]["water_level"]
-            sensor["current_battery_level"] = sensor["readings"][-1]["battery_level"]
-            sensor["last_updated"] = now.strftime("%Y-%m-%d %H:%M:%S")
-        
-        data = {
-            "sensors": sensors,
-            "settings": {
-                "warning_threshold": 75,
-                "critical_threshold": 85,
-                "update_interval": 15  # minutes
-            }
-        }
-        
+        data = database_common.initial_data()
+        self._attach_series(data)
         return data
-    
+
     def get_sensors(self):
         """Return list of all sensor IDs"""
         return list(self.data["sensors"].keys())
@@ -94,6 +547,16 @@ class MockDatabase:
             return self.data["sensors"][sensor_id]
         return None
     
+    def get_snapshot(self):
+        """
+        Config and current values of every sensor plus the settings, in one
+        call. Readings are left out. Used by screens that refresh periodically.
+        """
+        with self._lock:
+            sensors = {sensor_id: {key: value for key, value in sensor.items() if key != "readings"}
+                       for sensor_id, sensor in self.data["sensors"].items()}
+            return {"sensors": sensors, "settings": dict(self.data["settings"])}
+
     def get_current_level(self, sensor_id):
         """Get current water level for a sensor"""
         if sensor_id in self.data["sensors"]:
@@ -106,42 +569,224 @@ class MockDatabase:
             return self.data["sensors"][sensor_id]["current_battery_level"]
         return None
     
-    def get_historical_data(self, sensor_id, days=7):
-        """Get historical readings for a sensor"""
+    def get_historical_data(self, sensor_id, days=7, max_points=None):
+        """
+        Get historical readings for a sensor covering the last `days`
+        calendar days up to and including the day of the newest reading.
+
+        With max_points (e.g. the chart width in pixels) the readings may
+        come from a rollup tier instead; each item then describes a bucket
+        and also carries water_min, water_max and count.
+        """
         if sensor_id in self.data["sensors"]:
-            readings = self.data["sensors"][sensor_id]["readings"]
-            return readings[-days:] if days < len(readings) else readings
+            with self._lock:
+                series = self.data["sensors"][sensor_id]["readings"].series
+                if not len(series):
+                    return []
+                last = float(series.columns(len(series) - 1)[0][0])
+            last_day = datetime.fromtimestamp(last).replace(hour=0, minute=0, second=0, microsecond=0)
+            start = last_day - timedelta(days=days - 1)
+            if max_points is None:
+                return self.get_range(sensor_id, start)
+            return rollup_records(self.get_rollup_arrays(sensor_id, start, None, max_points))
         return []
-    
+
+    def get_rollup_arrays(self, sensor_id, start=None, end=None, max_points=None, resolution=None):
+        """
+        Get water level statistics for start <= ts <= end from the coarsest
+        rollup tier that still has at least max_points buckets (raw readings
+        if none does), or from the tier given as resolution (0 for raw).
+        See RollupPyramid.select for the returned dict.
+        """
+        with self._lock:
+            series, pyramid = self._series_and_rollups(sensor_id)
+            return pyramid.select(series, to_epoch(start), to_epoch(end), max_points, resolution)
+
+    def get_aligned_history(self, sensor_ids, start, end, max_points=None, resolution=None):
+        """
+        Mean water levels of several sensors on one shared time grid, for
+        comparing them. The bucket width is the tier given as resolution,
+        or the coarsest tier with at least max_points buckets in start..end.
+
+        Returns a dict with "resolution", "sensors" (sensor_ids as given),
+        "ts" (bucket starts) and "mean", a len(sensors) x len(ts) array
+        with NaN where a sensor has no readings.
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        if resolution is None:
+            resolution = RollupPyramid.tier_for_span(end - start, max_points or 1)
+        rows, starts, means = [], [], []
+        with self._lock:
+            for row, sensor_id in enumerate(sensor_ids):
+                series, pyramid = self._series_and_rollups(sensor_id)
+                result = pyramid.select(series, start, end, resolution=resolution)
+                rows.append(np.full(len(result["ts"]), row))
+                starts.append(result["ts"])
+                means.append(result["mean"])
+        grid, matrix = align_buckets(np.concatenate(rows or [[]]), np.concatenate(starts or [[]]),
+                                     np.concatenate(means or [[]]), len(sensor_ids),
+                                     start, end, resolution)
+        return {"resolution": resolution, "sensors": list(sensor_ids), "ts": grid, "mean": matrix}
+
+    def _series_and_rollups(self, sensor_id):
+        """A sensor's readings and rollups, building the rollups on first use (lock held)"""
+        sensor = self.data["sensors"].get(sensor_id)
+        series = sensor["readings"].series if sensor else SensorSeries()
+        if sensor is not None and sensor_id not in self._rollups:
+            self._rollups[sensor_id] = RollupPyramid.from_series(series)
+        return series, self._rollups.get(sensor_id, RollupPyramid())
+
+    def get_range(self, sensor_id, start=None, end=None):
+        """
+        Get readings for a sensor with start <= timestamp <= end.
+        start/end may be datetimes, "YYYY-MM-DD[ HH:MM:SS]" strings, epoch
+        seconds or None for an open end. Uses binary search on the time index.
+        """
+        if sensor_id in self.data["sensors"]:
+            with self._lock:
+                readings = self.data["sensors"][sensor_id]["readings"]
+                lo, hi = readings.series.index_range(to_epoch(start), to_epoch(end))
+                return readings[lo:hi]
+        return []
+
+    def get_history_arrays(self, sensor_id, start=None, end=None):
+        """
+        Get (timestamps, water_levels, battery_levels) for a sensor as
+        read-only NumPy views, optionally limited to a time window like
+        get_range(). Timestamps are epoch seconds. No copy is made, so
+        callers must not hold on to them across updates.
+        """
+        if sensor_id in self.data["sensors"]:
+            with self._lock:
+                series = self.data["sensors"][sensor_id]["readings"].series
+                lo, hi = series.index_range(to_epoch(start), to_epoch(end))
+                return series.columns(lo, hi)
+        empty = np.empty(0, dtype=SensorSeries.DTYPE)
+        return empty, empty, empty
+
+    def count_readings(self, sensor_id, start=None, end=None):
+        """Number of readings of a sensor between start and end"""
+        if sensor_id not in self.data["sensors"]:
+            return 0
+        with self._lock:
+            series = self.data["sensors"][sensor_id]["readings"].series
+            lo, hi = series.index_range(to_epoch(start), to_epoch(end))
+            return hi - lo
+
+    def iter_history_arrays(self, sensor_id, start=None, end=None, chunk_size=csv_export.CHUNK_SIZE):
+        """
+        Yield the (timestamps, water_levels, battery_levels) of a time window
+        like get_history_arrays(), at most chunk_size readings at a time.
+        Every chunk is a copy taken under the lock, so readings can keep
+        arriving while the caller works through a long history.
+        """
+        if sensor_id not in self.data["sensors"]:
+            return
+        start = to_epoch(start)
+        end = to_epoch(end)
+        skip = 0  # Readings at start that were already yielded
+        while True:
+            with self._lock:
+                series = self.data["sensors"][sensor_id]["readings"].series
+                lo, hi = series.index_range(start, end)
+                lo = min(lo + skip, hi)
+                ts, water, battery = series.columns(lo, min(hi, lo + chunk_size))
+                chunk = ts.copy(), water.copy(), battery.copy()
+            if not len(chunk[0]):
+                return
+            yield chunk
+            if len(chunk[0]) < chunk_size:
+                return
+            # Go on from the last timestamp, past the readings that have it
+            last = chunk[0][-1]
+            skip = (skip if last == start else 0) + int(np.count_nonzero(chunk[0] == last))
+            start = last
+
     def update_sensor_reading(self, sensor_id, water_level=None, battery_level=None):
         """Update current readings for a sensor"""
         if sensor_id in self.data["sensors"]:
-            sensor = self.data["sensors"][sensor_id]
-            
-            if water_level is not None:
-                sensor["current_water_level"] = water_level
-            
-            if battery_level is not None:
-                sensor["current_battery_level"] = battery_level
-            
-            now = datetime.now()
-            sensor["last_updated"] = now.strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Add to readings if it's a new day
-            today = now.strftime("%Y-%m-%d")
-            if not sensor["readings"] or sensor["readings"][-1]["date"] != today:
-                sensor["readings"].append({
-                    "date": today,
-                    "water_level": sensor["current_water_level"],
-                    "battery_level": sensor["current_battery_level"]
-                })
-                # Keep only last 30 days
-                if len(sensor["readings"]) > 30:
-                    sensor["readings"].pop(0)
-            
-            self._save_data()
+            record = {
+                "op": "reading",
+                "sensor": sensor_id,
+                "ts": datetime.now().timestamp(),
+                "water_level": water_level,
+                "battery_level": battery_level
+            }
+            self._record_change(record)
             return True
         return False
+
+    def update_sensor_readings(self, batch):
+        """
+        Store many readings with a single persist.
+
+        batch is an iterable of (sensor_id, ts, water_level, battery_level)
+        tuples; ts may be a datetime, a time string, epoch seconds or None
+        for now. Rows are validated together and invalid rows are skipped.
+
+        Returns (accepted_count, rejects) where rejects is a list of
+        (row_index, reason).
+        """
+        accepted, rejects = validate_batch(batch, self.data["sensors"], self.LEVEL_RANGE)
+        sensor_ids, ts, water, battery = accepted
+        if not len(ts):
+            return 0, rejects
+
+        record = {
+            "op": "readings",
+            "sensor": sensor_ids.tolist(),
+            "ts": ts.tolist(),
+            "water_level": water.tolist(),
+            "battery_level": battery.tolist()
+        }
+        self._record_change(record)
+        return len(ts), rejects
+
+    def _apply_readings(self, data, sensor_ids, ts, water_levels, battery_levels):
+        """Add a batch of readings, grouped per sensor"""
+        sensor_ids = np.asarray(sensor_ids, dtype=object)
+        ts = np.asarray(ts, dtype=np.float64)
+        water_levels = np.asarray(water_levels, dtype=np.float64)
+        battery_levels = np.asarray(battery_levels, dtype=np.float64)
+
+        for sensor_id in dict.fromkeys(sensor_ids.tolist()):
+            sensor = data["sensors"].get(sensor_id)
+            if sensor is None:
+                continue
+            rows = sensor_ids == sensor_id
+            series = sensor["readings"].series
+            previous_last = series.columns(len(series) - 1)[0][0] if len(series) else None
+            series.extend(ts[rows], water_levels[rows], battery_levels[rows])
+            if sensor_id in self._rollups:
+                self._rollups[sensor_id].add(ts[rows], water_levels[rows], battery_levels[rows])
+
+            newest = int(np.argmax(ts[rows]))
+            newest_ts = ts[rows][newest]
+            if previous_last is None or newest_ts >= previous_last:
+                sensor["current_water_level"] = float(water_levels[rows][newest])
+                sensor["current_battery_level"] = float(battery_levels[rows][newest])
+                sensor["last_updated"] = datetime.fromtimestamp(newest_ts).strftime("%Y-%m-%d %H:%M:%S")
+
+    def _apply_reading(self, sensor_id, sensor, water_level, battery_level, ts):
+        """Update current values and add a timestamped reading to the history"""
+        series = sensor["readings"].series
+        is_latest = not len(series) or ts >= series.columns(len(series) - 1)[0][0]
+
+        if water_level is None:
+            water_level = sensor["current_water_level"]
+        if battery_level is None:
+            battery_level = sensor["current_battery_level"]
+
+        series.insert(ts, water_level, battery_level)
+        if sensor_id in self._rollups:
+            self._rollups[sensor_id].add([ts], [water_level], [battery_level])
+
+        # A late (out-of-order) reading goes into history but does not
+        # replace the current values
+        if is_latest:
+            sensor["current_water_level"] = water_level
+            sensor["current_battery_level"] = battery_level
+            sensor["last_updated"] = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
     
     def get_settings(self):
         """Get application settings"""
@@ -150,58 +795,33 @@ class MockDatabase:
     def save_settings(self, settings):
         """Save application settings"""
         # Update only the keys that exist in the settings parameter
-        for key, value in settings.items():
-            self.data["settings"][key] = value
-        
-        success = self._save_data()
+        record = {"op": "settings", "values": dict(settings)}
+        success = self._record_change(record)
         return success
     
     def update_sensor_settings(self, sensor_id, settings_dict):
         """Update settings for a specific sensor"""
         if sensor_id in self.data["sensors"]:
             # Update sensor settings without changing readings
-            for key, value in settings_dict.items():
-                if key not in ["readings", "current_water_level", "current_battery_level", "last_updated"]:
-                    self.data["sensors"][sensor_id][key] = value
-            
-            self._save_data()
-            return True
+            record = {"op": "sensor_settings", "sensor": sensor_id, "values": dict(settings_dict)}
+            return self._record_change(record)
         return False
     
-    def export_to_csv(self, filename=None):
-        """Export all sensor data to a CSV file"""
-        if not filename:
-            filename = f"water_level_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        try:
-            with open(filename, 'w') as f:
-                # Write header
-                f.write("Sensor,Date,Water Level (%),Battery Level (%)\n")
-                
-                # Write data for each sensor
-                for sensor_id in self.get_sensors():
-                    sensor_data = self.get_sensor_data(sensor_id)
-                    sensor_name = sensor_data.get("name", sensor_id)
-                    
-                    for reading in sensor_data["readings"]:
-                        f.write(f"{sensor_name},{reading['date']},{reading['water_level']},{reading['battery_level']}\n")
-            
-            return True
-        except Exception as e:
-            print(f"Error exporting to CSV: {e}")
-            return False
+    def open_alarm_journal(self):
+        """Alarm event journal kept next to the readings, in HISTORY_DIR"""
+        from alarm_journal import AlarmJournal
+        return AlarmJournal(os.path.join(self.HISTORY_DIR, AlarmJournal.FILENAME))
+
+    def export_to_csv(self, filename=None, sensor_ids=None, start=None, end=None,
+                      progress=None, cancelled=None):
+        """Export sensor data to a CSV file, see database_common.export_to_csv()"""
+        return database_common.export_to_csv(self, filename, sensor_ids, start, end,
+                                             progress, cancelled)
+
+    def export_to_json(self, filename=None):
+        """Export settings and all sensor data as human-readable JSON"""
+        return database_common.export_to_json(self, filename)
     
     def simulate_update(self):
-        """Simulate data update for all sensors"""
-        for sensor_id in self.get_sensors():
-            sensor = self.get_sensor_data(sensor_id)
-            if sensor["enabled"]:
-                # Small random change to water level
-                water_change = random.uniform(-2, 2)
-                new_water = max(10, min(95, sensor["current_water_level"] + water_change))
-                
-                # Small decrease in battery
-                new_battery = max(0, sensor["current_battery_level"] - random.uniform(0, 0.1))
-                
-                self.update_sensor_reading(sensor_id, new_water, new_battery)
-        return True
\ No newline at end of file
+        """Simulate data update for all sensors, stored as one batch"""
+        return database_common.simulate_update(self)
@@ -0,0 +1,230 @@
+# rollups.py
+from datetime import datetime
+import numpy as np
+from time_series import local_midnights
+
+DAY = 86400
+
+
+def bucket_starts(ts, width):
+    """
+    Start of the bucket of each epoch time in ts. Day buckets start at local
+    midnight, like the dates on the charts and in exports (so a day with a
+    DST change is 23 or 25 hours long); other widths are aligned to UTC.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    if width == DAY:
+        return local_midnights(ts)
+    return np.floor(ts / width) * width
+
+
+class RollupTier:
+    """
+    Water level min/mean/max/count (and mean battery level) per fixed-width
+    time bucket (see bucket_starts() for alignment). Buckets are kept sorted by start time in
+    growable arrays.
+    """
+
+    FIELDS = ("start", "count", "water_sum", "water_min", "water_max", "battery_sum")
+
+    def __init__(self, name, width):
+        self.name = name
+        self.width = width
+        self._size = 0
+        self._columns = {field: np.empty(16, dtype=np.float64) for field in self.FIELDS}
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, needed):
+        capacity = len(self._columns["start"])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for field, old in self._columns.items():
+            new = np.empty(capacity, dtype=np.float64)
+            new[:self._size] = old[:self._size]
+            self._columns[field] = new
+
+    def add(self, ts, water_level, battery_level):
+        """Fold readings (arrays, any order) into their buckets"""
+        ts = np.asarray(ts, dtype=np.float64)
+        if not len(ts):
+            return
+        keys = bucket_starts(ts, self.width)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        water_level = np.asarray(water_level, dtype=np.float64)[order]
+        battery_level = np.asarray(battery_level, dtype=np.float64)[order]
+
+        # Aggregate the new readings per bucket
+        starts, first = np.unique(keys, return_index=True)
+        incoming = {
+            "start": starts,
+            "count": np.diff(np.append(first, len(keys))).astype(np.float64),
+            "water_sum": np.add.reduceat(water_level, first),
+            "water_min": np.minimum.reduceat(water_level, first),
+            "water_max": np.maximum.reduceat(water_level, first),
+            "battery_sum": np.add.reduceat(battery_level, first),
+        }
+
+        # Merge into buckets that already exist
+        cols = self._columns
+        size = self._size
+        pos = np.searchsorted(cols["start"][:size], starts)
+        exists = pos < size
+        exists[exists] = cols["start"][pos[exists]] == starts[exists]
+        hit = pos[exists]
+        cols["count"][hit] += incoming["count"][exists]
+        cols["water_sum"][hit] += incoming["water_sum"][exists]
+        cols["battery_sum"][hit] += incoming["battery_sum"][exists]
+        cols["water_min"][hit] = np.minimum(cols["water_min"][hit], incoming["water_min"][exists])
+        cols["water_max"][hit] = np.maximum(cols["water_max"][hit], incoming["water_max"][exists])
+
+        # Add new buckets; in the common case they all come after the last one
+        new = ~exists
+        added = int(new.sum())
+        if not added:
+            return
+        self._grow(size + added)
+        cols = self._columns
+        if size == 0 or starts[new][0] > cols["start"][size - 1]:
+            for field in self.FIELDS:
+                cols[field][size:size + added] = incoming[field][new]
+        else:
+            merged = np.concatenate((cols["start"][:size], starts[new]))
+            order = np.argsort(merged, kind="stable")
+            for field in self.FIELDS:
+                values = np.concatenate((cols[field][:size], incoming[field][new]))
+                cols[field][:size + added] = values[order]
+        self._size = size + added
+
+    def index_range(self, start=None, end=None):
+        """Rows [lo:hi] of the buckets overlapping start <= ts <= end"""
+        starts = self._columns["start"][:self._size]
+        lo = 0 if start is None else int(np.searchsorted(starts, bucket_starts([start], self.width)[0]))
+        hi = self._size if end is None else int(np.searchsorted(starts, end, side="right"))
+        return lo, max(lo, hi)
+
+    def arrays(self, lo, hi):
+        """Bucket statistics for rows [lo:hi] as a dict of new arrays"""
+        cols = {field: column[lo:hi] for field, column in self._columns.items()}
+        return {
+            "ts": cols["start"].copy(),
+            "mean": cols["water_sum"] / cols["count"],
+            "min": cols["water_min"].copy(),
+            "max": cols["water_max"].copy(),
+            "count": cols["count"].astype(np.int64),
+            "battery": cols["battery_sum"] / cols["count"],
+        }
+
+
+class RollupPyramid:
+    """
+    Per-minute, hourly and daily rollups of one sensor's readings, updated
+    incrementally as readings arrive. select() picks the coarsest tier that
+    still has at least max_points buckets in the requested window.
+    """
+
+    TIERS = (("minute", 60), ("hour", 3600), ("day", DAY))
+
+    def __init__(self):
+        self.tiers = [RollupTier(name, width) for name, width in self.TIERS]
+
+    @classmethod
+    def from_series(cls, series):
+        pyramid = cls()
+        pyramid.add(*series.columns())
+        return pyramid
+
+    @classmethod
+    def tier_for_span(cls, span, points, fallback=None):
+        """
+        Width of the coarsest tier that has at least `points` buckets in
+        `span` seconds. If none has that many: fallback (0 for raw
+        readings), or the finest tier when fallback is None.
+        """
+        width = cls.TIERS[0][1] if fallback is None else fallback
+        for _, tier_width in cls.TIERS:
+            if span / tier_width >= points:
+                width = tier_width
+        return width
+
+    def add(self, ts, water_level, battery_level):
+        for tier in self.tiers:
+            tier.add(ts, water_level, battery_level)
+
+    def select(self, series, start=None, end=None, max_points=None, resolution=None):
+        """
+        Return history for start <= ts <= end as a dict with "resolution"
+        (bucket width in seconds, 0 for raw readings) and arrays "ts",
+        "mean", "min", "max", "count" and "battery".
+        A resolution (0 or a tier width) picks the tier instead of max_points.
+        """
+        lo, hi = series.index_range(start, end)
+        if resolution:
+            for tier in self.tiers:
+                if tier.width == resolution:
+                    tier_lo, tier_hi = tier.index_range(start, end)
+                    return dict(tier.arrays(tier_lo, tier_hi), resolution=tier.width)
+            raise ValueError(f"No rollup tier with resolution {resolution}")
+        if max_points is not None and resolution is None and hi - lo > max_points:
+            for tier in reversed(self.tiers):
+                tier_lo, tier_hi = tier.index_range(start, end)
+                if tier_hi - tier_lo >= max_points:
+                    return dict(tier.arrays(tier_lo, tier_hi), resolution=tier.width)
+
+        ts, water, battery = series.columns(lo, hi)
+        return {
+            "resolution": 0,
+            "ts": ts.copy(),
+            "mean": water.copy(),
+            "min": water.copy(),
+            "max": water.copy(),
+            "count": np.ones(len(ts), dtype=np.int64),
+            "battery": battery.copy(),
+        }
+
+
+def align_buckets(rows, starts, values, row_count, start, end, width):
+    """
+    Place bucket values of several sensors on one shared time grid.
+
+    rows, starts and values are parallel arrays: the sensor's row number,
+    the bucket start and its value. Returns (grid, matrix) where grid holds
+    the starts of all buckets overlapping start..end and matrix has one row
+    per sensor, NaN where that sensor has no bucket.
+    """
+    first, last = bucket_starts([start, end], width)
+    # One time inside each bucket; a day is 23 to 25 hours, so midday is
+    # inside it even though days are not exactly `width` apart
+    grid = np.unique(bucket_starts(np.arange(first + width / 2, last + width, width), width))
+    grid = grid[grid <= last]
+    matrix = np.full((row_count, len(grid)), np.nan)
+    starts = np.asarray(starts, dtype=np.float64)
+    columns = np.minimum(np.searchsorted(grid, starts), max(len(grid) - 1, 0))
+    inside = np.zeros(len(starts), dtype=bool)
+    if len(grid):
+        inside = grid[columns] == starts
+    matrix[np.asarray(rows, dtype=np.int64)[inside], columns[inside]] = np.asarray(values)[inside]
+    return grid, matrix
+
+
+def rollup_records(result):
+    """Turn a RollupPyramid.select() result into a list of reading dicts"""
+    records = []
+    for ts, mean, low, high, count, battery in zip(
+            result["ts"].tolist(), result["mean"].tolist(), result["min"].tolist(),
+            result["max"].tolist(), result["count"].tolist(), result["battery"].tolist()):
+        moment = datetime.fromtimestamp(ts)
+        records.append({
+            "date": moment.strftime("%Y-%m-%d"),
+            "timestamp": moment.strftime("%Y-%m-%d %H:%M:%S"),
+            "water_level": mean,
+            "water_min": low,
+            "water_max": high,
+            "count": count,
+            "battery_level": battery
+        })
+    return records
@@ -2,22 +2,52 @@
 from PyQt5.QtWidgets import QFrame, QLabel, QVBoxLayout, QSizePolicy, QGraphicsDropShadowEffect
 from PyQt5.QtGui import QFont, QColor, QCursor
 from PyQt5.QtCore import Qt
-from sensor_detail import SensorDetail
+from sparkline_chart import SparklineChart
+from db_events import DatabaseEvents
+from alarm_engine import AlarmEngine
+from change_events import READINGS_ADDED
+from time_series import to_epoch
+from ui_styles import install_style, set_style_state, format_duration
 
 class SensorCard(QFrame):
+    # Installed once in the application stylesheet for every card. The
+    # status property selects the colors, so a status change only
+    # re-polishes the card and its label.
+    STYLE = """
+        SensorCard {
+            background-color: white;
+            border-radius: 12px;
+        }
+        SensorCard[status="Normal"] { background-color: #A8D3EF; }
+        SensorCard[status="Warning"] { background-color: #FFF3CD; }
+        SensorCard[status="Critical"] { background-color: #F8D7DA; }
+        SensorCard:hover { background-color: #e0f7fa; }
+        SensorCard QLabel { background: transparent; }
+        SensorCard QLabel#description { color: #555; }
+        SensorCard QLabel#status { font-weight: bold; }
+        SensorCard QLabel#status[status="Normal"] { color: green; }
+        SensorCard QLabel#status[status="Warning"] { color: orange; }
+        SensorCard QLabel#status[status="Critical"] { color: red; }
+    """
+
+    SPARKLINE_SPAN = 24 * 3600  # Seconds of history in the sparkline
+
     def __init__(self, title, dashboard, db=None):
         super().__init__()
         self.dashboard = dashboard
         self.title = title
         self.db = db
+        # The card shows the alarm engine's state; it does no threshold checks
+        self.alarms = AlarmEngine.for_database(db) if db else None
 
         self.setFrameShape(QFrame.NoFrame)
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         self.setFixedSize(250, 200)
         self.setCursor(QCursor(Qt.PointingHandCursor))
 
-        # Standard bakgrund (vit), kan ändras senare
-        self.background_color = "white"
+        # Standard bakgrund (vit) tills status är känd
+        self.setProperty("status", "")
+        install_style(self.STYLE)
 
         # Ladda sensorinfo och avgör bakgrund
         self.init_ui()
@@ -42,64 +72,126 @@ class SensorCard(QFrame):
         layout.addWidget(title_label)
 
         # Beskrivning
-        description = ""
-        if self.db:
-            sensor_data = self.db.get_sensor_data(self.title)
-            description = f"Monitors water level in {sensor_data.get('name', 'tank')}" if sensor_data else ""
-        desc_label = QLabel(description)
-        desc_label.setStyleSheet("color: #555;")
-        desc_label.setWordWrap(True)
-        layout.addWidget(desc_label)
+        self.desc_label = QLabel("")
+        self.desc_label.setObjectName("description")
+        self.desc_label.setWordWrap(True)
+        layout.addWidget(self.desc_label)
+
+        # Status-rad och vattennivå, dolda tills det finns en mätning
+        self.status_label = QLabel()
+        self.status_label.setObjectName("status")
+        self.status_label.setProperty("status", "")
+        self.status_label.hide()
+        layout.addWidget(self.status_label)
+        self.level_label = QLabel()
+        self.level_label.hide()
+        layout.addWidget(self.level_label)
+
+        layout.addStretch()
 
-        # Status
-        status_color = None
+        # Senaste dygnets nivåer, dold tills det finns mätningar
+        self.sparkline = SparklineChart(compact=True)
+        self.sparkline.setFixedHeight(40)
+        self.sparkline.hide()
+        layout.addWidget(self.sparkline)
 
+        # What the labels currently show, so updates can skip unchanged ones
+        self._shown = {}
         if self.db:
             sensor_data = self.db.get_sensor_data(self.title)
-            settings = self.db.get_settings()
-
-            if sensor_data and settings:
-                water_level = sensor_data.get("current_water_level", None)
-                if water_level is not None:
-                    critical_threshold = settings.get("critical_threshold", 100.0)
-                    warning_threshold = settings.get("warning_threshold", 80.0)
-
-                    if water_level >= critical_threshold:
-                        status_text = "Critical"
-                        status_color = "red"
-                        self.background_color = "#F8D7DA"  # ljusröd
-                    elif water_level >= warning_threshold:
-                        status_text = "Warning"
-                        status_color = "orange"
-                        self.background_color = "#FFF3CD"  # ljusorange
-                    else:
-                        status_text = "Normal"
-                        status_color = "green"
-                        self.background_color = "#A8D3EF"
-
-                    # Status-rad
-                    status_label = QLabel(f"Status: {status_text}")
-                    status_label.setStyleSheet(f"color: {status_color}; font-weight: bold;")
-                    layout.addWidget(status_label)
-
-                    # Vattennivå
-                    level_label = QLabel(f"Water Level: {water_level:.1f}%")
-                    layout.addWidget(level_label)
-
-        # Ställ in slutgiltig bakgrund
-        self.setStyleSheet(f"""
-            QFrame {{
-                background-color: {self.background_color};
-                border-radius: 12px;
-            }}
-            QFrame:hover {{
-                background-color: #e0f7fa;
-            }}
-        """)
-
-        layout.addStretch()
+            self.update_from(sensor_data)
+            self.update_sparkline(sensor_data)
+            # Follow new readings and config for this sensor, and settings changes
+            DatabaseEvents.for_database(self.db).subscribe(
+                self.on_changes, sensor_ids=[self.title], owner=self)
+        else:
+            self.update_from(None)
+
+    def on_changes(self, events):
+        """The sensor or the settings changed in the database"""
+        sensor_data = self.db.get_sensor_data(self.title)
+        self.update_from(sensor_data)
+        if any(event.kind == READINGS_ADDED for event in events):
+            self.update_sparkline(sensor_data, force=True)
+
+    def update_from(self, sensor_data):
+        """
+        Show new sensor values and the alarm engine's status. Only labels
+        whose text changed are touched, and stylesheets are set only when
+        the status changes. Returns True if anything on the card changed.
+        """
+        description = f"Monitors water level in {sensor_data.get('name', 'tank')}" if sensor_data else ""
+
+        status_text = None
+        forecast = ""
+        water_level = sensor_data.get("current_water_level") if sensor_data and self.alarms else None
+        if water_level is not None:
+            status_text, _ = self.alarms.state(self.title)
+            self.sparkline.set_thresholds(*self.alarms.thresholds(self.title))
+            eta = self.alarms.time_to_threshold(self.title)
+            if eta:
+                forecast = format_duration(eta)
+        level_text = f"Water Level: {water_level:.1f}%" if water_level is not None else ""
+
+        changed = False
+        if self._changed("description", description):
+            self.desc_label.setText(description)
+            changed = True
+        if self._changed("level", level_text):
+            self.level_label.setText(level_text)
+            self.level_label.setVisible(water_level is not None)
+            changed = True
+        if self._changed("forecast", forecast):
+            # Beräknad tid till kritisk nivå, i kurvans hörn
+            self.sparkline.set_note(f"↑ {forecast}" if forecast else "")
+            self.sparkline.setToolTip(f"Expected to reach the critical level in {forecast}" if forecast else "")
+            changed = True
+        if self._changed("status", status_text):
+            self.apply_status(status_text)
+            changed = True
+        return changed
+
+    def update_sparkline(self, sensor_data, force=False):
+        """
+        Show the last SPARKLINE_SPAN seconds up to the newest reading.
+        Without force the history is only read again if the newest
+        reading changed.
+        """
+        newest = to_epoch(sensor_data.get("last_updated")) if sensor_data else None
+        if not self.db or newest is None:
+            return
+        if not self._changed("sparkline", newest) and not force:
+            return
+        history = self.db.get_rollup_arrays(self.title, newest - self.SPARKLINE_SPAN, newest,
+                                            max_points=max(self.sparkline.width(), 100))
+        self.sparkline.set_series(history["ts"], history["mean"])
+        self.sparkline.setVisible(len(history["ts"]) > 0)
+
+    def _changed(self, key, value):
+        """Remember value under key; True if it differs from what is shown"""
+        if key in self._shown and self._shown[key] == value:
+            return False
+        self._shown[key] = value
+        return True
+
+    def apply_status(self, status_text):
+        """Restyle the card for a new status (None: no reading yet)"""
+        if status_text is not None:
+            self.status_label.setText(f"Status: {status_text}")
+        self.status_label.setVisible(status_text is not None)
+
+        # Ställ in bakgrund och statusfärg
+        set_style_state(self, "status", status_text or "")
+        set_style_state(self.status_label, "status", status_text or "")
 
     def mousePressEvent(self, event):
+        # Imported on first use (normally already preloaded by the dashboard)
+        from sensor_detail import SensorDetail
         self.dashboard.hide()
         self.detail_window = SensorDetail(self.title, self.dashboard, self.db)
+        self.detail_window.destroyed.connect(self.detail_closed)
         self.detail_window.show()
+
+    def detail_closed(self):
+        """The detail window deletes itself on close; drop the reference"""
+        self.detail_window = None
@@ -1,16 +1,32 @@
 # .\sensor_detail.py
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QFrame
 from PyQt5.QtGui import QPalette, QColor, QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
+from datetime import datetime, timedelta
 from battery_monitor import BatteryMonitor
-from water_level_chart import WaterLevelChart
+from sparkline_chart import SparklineChart
+from history_tiles import HistoryTiles
+from rollups import RollupPyramid
+from time_series import to_epoch
 from alarm_system import AlarmSystem
+from alarm_engine import AlarmEngine
+from ui_styles import set_text, format_duration
+from db_events import DatabaseEvents
+from change_events import READINGS_ADDED, SENSOR_CHANGED, SETTINGS_CHANGED
 
 class SensorDetail(QWidget):
     """
     Detailed view of a single sensor showing current readings,
     alarm status, battery level, and historical data.
+
+    The history chart can be zoomed and panned. After the view settles the
+    visible range (plus half a view on each side) is fetched from the
+    database at a resolution matching the chart width, through a tile
+    cache so ranges already seen are not queried again.
     """
+
+    HISTORY_DELAY = 150  # ms of view stillness before history is fetched
+    RANGES = [("Day", 1), ("Week", 7), ("Month", 30), ("Year", 365)]
     def __init__(self, sensor_name, dashboard_window, db=None):
         super().__init__()
         self.dashboard_window = dashboard_window
@@ -18,6 +34,8 @@ class SensorDetail(QWidget):
         self.db = db  # Store database reference
 
         self.setWindowTitle(f"{sensor_name} - Details")
+        # Deleted on close, which also ends its change subscription
+        self.setAttribute(Qt.WA_DeleteOnClose)
         self.showFullScreen()
 
         # Set background color
@@ -61,19 +79,24 @@ class SensorDetail(QWidget):
         alarm_label.setAlignment(Qt.AlignCenter)
         main_layout.addWidget(alarm_label)
         
-        # Get alarm threshold settings from database
-        warning_threshold = 75 
-        critical_threshold = 85
+        # With a database the alarm state comes from its alarm engine,
+        # which evaluates every sensor whether or not this view is open
+        high_fidelity = False
         if self.db:
+            self.alarm_system = AlarmSystem(engine=AlarmEngine.for_database(self.db))
             settings = self.db.get_settings()
             if settings:
-                warning_threshold = settings.get("warning_threshold", warning_threshold)
-                critical_threshold = settings.get("critical_threshold", critical_threshold)
-        
-        self.alarm_system = AlarmSystem()
-        self.alarm_system.set_thresholds(warning_threshold, critical_threshold)
+                high_fidelity = settings.get("high_fidelity_charts", False)
+        else:
+            self.alarm_system = AlarmSystem()
+        warning_threshold, critical_threshold = self.alarm_system.engine.thresholds(self.sensor_name)
         main_layout.addWidget(self.alarm_system)
 
+        # Trend and expected time to the critical level
+        self.trend_label = QLabel()
+        self.trend_label.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(self.trend_label)
+
         # Current readings section (water level & battery)
         info_section_layout = QHBoxLayout()
         
@@ -131,52 +154,160 @@ class SensorDetail(QWidget):
         main_layout.addLayout(info_section_layout)
 
         # History chart
-        chart_label = QLabel("Water Level History (Last 7 Days)")
+        chart_header = QHBoxLayout()
+        chart_label = QLabel("Water Level History")
         chart_label.setFont(QFont("Arial", 14, QFont.Bold))
-        chart_label.setAlignment(Qt.AlignCenter)
-        main_layout.addWidget(chart_label)
+        chart_header.addWidget(chart_label)
+        hint_label = QLabel("Scroll to zoom, drag to pan")
+        chart_header.addWidget(hint_label)
+        chart_header.addStretch()
+        for name, days in self.RANGES:
+            range_btn = QPushButton(name)
+            range_btn.setFixedSize(80, 32)
+            range_btn.setStyleSheet("""
+                QPushButton {
+                    background-color: #A8D3EF; color: black;
+                    border: 1px solid #ccc; border-radius: 5px;
+                    font-weight: bold;
+                }
+                QPushButton:hover { background-color: #f0f0f0; }
+            """)
+            range_btn.clicked.connect(lambda checked, days=days: self.show_last_days(days))
+            chart_header.addWidget(range_btn)
+        main_layout.addLayout(chart_header)
 
         # Create the chart and update with data if available
-        self.water_chart = WaterLevelChart()
+        self.water_chart = self.create_chart(high_fidelity)
         # Set chart thresholds to match alarm thresholds
         self.water_chart.warning_threshold = warning_threshold
         self.water_chart.critical_threshold = critical_threshold
-        
-        if self.db and self.sensor_name:
-            # Get historical data for chart
-            historical_data = self.db.get_historical_data(self.sensor_name)
-            if historical_data:
-                # Use real data if available
-                self.water_chart.update_chart_with_data(historical_data)
-            else:
-                # Try to extract sensor ID for chart data
-                sensor_id_for_chart = None
-                parts = self.sensor_name.split()
-                if parts and parts[-1].isdigit():
-                    try:
-                        sensor_id_for_chart = int(parts[-1])
-                    except ValueError:
-                        pass
-                self.water_chart.update_chart(sensor_id_for_chart)
-        else:
-            # Use placeholder data with sensor ID if possible
-            sensor_id_for_chart = None
-            if self.sensor_name:
-                parts = self.sensor_name.split()
-                if parts and parts[-1].isdigit():
-                    try:
-                        sensor_id_for_chart = int(parts[-1])
-                    except ValueError:
-                        pass
-            self.water_chart.update_chart(sensor_id_for_chart)
-            
+
+        # History is loaded lazily once zooming or panning has paused
+        self.history = None
+        self.history_timer = QTimer(self)
+        self.history_timer.setSingleShot(True)
+        self.history_timer.setInterval(self.HISTORY_DELAY)
+        self.history_timer.timeout.connect(self.load_visible_history)
+
+        if not self.show_history():
+            # No readings yet: an empty chart rather than made-up levels
+            self.water_chart.set_series([], [], 'Water Level - Past 7 Days')
+
         self.water_chart.setMinimumHeight(300)
         main_layout.addWidget(self.water_chart)
 
         main_layout.addStretch()
 
-        # Check alarm with current water level
-        self.alarm_system.check_water_level(self.sensor_name, current_water_level)
+        # Show the alarm state (placeholder level without a database)
+        if self.db:
+            self.alarm_system.show_sensor(self.sensor_name)
+            self.show_trend()
+        else:
+            self.alarm_system.check_water_level(self.sensor_name, current_water_level)
+
+        # Follow new readings for this sensor and threshold changes
+        if self.db:
+            DatabaseEvents.for_database(self.db).subscribe(
+                self.on_changes, sensor_ids=[self.sensor_name],
+                kinds=[READINGS_ADDED, SENSOR_CHANGED, SETTINGS_CHANGED], owner=self)
+
+    def on_changes(self, events):
+        """New readings or settings in the database: update what they affect"""
+        kinds = {event.kind for event in events}
+        if SETTINGS_CHANGED in kinds or SENSOR_CHANGED in kinds:
+            warning_threshold, critical_threshold = self.alarm_system.engine.thresholds(self.sensor_name)
+            self.water_chart.warning_threshold = warning_threshold
+            self.water_chart.critical_threshold = critical_threshold
+
+        sensor_data = self.db.get_sensor_data(self.sensor_name)
+        if not sensor_data:
+            return
+        current_water_level = sensor_data.get("current_water_level")
+        if READINGS_ADDED in kinds:
+            self.water_value.setText(f"{current_water_level:.1f}%")
+            if sensor_data.get("current_battery_level") is not None:
+                self.battery_monitor.set_level(sensor_data["current_battery_level"])
+
+        # The chart shows both the readings and the threshold lines
+        if self.history is None:
+            self.show_history()
+        else:
+            if READINGS_ADDED in kinds:
+                self.history.invalidate_open()
+            self.history_timer.start()
+        self.alarm_system.show_sensor(self.sensor_name)
+        self.show_trend()
+
+    def show_trend(self):
+        """Show the level trend and when it reaches the critical level"""
+        engine = self.alarm_system.engine
+        rate = engine.trend(self.sensor_name)
+        if rate is None:
+            text = "Trend: not enough readings yet"
+        else:
+            text = f"Trend: {rate:+.1f}%/h"
+            eta = engine.time_to_threshold(self.sensor_name)
+            if eta:
+                text += f", critical level in about {format_duration(eta)}"
+        set_text(self.trend_label, text)
+
+    @staticmethod
+    def create_chart(high_fidelity=False):
+        """
+        The history chart: the QPainter chart, or with high_fidelity the
+        matplotlib chart if matplotlib is installed
+        """
+        if high_fidelity:
+            try:
+                # Imported here: matplotlib is slow to load and optional
+                from water_level_chart import WaterLevelChart
+                return WaterLevelChart()
+            except ImportError as e:
+                print(f"Error loading matplotlib chart, using the basic chart: {e}")
+        return SparklineChart()
+
+    def show_history(self):
+        """
+        Switch the chart to the interactive history view, starting with the
+        last 7 days up to the newest reading. Returns False if the sensor
+        has no readings yet.
+        """
+        if not (self.db and self.sensor_name) or self.history_end() is None:
+            return False
+
+        self.history = HistoryTiles(self.db, self.sensor_name)
+        self.water_chart.enable_navigation()
+        self.water_chart.view_changed.connect(lambda start, end: self.history_timer.start())
+        self.show_last_days(7)
+        return True
+
+    def history_end(self):
+        """End of the newest reading's local day in epoch seconds, or None"""
+        sensor_data = self.db.get_sensor_data(self.sensor_name) or {}
+        newest = to_epoch(sensor_data.get("last_updated"))
+        if newest is None:
+            return None
+        day = datetime.fromtimestamp(newest).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (day + timedelta(days=1)).timestamp()
+
+    def show_last_days(self, days):
+        """Show `days` days up to the end of the newest reading's day"""
+        if self.history is None:
+            return
+        end = self.history_end()
+        self.water_chart.set_view(end - days * 86400, end)
+        self.history_timer.stop()
+        self.load_visible_history()
+
+    def load_visible_history(self):
+        """Fetch and show the history around the visible range"""
+        start, end = self.water_chart.view_range()
+        span = end - start
+        points = max(self.water_chart.width(), 200)
+        # Raw readings when even the minute tier would be too coarse
+        resolution = RollupPyramid.tier_for_span(span, points, fallback=0)
+        ts, levels = self.history.get(start - span / 2, end + span / 2, resolution)
+        self.water_chart.set_series(ts, levels, "Water Level History", keep_view=True)
 
     def go_back(self):
         """Returns to the dashboard view"""
@@ -1,10 +1,44 @@
 # .\settings_screen.py
+import time
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
                              QSpinBox, QComboBox, QFormLayout, QTabWidget,
-                             QCheckBox, QMessageBox, QFileDialog)
+                             QCheckBox, QMessageBox, QFileDialog, QProgressBar)
 from PyQt5.QtGui import QFont, QPalette, QColor
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal, QThread
 from PyQt5.QtWidgets import QGraphicsDropShadowEffect
+import csv_export
+
+
+class CsvExportThread(QThread):
+    """
+    Runs csv_export.export_csv() off the GUI thread. progress and done are
+    delivered to the GUI thread as queued signals; cancel() stops the
+    export before its next chunk.
+    """
+
+    progress = pyqtSignal(int, int)   # Rows written, rows in total
+    done = pyqtSignal(object, str)    # Rows written or None if cancelled, error message
+
+    def __init__(self, db, filename, sensor_ids=None, start=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.filename = filename
+        self.sensor_ids = sensor_ids
+        self.since = start  # self.start is QThread.start()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            rows = csv_export.export_csv(self.db, self.filename, self.sensor_ids, self.since,
+                                         progress=self.progress.emit,
+                                         cancelled=lambda: self._cancelled)
+            self.done.emit(rows, "")
+        except Exception as e:
+            print(f"Error exporting to CSV: {e}")
+            self.done.emit(None, str(e))
 
 
 class SettingsScreen(QWidget):
@@ -15,10 +49,14 @@ class SettingsScreen(QWidget):
     # Signal when screen is closed
     closed = pyqtSignal()
 
+    EXPORT_RANGES = [("All data", None), ("Last day", 1), ("Last week", 7),
+                     ("Last month", 30), ("Last year", 365)]
+
     def __init__(self, parent=None, db=None):
         super().__init__(parent)
         self.parent_window = parent
         self.db = db  # Add database reference
+        self.export_thread = None  # Running CSV export
         self.setWindowTitle("Settings")
         
         # Set background color
@@ -31,8 +69,13 @@ class SettingsScreen(QWidget):
         self.settings = {
             "warning_threshold": 75,
             "critical_threshold": 85,
+            "alarm_deadband": 2,    # percentage points
+            "alarm_dwell": 0,       # seconds
+            "rise_rate_alarm": 0,   # %/h, 0 = off
+            "critical_forecast": 0, # minutes, 0 = off
             "update_interval": 15,  # minutes
             "fullscreen": True,
+            "high_fidelity_charts": False,
             "sensors": {
                 "Sensor 1": {"enabled": True, "max_level": 100, "offset": 0},
                 "Sensor 2": {"enabled": True, "max_level": 100, "offset": 0},
@@ -74,10 +117,10 @@ class SettingsScreen(QWidget):
         
         top_bar_layout.addStretch()
         
-        # Export button
-        export_btn = QPushButton("Export CSV")
-        export_btn.setFixedSize(140, 40)
-        export_btn.setStyleSheet("""
+        # Export button, Cancel while an export runs
+        self.export_btn = QPushButton("Export CSV")
+        self.export_btn.setFixedSize(140, 40)
+        self.export_btn.setStyleSheet("""
             QPushButton {
                 background-color: #A8D3EF;
                 color: black;
@@ -92,8 +135,8 @@ class SettingsScreen(QWidget):
             }
         """)
 
-        export_btn.clicked.connect(self.export_csv)
-        top_bar_layout.addWidget(export_btn)
+        self.export_btn.clicked.connect(self.export_csv)
+        top_bar_layout.addWidget(self.export_btn)
         
         # Save button
         save_btn = QPushButton("Save Settings")
@@ -204,6 +247,58 @@ class SettingsScreen(QWidget):
             lambda val: self.warning_spin.setMaximum(val - 1))
 
         layout.addLayout(form_layout)
+
+        # Filtering against flapping alarms, and the early rate-of-rise alarm
+        filter_title = QLabel("Alarm Filtering")
+        filter_title.setFont(QFont("Arial", 22, QFont.Bold))
+        layout.addWidget(filter_title)
+
+        filter_layout = QFormLayout()
+        filter_layout.setLabelAlignment(Qt.AlignLeft)
+        filter_layout.setFormAlignment(Qt.AlignLeft)
+        filter_layout.setVerticalSpacing(10)
+        filter_layout.setHorizontalSpacing(20)
+
+        # Ett larm släpps först när nivån sjunkit så här mycket under gränsen
+        deadband_label = QLabel("Deadband:")
+        deadband_label.setFont(QFont("Arial", 20))
+        self.deadband_spin = QSpinBox()
+        self.deadband_spin.setRange(0, 10)
+        self.deadband_spin.setSuffix("%")
+        self.deadband_spin.setFixedWidth(140)
+        filter_layout.addRow(deadband_label, self.deadband_spin)
+
+        dwell_label = QLabel("Minimum Duration:")
+        dwell_label.setFont(QFont("Arial", 20))
+        self.dwell_spin = QSpinBox()
+        self.dwell_spin.setRange(0, 3600)
+        self.dwell_spin.setSingleStep(30)
+        self.dwell_spin.setSuffix(" s")
+        self.dwell_spin.setFixedWidth(140)
+        filter_layout.addRow(dwell_label, self.dwell_spin)
+
+        rise_label = QLabel("Rise Alarm:")
+        rise_label.setFont(QFont("Arial", 20))
+        self.rise_spin = QSpinBox()
+        self.rise_spin.setRange(0, 50)
+        self.rise_spin.setSuffix(" %/h")
+        self.rise_spin.setSpecialValueText("Off")
+        self.rise_spin.setFixedWidth(140)
+        filter_layout.addRow(rise_label, self.rise_spin)
+
+        # Varna i förväg när trenden når kritisk nivå inom så här många minuter
+        forecast_label = QLabel("Early Warning:")
+        forecast_label.setFont(QFont("Arial", 20))
+        self.forecast_spin = QSpinBox()
+        self.forecast_spin.setRange(0, 24 * 60)
+        self.forecast_spin.setSingleStep(15)
+        self.forecast_spin.setSuffix(" min")
+        self.forecast_spin.setSpecialValueText("Off")
+        self.forecast_spin.setToolTip("Warn when the trend reaches the critical level within this time")
+        self.forecast_spin.setFixedWidth(140)
+        filter_layout.addRow(forecast_label, self.forecast_spin)
+
+        layout.addLayout(filter_layout)
         layout.addStretch()
         
         return tab
@@ -246,6 +341,49 @@ class SettingsScreen(QWidget):
         self.fullscreen_check.setFont(QFont("Arial",20))
 
         layout.addWidget(self.fullscreen_check)
+
+        self.high_fidelity_check = QCheckBox("Detailed history charts (matplotlib)")
+        self.high_fidelity_check.setFont(QFont("Arial",20))
+
+        layout.addWidget(self.high_fidelity_check)
+
+        # What "Export CSV" writes
+        export_title = QLabel("Data Export")
+        export_title.setFont(QFont("Arial", 22, QFont.Bold))
+        layout.addWidget(export_title)
+
+        export_form = QFormLayout()
+        export_form.setLabelAlignment(Qt.AlignLeft)
+        export_form.setFormAlignment(Qt.AlignLeft)
+        export_form.setVerticalSpacing(10)
+        export_form.setHorizontalSpacing(20)
+
+        export_sensor_label = QLabel("Sensors:")
+        export_sensor_label.setFont(QFont("Arial", 20))
+        self.export_sensor_combo = QComboBox()
+        self.export_sensor_combo.setFixedWidth(200)
+        self.export_sensor_combo.addItem("All sensors", None)
+        for sensor_id in self.db.get_sensors() if self.db else []:
+            sensor = self.db.get_sensor_data(sensor_id) or {}
+            self.export_sensor_combo.addItem(sensor.get("name", sensor_id), sensor_id)
+        export_form.addRow(export_sensor_label, self.export_sensor_combo)
+
+        export_range_label = QLabel("Time Range:")
+        export_range_label.setFont(QFont("Arial", 20))
+        self.export_range_combo = QComboBox()
+        self.export_range_combo.setFixedWidth(200)
+        for name, days in self.EXPORT_RANGES:
+            self.export_range_combo.addItem(name, days)
+        export_form.addRow(export_range_label, self.export_range_combo)
+
+        layout.addLayout(export_form)
+
+        # Syns bara medan en export pågår
+        self.export_progress = QProgressBar()
+        self.export_progress.setFixedWidth(420)
+        self.export_progress.setFormat("Exporting... %p%")
+        self.export_progress.hide()
+        layout.addWidget(self.export_progress)
         
         layout.addStretch()
         
@@ -366,10 +504,15 @@ class SettingsScreen(QWidget):
             self.critical_spin.setValue(self.settings["critical_threshold"])
             self.warning_spin.valueChanged.emit(self.settings["warning_threshold"])
             self.critical_spin.valueChanged.emit(self.settings["critical_threshold"])
+            self.deadband_spin.setValue(self.settings["alarm_deadband"])
+            self.dwell_spin.setValue(self.settings["alarm_dwell"])
+            self.rise_spin.setValue(self.settings["rise_rate_alarm"])
+            self.forecast_spin.setValue(self.settings["critical_forecast"])
 
             # General tab
             self.update_spin.setValue(self.settings["update_interval"])
             self.fullscreen_check.setChecked(self.settings["fullscreen"])
+            self.high_fidelity_check.setChecked(self.settings["high_fidelity_charts"])
 
             # Sensor tab - populate with first sensor initially
             if self.sensor_combo.count() > 0:
@@ -406,32 +549,44 @@ class SettingsScreen(QWidget):
             # Save alarm settings
             self.settings["warning_threshold"] = self.warning_spin.value()
             self.settings["critical_threshold"] = self.critical_spin.value()
+            self.settings["alarm_deadband"] = self.deadband_spin.value()
+            self.settings["alarm_dwell"] = self.dwell_spin.value()
+            self.settings["rise_rate_alarm"] = self.rise_spin.value()
+            self.settings["critical_forecast"] = self.forecast_spin.value()
 
             # Save general settings
             self.settings["update_interval"] = self.update_spin.value()
             self.settings["fullscreen"] = self.fullscreen_check.isChecked()
+            self.settings["high_fidelity_charts"] = self.high_fidelity_check.isChecked()
 
             if self.db:
                 # Save global settings to database
                 global_settings = {
                     "warning_threshold": self.settings["warning_threshold"],
                     "critical_threshold": self.settings["critical_threshold"],
-                    "update_interval": self.settings["update_interval"]
+                    "alarm_deadband": self.settings["alarm_deadband"],
+                    "alarm_dwell": self.settings["alarm_dwell"],
+                    "rise_rate_alarm": self.settings["rise_rate_alarm"],
+                    "critical_forecast": self.settings["critical_forecast"],
+                    "update_interval": self.settings["update_interval"],
+                    "high_fidelity_charts": self.settings["high_fidelity_charts"]
                 }
                 
-                if not self.db.save_settings(global_settings):
-                    raise Exception("Failed to save global settings to database")
-                
-                # Save sensor settings to database
-                for sensor_id, sensor_config in self.settings["sensors"].items():
-                    sensor_settings = {
-                        "enabled": sensor_config["enabled"],
-                        "max_level": sensor_config["max_level"],
-                        "offset": sensor_config["offset"]
-                    }
+                # One transaction: a single write, and nothing is kept if any part fails
+                with self.db.transaction():
+                    if not self.db.save_settings(global_settings):
+                        raise Exception("Failed to save global settings to database")
                     
-                    if not self.db.update_sensor_settings(sensor_id, sensor_settings):
-                        raise Exception(f"Failed to save settings for {sensor_id}")
+                    # Save sensor settings to database
+                    for sensor_id, sensor_config in self.settings["sensors"].items():
+                        sensor_settings = {
+                            "enabled": sensor_config["enabled"],
+                            "max_level": sensor_config["max_level"],
+                            "offset": sensor_config["offset"]
+                        }
+                        
+                        if not self.db.update_sensor_settings(sensor_id, sensor_settings):
+                            raise Exception(f"Failed to save settings for {sensor_id}")
                 
                 QMessageBox.information(self, "Settings Saved",
                                        "Your settings have been saved successfully.")
@@ -444,7 +599,16 @@ class SettingsScreen(QWidget):
             QMessageBox.critical(self, "Error", f"Failed to save settings: {e}")
 
     def export_csv(self):
-        """Export sensor data to CSV file"""
+        """
+        Export sensor data to a CSV file in a worker thread, limited to the
+        sensor and time range chosen under Data Export. While the export
+        runs the button cancels it.
+        """
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            self.export_btn.setEnabled(False)
+            return
+
         if not self.db:
             QMessageBox.warning(self, "Export Error", "Database connection required for export.")
             return
@@ -457,16 +621,54 @@ class SettingsScreen(QWidget):
             if filename:
                 if not filename.endswith('.csv'):
                     filename += '.csv'
-                
-                if self.db.export_to_csv(filename):
-                    QMessageBox.information(self, "Export Successful", 
-                                          f"Data exported to {filename}")
-                else:
-                    QMessageBox.critical(self, "Export Failed", 
-                                       "An error occurred during export")
+
+                sensor_id = self.export_sensor_combo.currentData()
+                days = self.export_range_combo.currentData()
+                self.export_thread = CsvExportThread(
+                    self.db, filename,
+                    None if sensor_id is None else [sensor_id],
+                    None if days is None else time.time() - days * 86400, self)
+                self.export_thread.progress.connect(self.show_export_progress)
+                self.export_thread.done.connect(self.export_done)
+                self.export_progress.setRange(0, 0)
+                self.export_progress.show()
+                self.export_btn.setText("Cancel")
+                self.export_thread.start()
         except Exception as e:
+            self.reset_export_controls()
             QMessageBox.critical(self, "Export Error", f"Export failed: {e}")
 
+    def show_export_progress(self, done, total):
+        self.export_progress.setRange(0, max(total, 1))
+        self.export_progress.setValue(done)
+
+    def export_done(self, rows, error):
+        """Reports how the export thread ended and resets the export controls"""
+        filename = self.export_thread.filename
+        self.export_thread.wait()
+        self.reset_export_controls()
+        if not self.isVisible():
+            return
+        if error:
+            QMessageBox.critical(self, "Export Failed", f"An error occurred during export: {error}")
+        elif rows is None:
+            QMessageBox.information(self, "Export Cancelled", "The export was cancelled.")
+        else:
+            QMessageBox.information(self, "Export Successful",
+                                    f"{rows} readings exported to {filename}")
+
+    def reset_export_controls(self):
+        self.export_thread = None
+        self.export_progress.hide()
+        self.export_btn.setText("Export CSV")
+        self.export_btn.setEnabled(True)
+
+    def stop_export(self):
+        """Cancels a running export and waits for its thread to end"""
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            self.export_thread.wait()
+
     def go_back(self):
         """Closes the settings screen"""
         if self.parent_window:
@@ -481,5 +683,6 @@ class SettingsScreen(QWidget):
 
     def closeEvent(self, event):
         """Handles window close event"""
+        self.stop_export()
         self.closed.emit()
         super().closeEvent(event)
\ No newline at end of file
@@ -0,0 +1,263 @@
+# sparkline_chart.py
+import math
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QPen, QColor, QFont, QPolygonF
+from PyQt5.QtCore import Qt, QPointF, QRectF, pyqtSignal
+from downsample import m4
+from time_series import to_epoch, to_epoch_array, display_window
+
+
+class SparklineChart(QWidget):
+    """
+    Water level chart painted directly with QPainter, so showing history
+    does not need matplotlib. Draws the level line with drawPolyline over
+    warning/critical bands and threshold lines.
+
+    The full series is kept; painting uses an M4-decimated copy of the
+    visible part (about one bucket per pixel column), cached until the
+    data, the view or the size changes.
+
+    Has the same interface as WaterLevelChart (set_series, view_changed,
+    set_view, enable_navigation...) so views can use either.
+    With compact=True only the bands and the line are drawn, as a
+    sparkline for SensorCard; mouse clicks then go to the parent widget,
+    and set_note() puts a short text in the top right corner.
+    """
+
+    # Visible time range (epoch seconds) after any change of the view
+    view_changed = pyqtSignal(float, float)
+
+    MARKER_LIMIT = 60  # Show point markers only up to this many drawn points
+    MIN_SPAN = 600     # Narrowest zoom, seconds
+    ZOOM_STEP = 1.25   # Span factor per wheel step
+    Y_MAX = 105
+    MIN_TICK_GAP = 90  # Pixels between time axis labels
+    # Time axis tick spacings, seconds
+    TIME_STEPS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+                  86400, 2 * 86400, 7 * 86400, 14 * 86400, 30 * 86400, 91 * 86400, 365 * 86400)
+
+    LINE_COLOR = QColor('dodgerblue')
+    WARNING_COLOR = QColor('orange')
+    CRITICAL_COLOR = QColor('red')
+    GRID_COLOR = QColor('#dddddd')
+    NOTE_COLOR = QColor('#B00020')
+
+    def __init__(self, parent=None, compact=False):
+        super().__init__(parent)
+        self.compact = compact
+        # Default thresholds matching alarm system
+        self.warning_threshold = 75
+        self.critical_threshold = 85
+        self.title = ""
+        self.note = ""
+        self._x = np.empty(0)    # Full series, epoch seconds
+        self._y = np.empty(0)
+        self._version = 0        # Bumped when the series changes
+        self._view = None        # Shown time range (start, end), None: no data yet
+        self._points = None      # Decimated line in pixels, for _points_key
+        self._points_key = None
+        self._navigation = False
+        self._drag = None        # (pixel x, view) while panning
+        if not compact:
+            self.setMinimumSize(300, 200)
+
+    def set_series(self, ts, water_levels, title=None, keep_view=False):
+        """
+        Show a water level series. ts holds epoch seconds, a datetime64
+        array (UTC) or datetime objects (local time), in any order.
+        The view is fitted to the data unless keep_view is set.
+        """
+        epoch = to_epoch_array(ts)
+        order = np.argsort(epoch, kind="stable")
+        self._x = epoch[order]
+        self._y = np.asarray(water_levels, dtype=float)[order]
+        self._version += 1
+        if title is not None:
+            self.title = title
+        if not keep_view and len(self._x):
+            self._view = display_window(self._x[0], self._x[-1])
+        self.update()
+
+    def set_thresholds(self, warning_threshold, critical_threshold):
+        """Move the threshold lines and bands"""
+        if (warning_threshold, critical_threshold) != (self.warning_threshold, self.critical_threshold):
+            self.warning_threshold = warning_threshold
+            self.critical_threshold = critical_threshold
+            self.update()
+
+    def set_note(self, text):
+        """Short text drawn in the top right corner of a compact chart"""
+        if text != self.note:
+            self.note = text
+            self.update()
+
+    def view_range(self):
+        """Visible time range as (start, end) in epoch seconds"""
+        if self._view is None:
+            now = time.time()
+            return now - 7 * 86400, now
+        return self._view
+
+    def set_view(self, start, end):
+        """Show the time range start..end (epoch seconds)"""
+        self._view = (float(start), float(end))
+        self.update()
+        self.view_changed.emit(*self._view)
+
+    def enable_navigation(self):
+        """Zoom the time axis with the mouse wheel and pan it by dragging"""
+        self._navigation = True
+
+    def wheelEvent(self, event):
+        if not self._navigation:
+            return super().wheelEvent(event)
+        plot = self._plot_rect()
+        start, end = self.view_range()
+        steps = event.angleDelta().y() / 120.0
+        span = max((end - start) * self.ZOOM_STEP ** -steps, self.MIN_SPAN)
+        # Keep the time under the cursor in place
+        share = min(max((event.pos().x() - plot.left()) / plot.width(), 0.0), 1.0)
+        anchor = start + share * (end - start)
+        self.set_view(anchor - share * span, anchor - share * span + span)
+
+    def mousePressEvent(self, event):
+        if not self._navigation or event.button() != Qt.LeftButton:
+            return super().mousePressEvent(event)
+        self._drag = (event.pos().x(), self.view_range())
+
+    def mouseMoveEvent(self, event):
+        if self._drag is None:
+            return super().mouseMoveEvent(event)
+        start_x, (start, end) = self._drag
+        shift = (event.pos().x() - start_x) * (end - start) / self._plot_rect().width()
+        self.set_view(start - shift, end - shift)
+
+    def mouseReleaseEvent(self, event):
+        if self._drag is None:
+            return super().mouseReleaseEvent(event)
+        self._drag = None
+
+    def _plot_rect(self):
+        """Area inside the axes, in widget pixels"""
+        if self.compact:
+            return QRectF(self.rect()).adjusted(1, 1, -1, -1)
+        return QRectF(self.rect()).adjusted(44, 28, -12, -28)
+
+    def _y_px(self, plot, level):
+        return plot.bottom() - level / self.Y_MAX * plot.height()
+
+    def _line_points(self, plot):
+        """Decimated visible part of the series as a QPolygonF in pixels"""
+        start, end = self.view_range()
+        key = (self._version, start, end, plot.left(), plot.top(), plot.width(), plot.height())
+        if key != self._points_key:
+            x, y = m4(self._x, self._y, max(1, int(plot.width())), (start, end))
+            px = plot.left() + (x - start) / ((end - start) or 1.0) * plot.width()
+            py = plot.bottom() - y / self.Y_MAX * plot.height()
+            self._points = QPolygonF([QPointF(a, b) for a, b in zip(px.tolist(), py.tolist())])
+            self._points_key = key
+        return self._points
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        plot = self._plot_rect()
+        if not self.compact:
+            painter.fillRect(self.rect(), Qt.white)
+            painter.setPen(Qt.black)
+            painter.setFont(QFont("Arial", 11))
+            painter.drawText(QRectF(0, 4, self.width(), 20), Qt.AlignCenter, self.title)
+            painter.setFont(QFont("Arial", 8))
+            self._draw_grid(painter, plot)
+
+        # Bands above the thresholds
+        warning_y = self._y_px(plot, self.warning_threshold)
+        critical_y = self._y_px(plot, self.critical_threshold)
+        top = plot.top()
+        for color, upper, lower in ((self.WARNING_COLOR, critical_y, warning_y),
+                                    (self.CRITICAL_COLOR, top, critical_y)):
+            band = QColor(color)
+            band.setAlpha(40)
+            if lower > upper:
+                painter.fillRect(QRectF(plot.left(), upper, plot.width(), lower - upper), band)
+        for color, y in ((self.WARNING_COLOR, warning_y), (self.CRITICAL_COLOR, critical_y)):
+            if top <= y <= plot.bottom():
+                painter.setPen(QPen(color, 1, Qt.DashLine))
+                painter.drawLine(QPointF(plot.left(), y), QPointF(plot.right(), y))
+
+        if not len(self._x):
+            if not self.compact:
+                painter.setPen(Qt.black)
+                painter.drawText(plot, Qt.AlignCenter, "No data available")
+            return
+
+        points = self._line_points(plot)
+        painter.setClipRect(plot)
+        painter.setPen(QPen(self.LINE_COLOR, 1.5 if self.compact else 2))
+        painter.drawPolyline(points)
+        if not self.compact and points.size() <= self.MARKER_LIMIT:
+            painter.setBrush(self.LINE_COLOR)
+            for i in range(points.size()):
+                painter.drawEllipse(points.at(i), 3, 3)
+        if self.compact and self.note:
+            painter.setClipping(False)
+            self._draw_note(painter, plot)
+
+    def _draw_note(self, painter, plot):
+        """The note on a light backdrop, so the line does not hide it"""
+        font = QFont("Arial", 8, QFont.Bold)
+        painter.setFont(font)
+        box = painter.boundingRect(plot, Qt.AlignRight | Qt.AlignTop, self.note).adjusted(-3, 0, 1, 0)
+        painter.fillRect(box, QColor(255, 255, 255, 170))
+        painter.setPen(self.NOTE_COLOR)
+        painter.drawText(box, Qt.AlignCenter, self.note)
+
+    def _draw_grid(self, painter, plot):
+        """Axes frame, level grid and labels, and the time axis"""
+        painter.setPen(QPen(Qt.black, 1))
+        painter.drawRect(plot)
+        for level in range(0, 101, 20):
+            y = self._y_px(plot, level)
+            painter.setPen(QPen(self.GRID_COLOR, 1, Qt.DotLine))
+            painter.drawLine(QPointF(plot.left(), y), QPointF(plot.right(), y))
+            painter.setPen(Qt.black)
+            painter.drawText(QRectF(0, y - 8, plot.left() - 6, 16), Qt.AlignRight | Qt.AlignVCenter, str(level))
+
+        start, end = self.view_range()
+        span = (end - start) or 1.0
+        for tick, label in self._time_ticks(start, end, plot.width()):
+            x = plot.left() + (tick - start) / span * plot.width()
+            painter.setPen(QPen(self.GRID_COLOR, 1, Qt.DotLine))
+            painter.drawLine(QPointF(x, plot.top()), QPointF(x, plot.bottom()))
+            painter.setPen(Qt.black)
+            painter.drawText(QRectF(x - 45, plot.bottom() + 4, 90, 16), Qt.AlignCenter, label)
+
+    def _time_ticks(self, start, end, width):
+        """(epoch, label) for time axis ticks on whole local minutes, hours or days"""
+        most = max(1, int(width // self.MIN_TICK_GAP))
+        step = next((step for step in self.TIME_STEPS if (end - start) / step <= most), self.TIME_STEPS[-1])
+        if step < 86400:
+            # Align to the local clock: whole minutes/hours since local midnight
+            offset = datetime.fromtimestamp(start).astimezone().utcoffset().total_seconds()
+            tick = math.ceil((start + offset) / step) * step - offset
+            ticks = np.arange(tick, end + 1, step)
+        else:
+            midnight = datetime.fromtimestamp(start).replace(hour=0, minute=0, second=0, microsecond=0)
+            days = step // 86400
+            ticks = [(midnight + timedelta(days=days * i)).timestamp() for i in range(1, most + 2)]
+        result = []
+        for tick in ticks:
+            if not start <= tick <= end:
+                continue
+            moment = datetime.fromtimestamp(tick)
+            if step >= 91 * 86400:
+                label = moment.strftime("%b %Y")
+            elif step >= 86400 or (moment.hour == 0 and moment.minute == 0):
+                label = moment.strftime("%d %b")
+            else:
+                label = moment.strftime("%H:%M")
+            result.append((tick, label))
+        return result
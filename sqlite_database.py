@@ -0,0 +1,566 @@
+# sqlite_database.py
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+from time_series import SensorSeries, to_epoch, validate_batch
+from rollups import DAY, RollupPyramid, align_buckets, bucket_starts, rollup_records
+import csv_export
+import database_common
+from change_events import (ChangeEvent, ChangeNotifier, READINGS_ADDED,
+                           SENSOR_CHANGED, SETTINGS_CHANGED, merge_events)
+
+
+class SQLiteDatabase:
+    """
+    Sensor database stored in a local SQLite file.
+    Offers the same methods as MockDatabase, so the screens work with either.
+
+    Readings live in a table clustered on (sensor_id, ts), which makes time
+    range queries index seeks. The database runs in WAL journal mode and
+    readings are written in batches with executemany.
+
+    Minute/hour/day rollups (same tiers as RollupPyramid) are kept in their
+    own table and updated in the same transaction as the readings. A reading
+    whose (sensor_id, ts) is already stored is ignored.
+
+    `with db.transaction():` makes the enclosed writes one SQLite
+    transaction, committed on exit or rolled back if the block raises.
+    Committed changes are announced as ChangeEvents through self.events.
+    """
+
+    FILENAME = "sensor_data.db"
+    LEVEL_RANGE = (0, 100)  # Valid water and battery levels (%) for bulk ingest
+
+    # Sensor fields kept in their own columns; everything else is sensor config
+    STATE_FIELDS = ["current_water_level", "current_battery_level", "last_updated"]
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sensors (
+            sensor_id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            config TEXT NOT NULL,
+            current_water_level REAL,
+            current_battery_level REAL,
+            last_updated TEXT
+        );
+        CREATE TABLE IF NOT EXISTS readings (
+            sensor_id TEXT NOT NULL,
+            ts REAL NOT NULL,
+            water_level REAL,
+            battery_level REAL,
+            PRIMARY KEY (sensor_id, ts)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rollups (
+            sensor_id TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            start REAL NOT NULL,
+            count INTEGER NOT NULL,
+            water_sum REAL NOT NULL,
+            water_min REAL NOT NULL,
+            water_max REAL NOT NULL,
+            battery_sum REAL NOT NULL,
+            PRIMARY KEY (sensor_id, width, start)
+        ) WITHOUT ROWID;
+        CREATE TEMP TABLE IF NOT EXISTS incoming (
+            sensor_id TEXT NOT NULL,
+            ts REAL NOT NULL,
+            water_level REAL,
+            battery_level REAL,
+            PRIMARY KEY (sensor_id, ts)
+        );
+    """
+
+    # Aggregate a set of readings into the buckets of one tier
+    ROLLUP_SELECT = """
+        SELECT sensor_id, :width, {bucket} AS bucket,
+               COUNT(*), SUM(water_level), MIN(water_level), MAX(water_level),
+               SUM(battery_level)
+        FROM {source}
+        GROUP BY sensor_id, bucket
+    """
+
+    # Bucket start of a reading, as rollups.bucket_starts() computes it:
+    # local midnight for days, multiples of the width otherwise
+    BUCKET = "CAST(ts / :width AS INTEGER) * :width"
+    DAY_BUCKET = "CAST(strftime('%s', date(ts, 'unixepoch', 'localtime'), 'utc') AS REAL)"
+
+    # Bumped when stored rollups must be rebuilt (1: days start at local midnight)
+    ROLLUP_VERSION = 1
+
+    def __init__(self, filename=None):
+        self.filename = filename or self.FILENAME
+        self._lock = threading.RLock()
+        self._in_transaction = False
+        self._txn_events = []   # Events held back until the transaction commits
+        self.events = ChangeNotifier()
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+        if not self.get_sensors():
+            self._seed()
+        self._ensure_rollups()
+
+    def _seed(self):
+        """Fill an empty database with the same demo data as MockDatabase"""
+        data = database_common.initial_data()
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in data["settings"].items()])
+
+            for position, (sensor_id, sensor) in enumerate(data["sensors"].items()):
+                config = {key: value for key, value in sensor.items()
+                          if key not in self.STATE_FIELDS + ["readings"]}
+                self._conn.execute(
+                    "INSERT INTO sensors (sensor_id, position, config, current_water_level, "
+                    "current_battery_level, last_updated) VALUES (?, ?, ?, ?, ?, ?)",
+                    (sensor_id, position, json.dumps(config), sensor["current_water_level"],
+                     sensor["current_battery_level"], sensor["last_updated"]))
+
+                ts, water, battery = SensorSeries.from_records(sensor["readings"]).columns()
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO readings (sensor_id, ts, water_level, battery_level) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(sensor_id, t, w, b) for t, w, b in zip(ts.tolist(), water.tolist(), battery.tolist())])
+
+    def _rollup_select(self, source, width):
+        bucket = self.DAY_BUCKET if width == DAY else self.BUCKET
+        return self.ROLLUP_SELECT.format(source=source, bucket=bucket)
+
+    def _ensure_rollups(self):
+        """Build the rollup table from stored readings if it is missing or outdated"""
+        with self._lock:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            has_rollups = self._conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone()
+            has_readings = self._conn.execute("SELECT 1 FROM readings LIMIT 1").fetchone()
+            if version >= self.ROLLUP_VERSION and (has_rollups or not has_readings):
+                return
+            with self._conn:
+                self._conn.execute("DELETE FROM rollups")
+                for _, width in RollupPyramid.TIERS:
+                    self._conn.execute(
+                        "INSERT INTO rollups " + self._rollup_select("readings", width),
+                        {"width": width})
+                self._conn.execute(f"PRAGMA user_version = {self.ROLLUP_VERSION}")
+
+    @staticmethod
+    def _first_bucket(low, width):
+        """Start of the bucket holding time low, the first one a query from low overlaps"""
+        if low == float("-inf"):
+            return low
+        return float(bucket_starts([low], width)[0])
+
+    @contextmanager
+    def _writing(self):
+        """
+        Commit on exit, unless the writes belong to an open transaction().
+        Yields a list for the ChangeEvents of the writes, which are
+        published once the writes are committed.
+        """
+        if self._in_transaction:
+            yield self._txn_events
+        else:
+            events = []
+            with self._conn:
+                yield events
+            self.events.publish(merge_events(events))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group writes into one SQLite transaction:
+
+            with db.transaction():
+                db.save_settings(...)
+                db.update_sensor_settings(...)
+
+        A nested transaction() joins the outer one.
+        """
+        with self._lock:
+            if self._in_transaction:
+                yield self
+                return
+            self._in_transaction = True
+            self._txn_events = []
+            try:
+                with self._conn:
+                    yield self
+            except BaseException:
+                self._txn_events = []
+                raise
+            finally:
+                self._in_transaction = False
+            events, self._txn_events = self._txn_events, []
+        self.events.publish(merge_events(events))
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+    def get_sensors(self):
+        """Return list of all sensor IDs"""
+        with self._lock:
+            rows = self._conn.execute("SELECT sensor_id FROM sensors ORDER BY position").fetchall()
+        return [row[0] for row in rows]
+
+    def get_sensor_data(self, sensor_id):
+        """
+        Get config and current values for a specific sensor.
+        Unlike MockDatabase there is no "readings" key; use
+        get_historical_data() or get_range() for history.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT config, current_water_level, current_battery_level, last_updated "
+                "FROM sensors WHERE sensor_id = ?", (sensor_id,)).fetchone()
+        if row is None:
+            return None
+        sensor = json.loads(row[0])
+        sensor.update(zip(self.STATE_FIELDS, row[1:]))
+        return sensor
+
+    def get_snapshot(self):
+        """
+        Config and current values of every sensor plus the settings, in one
+        call. Used by screens that refresh periodically.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sensor_id, config, current_water_level, current_battery_level, "
+                "last_updated FROM sensors ORDER BY position").fetchall()
+            settings = self.get_settings()
+        sensors = {}
+        for sensor_id, config, *state in rows:
+            sensors[sensor_id] = json.loads(config)
+            sensors[sensor_id].update(zip(self.STATE_FIELDS, state))
+        return {"sensors": sensors, "settings": settings}
+
+    def get_current_level(self, sensor_id):
+        """Get current water level for a sensor"""
+        sensor = self.get_sensor_data(sensor_id)
+        return sensor["current_water_level"] if sensor else None
+
+    def get_battery_level(self, sensor_id):
+        """Get current battery level for a sensor"""
+        sensor = self.get_sensor_data(sensor_id)
+        return sensor["current_battery_level"] if sensor else None
+
+    def get_historical_data(self, sensor_id, days=7, max_points=None):
+        """
+        Get historical readings for a sensor covering the last `days`
+        calendar days up to and including the day of the newest reading.
+
+        With max_points the readings may come from a rollup tier instead;
+        each item then describes a bucket (see MockDatabase).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(ts) FROM readings WHERE sensor_id = ?", (sensor_id,)).fetchone()
+        if row is None or row[0] is None:
+            return []
+        last_day = datetime.fromtimestamp(row[0]).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = last_day - timedelta(days=days - 1)
+        if max_points is None:
+            return self.get_range(sensor_id, start)
+        return rollup_records(self.get_rollup_arrays(sensor_id, start, None, max_points))
+
+    def get_rollup_arrays(self, sensor_id, start=None, end=None, max_points=None, resolution=None):
+        """
+        Get water level statistics for start <= ts <= end from the coarsest
+        rollup tier that still has at least max_points buckets (raw readings
+        if none does), or from the tier given as resolution (0 for raw).
+        Same format as RollupPyramid.select.
+        """
+        low = to_epoch(start)
+        high = to_epoch(end)
+        low = float("-inf") if low is None else low
+        high = float("inf") if high is None else high
+
+        with self._lock:
+            if resolution:
+                if resolution not in [width for _, width in RollupPyramid.TIERS]:
+                    raise ValueError(f"No rollup tier with resolution {resolution}")
+                return self._rollup_tier(sensor_id, resolution, low, high)
+            if max_points is not None and resolution is None:
+                raw_count = self._conn.execute(
+                    "SELECT COUNT(*) FROM readings WHERE sensor_id = ? AND ts >= ? AND ts <= ?",
+                    (sensor_id, low, high)).fetchone()[0]
+                if raw_count > max_points:
+                    for _, width in reversed(RollupPyramid.TIERS):
+                        buckets = self._conn.execute(
+                            "SELECT COUNT(*) FROM rollups WHERE sensor_id = ? AND width = ? "
+                            "AND start >= ? AND start <= ?",
+                            (sensor_id, width, self._first_bucket(low, width), high)).fetchone()[0]
+                        if buckets >= max_points:
+                            return self._rollup_tier(sensor_id, width, low, high)
+
+        ts, water, battery = self.get_history_arrays(sensor_id, start, end)
+        return {
+            "resolution": 0,
+            "ts": ts,
+            "mean": water,
+            "min": water.copy(),
+            "max": water.copy(),
+            "count": np.ones(len(ts), dtype=np.int64),
+            "battery": battery,
+        }
+
+    def get_aligned_history(self, sensor_ids, start, end, max_points=None, resolution=None):
+        """
+        Mean water levels of several sensors on one shared time grid, read
+        with a single query. See MockDatabase.get_aligned_history.
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        if resolution is None:
+            resolution = RollupPyramid.tier_for_span(end - start, max_points or 1)
+        sensor_ids = list(sensor_ids)
+        row_of = {sensor_id: row for row, sensor_id in enumerate(sensor_ids)}
+        rows = []
+        if sensor_ids:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT sensor_id, start, water_sum / count FROM rollups "
+                    "WHERE width = ? AND start >= ? AND start <= ? AND sensor_id IN ({})".format(
+                        ", ".join("?" * len(sensor_ids))),
+                    [resolution, self._first_bucket(start, resolution), end] + sensor_ids).fetchall()
+        grid, matrix = align_buckets([row_of[row[0]] for row in rows],
+                                     [row[1] for row in rows], [row[2] for row in rows],
+                                     len(sensor_ids), start, end, resolution)
+        return {"resolution": resolution, "sensors": sensor_ids, "ts": grid, "mean": matrix}
+
+    def _rollup_tier(self, sensor_id, width, low, high):
+        """Buckets of one tier overlapping low <= ts <= high, as select() returns them"""
+        rows = self._conn.execute(
+            "SELECT start, water_sum / count, water_min, water_max, count, "
+            "battery_sum / count FROM rollups WHERE sensor_id = ? AND width = ? "
+            "AND start >= ? AND start <= ? ORDER BY start",
+            (sensor_id, width, self._first_bucket(low, width), high)).fetchall()
+        table = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        return {
+            "resolution": width,
+            "ts": table[:, 0].copy(),
+            "mean": table[:, 1].copy(),
+            "min": table[:, 2].copy(),
+            "max": table[:, 3].copy(),
+            "count": table[:, 4].astype(np.int64),
+            "battery": table[:, 5].copy(),
+        }
+
+    def _query_range(self, sensor_id, start, end):
+        start = to_epoch(start)
+        end = to_epoch(end)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT ts, water_level, battery_level FROM readings "
+                "WHERE sensor_id = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+                (sensor_id, float("-inf") if start is None else start,
+                 float("inf") if end is None else end)).fetchall()
+
+    def get_range(self, sensor_id, start=None, end=None):
+        """Get readings for a sensor with start <= timestamp <= end"""
+        readings = []
+        for ts, water_level, battery_level in self._query_range(sensor_id, start, end):
+            moment = datetime.fromtimestamp(ts)
+            readings.append({
+                "date": moment.strftime("%Y-%m-%d"),
+                "timestamp": moment.strftime("%Y-%m-%d %H:%M:%S"),
+                "water_level": water_level,
+                "battery_level": battery_level
+            })
+        return readings
+
+    def get_history_arrays(self, sensor_id, start=None, end=None):
+        """
+        Get (timestamps, water_levels, battery_levels) for a sensor as NumPy
+        arrays. The arrays are built from the query result (not zero-copy).
+        """
+        rows = self._query_range(sensor_id, start, end)
+        table = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        return table[:, 0].copy(), table[:, 1].copy(), table[:, 2].copy()
+
+    def count_readings(self, sensor_id, start=None, end=None):
+        """Number of readings of a sensor between start and end"""
+        start = to_epoch(start)
+        end = to_epoch(end)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM readings WHERE sensor_id = ? AND ts >= ? AND ts <= ?",
+                (sensor_id, float("-inf") if start is None else start,
+                 float("inf") if end is None else end)).fetchone()[0]
+
+    def iter_history_arrays(self, sensor_id, start=None, end=None, chunk_size=csv_export.CHUNK_SIZE):
+        """
+        Yield the (timestamps, water_levels, battery_levels) of a time window
+        like get_history_arrays(), at most chunk_size readings at a time.
+        Each chunk is one keyset query that goes on after the previous
+        chunk's last timestamp, so no cursor stays open between chunks.
+        """
+        start = to_epoch(start)
+        end = to_epoch(end)
+        condition = "ts >= ?"
+        after = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT ts, water_level, battery_level FROM readings "
+                    f"WHERE sensor_id = ? AND {condition} AND ts <= ? ORDER BY ts LIMIT ?",
+                    (sensor_id, after, end, chunk_size)).fetchall()
+            if not rows:
+                return
+            table = np.array(rows, dtype=np.float64).reshape(-1, 3)
+            yield table[:, 0].copy(), table[:, 1].copy(), table[:, 2].copy()
+            if len(rows) < chunk_size:
+                return
+            condition = "ts > ?"
+            after = rows[-1][0]
+
+    def update_sensor_reading(self, sensor_id, water_level=None, battery_level=None):
+        """Update current readings for a sensor"""
+        sensor = self.get_sensor_data(sensor_id)
+        if sensor is None:
+            return False
+        if water_level is None:
+            water_level = sensor["current_water_level"]
+        if battery_level is None:
+            battery_level = sensor["current_battery_level"]
+        return self._insert_readings([(sensor_id, datetime.now().timestamp(), water_level, battery_level)])
+
+    def update_sensor_readings(self, batch):
+        """
+        Store many readings in one transaction.
+
+        batch is an iterable of (sensor_id, ts, water_level, battery_level)
+        tuples; ts may be a datetime, a time string, epoch seconds or None
+        for now. Returns (accepted_count, rejects) where rejects is a list
+        of (row_index, reason).
+        """
+        accepted, rejects = validate_batch(batch, self.get_sensors(), self.LEVEL_RANGE)
+        rows = list(zip(*(column.tolist() for column in accepted)))
+        if not rows:
+            return 0, rejects
+        if not self._insert_readings(rows):
+            rejects = rejects + [(i, "Failed to persist") for i in range(len(rows))]
+            return 0, sorted(rejects)
+        return len(rows), rejects
+
+    def _insert_readings(self, rows):
+        """
+        Store (sensor_id, ts, water_level, battery_level) rows in one
+        transaction and move each sensor's current values to its newest row.
+        """
+        latest = {}
+        readings = {}  # sensor_id -> (ts, water_level) pairs, for the change event
+        for row in rows:
+            if row[0] not in latest or row[1] >= latest[row[0]][1]:
+                latest[row[0]] = row
+            readings.setdefault(row[0], []).append((row[1], row[2]))
+
+        current = []
+        for sensor_id, ts, water_level, battery_level in latest.values():
+            stamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+            current.append((water_level, battery_level, stamp, sensor_id, stamp))
+
+        try:
+            with self._lock, self._writing() as events:
+                # Stage the batch, fold the rows that are new into the
+                # rollups, then move them into readings
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO incoming (sensor_id, ts, water_level, battery_level) "
+                    "VALUES (?, ?, ?, ?)", rows)
+                self._conn.execute(
+                    "DELETE FROM incoming WHERE EXISTS (SELECT 1 FROM readings r "
+                    "WHERE r.sensor_id = incoming.sensor_id AND r.ts = incoming.ts)")
+                for _, width in RollupPyramid.TIERS:
+                    self._conn.execute(
+                        "INSERT INTO rollups " + self._rollup_select("incoming", width) +
+                        "ON CONFLICT (sensor_id, width, start) DO UPDATE SET "
+                        "count = count + excluded.count, "
+                        "water_sum = water_sum + excluded.water_sum, "
+                        "water_min = MIN(water_min, excluded.water_min), "
+                        "water_max = MAX(water_max, excluded.water_max), "
+                        "battery_sum = battery_sum + excluded.battery_sum",
+                        {"width": width})
+                self._conn.execute("INSERT INTO readings SELECT * FROM incoming")
+                self._conn.execute("DELETE FROM incoming")
+                # Late rows must not overwrite newer current values
+                self._conn.executemany(
+                    "UPDATE sensors SET current_water_level = ?, current_battery_level = ?, "
+                    "last_updated = ? WHERE sensor_id = ? AND "
+                    "(last_updated IS NULL OR last_updated <= ?)", current)
+                events.extend(ChangeEvent(READINGS_ADDED, sensor_id, tuple(readings[sensor_id]))
+                              for sensor_id in latest)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error writing readings: {e}")
+            return False
+
+    def get_settings(self):
+        """Get application settings"""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM settings").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def save_settings(self, settings):
+        """Save application settings"""
+        try:
+            with self._lock, self._writing() as events:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in settings.items()])
+                events.append(ChangeEvent(SETTINGS_CHANGED, None))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving settings: {e}")
+            return False
+
+    def update_sensor_settings(self, sensor_id, settings_dict):
+        """Update settings for a specific sensor"""
+        try:
+            with self._lock, self._writing() as events:
+                row = self._conn.execute(
+                    "SELECT config FROM sensors WHERE sensor_id = ?", (sensor_id,)).fetchone()
+                if row is None:
+                    return False
+                config = json.loads(row[0])
+                for key, value in settings_dict.items():
+                    if key not in self.STATE_FIELDS + ["readings"]:
+                        config[key] = value
+                self._conn.execute("UPDATE sensors SET config = ? WHERE sensor_id = ?",
+                                   (json.dumps(config), sensor_id))
+                events.append(ChangeEvent(SENSOR_CHANGED, sensor_id))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving settings for {sensor_id}: {e}")
+            return False
+
+    def open_alarm_journal(self):
+        """Alarm event journal in the alarm_events table of this database file"""
+        from alarm_journal import SQLiteAlarmJournal
+        return SQLiteAlarmJournal(self.filename)
+
+    def export_to_csv(self, filename=None, sensor_ids=None, start=None, end=None,
+                      progress=None, cancelled=None):
+        """Export sensor data to a CSV file, see database_common.export_to_csv()"""
+        return database_common.export_to_csv(self, filename, sensor_ids, start, end,
+                                             progress, cancelled)
+
+    def export_to_json(self, filename=None):
+        """Export settings and all sensor data as human-readable JSON"""
+        return database_common.export_to_json(self, filename)
+
+    def simulate_update(self):
+        """Simulate data update for all sensors, written as one batch"""
+        return database_common.simulate_update(self)
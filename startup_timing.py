@@ -0,0 +1,44 @@
+# startup_timing.py
+import os
+import time
+
+# Set this environment variable to print the startup report
+REPORT_VARIABLE = "WATER_MONITOR_STARTUP_REPORT"
+
+_imported = time.time()
+_marks = []  # (name, wall clock time), in order
+
+
+def process_start():
+    """
+    Wall clock time the process started. Read from /proc on Linux; elsewhere
+    the time this module was first imported, which misses interpreter startup.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name; starttime is field 22 of the line
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.time() - (uptime - started)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _imported
+
+
+def mark(name):
+    """Record that startup step `name` has finished"""
+    _marks.append((name, time.time()))
+
+
+def report():
+    """One line with the time from process start to each mark"""
+    start = process_start()
+    steps = ", ".join(f"{name} {moment - start:.3f}s" for name, moment in _marks)
+    return f"Startup timing since process start: {steps}"
+
+
+def print_report():
+    """Print the report if REPORT_VARIABLE is set"""
+    if os.environ.get(REPORT_VARIABLE):
+        print(report())
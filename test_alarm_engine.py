@@ -0,0 +1,229 @@
+# test_alarm_engine.py
+import time
+import numpy as np
+import pytest
+from alarm_engine import AlarmEngine, NORMAL, WARNING, CRITICAL, LEVEL, RISE, FORECAST
+from mock_database import MockDatabase
+from sqlite_database import SQLiteDatabase
+
+
+def changes(transitions):
+    return [(t.sensor_id, t.old_state, t.new_state) for t in transitions]
+
+
+@pytest.fixture
+def engine():
+    engine = AlarmEngine(warning_threshold=75, critical_threshold=85)
+    engine.set_filtering(deadband=0)
+    return engine
+
+
+def test_only_state_changes_are_reported(engine):
+    assert changes(engine.evaluate(["a", "b", "c"], [10, 80, 90], ts=100)) == [
+        ("b", NORMAL, WARNING), ("c", NORMAL, CRITICAL)]
+    assert engine.evaluate(["a", "b", "c"], [20, 81, 95], ts=200) == []
+    transitions = engine.evaluate(["c"], [50], ts=300)
+    assert changes(transitions) == [("c", CRITICAL, NORMAL)]
+    assert transitions[0].level == 50 and transitions[0].ts == 300 and transitions[0].reason == LEVEL
+    assert engine.states() == {"a": (NORMAL, 20.0), "b": (WARNING, 81.0), "c": (NORMAL, 50.0)}
+
+
+def test_transitions_are_published(engine):
+    published = []
+    engine.transitions.subscribe(published.append)
+    engine.evaluate(["a"], [90], ts=100)
+    engine.evaluate(["a"], [90], ts=200)
+    assert [changes(batch) for batch in published] == [[("a", NORMAL, CRITICAL)]]
+
+
+def test_missing_levels_leave_the_state_alone(engine):
+    engine.evaluate(["a"], [80], ts=100)
+    assert engine.evaluate(["a", "b"], [None, np.nan], ts=200) == []
+    assert engine.state("a") == (WARNING, 80.0)
+    assert engine.state("b") == (None, None)
+
+
+def test_new_thresholds_reevaluate_the_last_levels(engine):
+    engine.evaluate(["a", "b"], [70, 70], ts=100)
+    assert changes(engine.set_thresholds(60, 65, sensor_ids=["b"])) == [("b", NORMAL, CRITICAL)]
+    assert engine.thresholds("a") == (75, 85)
+    assert changes(engine.set_thresholds(65, 90)) == [("a", NORMAL, WARNING), ("b", CRITICAL, WARNING)]
+    assert engine.thresholds("new") == (65, 90)
+
+
+def test_many_sensors_in_one_pass(engine):
+    levels = np.linspace(0, 100, 1000)
+    transitions = engine.evaluate([f"s{i}" for i in range(1000)], levels, ts=100)
+    states = [t.new_state for t in transitions]
+    assert states.count(WARNING) == np.count_nonzero((levels >= 75) & (levels < 85))
+    assert states.count(CRITICAL) == np.count_nonzero(levels >= 85)
+
+
+def test_engine_follows_a_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = MockDatabase()
+    try:
+        engine = AlarmEngine.for_database(db)
+        assert AlarmEngine.for_database(db) is engine
+        db.save_settings({"warning_threshold": 40, "critical_threshold": 50, "alarm_deadband": 0})
+        db.update_sensor_reading("Sensor 1", 45.0, 90)
+        assert engine.state("Sensor 1") == (WARNING, 45.0)
+        db.update_sensor_settings("Sensor 2", {"warning_threshold": 20, "critical_threshold": 30})
+        db.update_sensor_reading("Sensor 2", 35.0, 90)
+        assert engine.state("Sensor 2") == (CRITICAL, 35.0)
+        assert engine.thresholds("Sensor 2") == (20, 30)
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("backend", [MockDatabase, SQLiteDatabase])
+def test_readings_in_the_same_second_all_reach_the_trend(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    db = backend()
+    try:
+        engine = AlarmEngine.for_database(db)
+        db.save_settings({"rise_window": 1})
+        t = int(time.time()) + 10.0
+        db.update_sensor_readings([("Sensor 1", t + 0.2, 50.0, 90)])
+        db.update_sensor_readings([("Sensor 1", t + 0.7, 60.0, 90)])
+        assert engine.state("Sensor 1") == (NORMAL, 60.0)
+        # 10 points in half a second
+        assert engine.trend("Sensor 1") == pytest.approx(20 * 3600)
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("backend", [MockDatabase, SQLiteDatabase])
+def test_readings_are_evaluated_without_reading_the_database(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    db = backend()
+    try:
+        engine = AlarmEngine.for_database(db)
+        engine.set_filtering(deadband=0)
+        reads = []
+        for name in ["get_snapshot", "get_settings", "get_history_arrays", "get_sensor_data"]:
+            monkeypatch.setattr(db, name, lambda *args, read=getattr(db, name), name=name, **kwargs:
+                                reads.append(name) or read(*args, **kwargs))
+
+        t = int(time.time()) + 10.0
+        # Out of order within the batch; the newest reading counts
+        db.update_sensor_readings([("Sensor 1", t + 2, 90.0, 90), ("Sensor 1", t + 1, 50.0, 90),
+                                   ("Sensor 2", t + 1, 80.0, 90)])
+        with db.transaction():
+            db.update_sensor_readings([("Sensor 3", t + 1, 60.0, 90)])
+            db.update_sensor_readings([("Sensor 3", t + 2, 86.0, 90)])
+        assert reads == []
+        assert engine.state("Sensor 1") == (CRITICAL, 90.0)
+        assert engine.state("Sensor 2") == (WARNING, 80.0)
+        assert engine.state("Sensor 3") == (CRITICAL, 86.0)
+
+        # Settings are read again only when they change
+        db.save_settings({"warning_threshold": 95, "critical_threshold": 99})
+        assert reads.count("get_snapshot") == 1 and "get_history_arrays" not in reads
+        assert engine.state("Sensor 1") == (NORMAL, 90.0)
+    finally:
+        db.close()
+
+
+def test_late_readings_do_not_replace_the_evaluated_level(engine):
+    engine.add_readings({"a": [(100, 80), (101, 90)]})
+    assert engine.state("a") == (CRITICAL, 90.0)
+    assert engine.add_readings({"a": [(99, 10), (101, 10)]}) == []
+    assert engine.state("a") == (CRITICAL, 90.0)
+    assert engine.add_readings({"a": [(102, None), (103, float("nan"))]}) == []
+    assert changes(engine.add_readings({"a": [(104, 10)]})) == [("a", CRITICAL, NORMAL)]
+
+
+def test_deadband_keeps_a_hovering_level_from_flapping(engine):
+    engine.set_filtering(deadband=2)
+    assert changes(engine.evaluate(["a"], [75], ts=1)) == [("a", NORMAL, WARNING)]
+    assert engine.evaluate(["a"], [74], ts=2) == []
+    assert engine.evaluate(["a"], [73.5], ts=3) == []
+    assert changes(engine.evaluate(["a"], [72.9], ts=4)) == [("a", WARNING, NORMAL)]
+    assert engine.evaluate(["a"], [74.9], ts=5) == []
+
+    engine.evaluate(["a"], [90], ts=6)
+    assert engine.evaluate(["a"], [83.5], ts=7) == []
+    assert changes(engine.evaluate(["a"], [82], ts=8)) == [("a", CRITICAL, WARNING)]
+
+
+def test_dwell_delays_a_new_state(engine):
+    engine.set_filtering(dwell=60)
+    assert engine.evaluate(["a"], [80], ts=0) == []
+    assert engine.evaluate(["a"], [80], ts=30) == []
+    transitions = engine.evaluate(["a"], [81], ts=60)
+    assert changes(transitions) == [("a", NORMAL, WARNING)]
+    assert transitions[0].ts == 60
+
+
+def test_dwell_restarts_when_the_level_returns(engine):
+    engine.set_filtering(dwell=60)
+    engine.evaluate(["a"], [80], ts=0)
+    engine.evaluate(["a"], [70], ts=30)
+    engine.evaluate(["a"], [80], ts=50)
+    assert engine.evaluate(["a"], [80], ts=100) == []
+    assert changes(engine.evaluate(["a"], [80], ts=110)) == [("a", NORMAL, WARNING)]
+
+
+def test_fast_rise_raises_a_warning_below_the_threshold(engine):
+    engine.set_filtering(rise_rate=10, rise_window=3600)
+    transitions = []
+    # 20 %/h, one reading a minute, starting well below the warning level
+    for minute in range(61):
+        transitions += engine.evaluate(["a"], [10 + minute / 3], ts=minute * 60)
+    assert changes(transitions) == [("a", NORMAL, WARNING)]
+    assert transitions[0].reason == RISE
+    # The trend is only trusted once the readings span half the window
+    assert transitions[0].ts >= 1800
+    assert engine.trend("a") == pytest.approx(20.0)
+    assert engine.reason("a") == RISE
+
+    # Level flat for a window: the rise alarm ends
+    for minute in range(61, 130):
+        transitions = engine.evaluate(["a"], [30], ts=minute * 60)
+        if transitions:
+            break
+    assert changes(transitions) == [("a", WARNING, NORMAL)]
+    assert engine.reason("a") == LEVEL
+
+
+def test_rise_alarm_is_off_by_default(engine):
+    for minute in range(61):
+        assert engine.evaluate(["a"], [10 + minute / 3], ts=minute * 60) == []
+
+
+def rise(engine, sensor_id, start, rate, until):
+    """Readings once a minute from ts 0 up to until, rising rate %/h"""
+    for minute in range(until // 60 + 1):
+        engine.evaluate([sensor_id], [start + rate * minute / 60], ts=minute * 60)
+
+
+def test_time_to_threshold_follows_the_trend(engine):
+    rise(engine, "a", 50, 6, until=3600)  # At 56 after an hour
+    assert engine.trend("a") == pytest.approx(6.0)
+    # (85 - 56) / 6 hours after the last reading
+    assert engine.time_to_threshold("a", now=3600) == pytest.approx(29 / 6 * 3600)
+    assert engine.time_to_threshold("a", now=7200) == pytest.approx(29 / 6 * 3600 - 3600)
+    assert engine.time_to_threshold("a", threshold=62, now=3600) == pytest.approx(3600)
+
+
+def test_time_to_threshold_without_a_rise(engine):
+    rise(engine, "falling", 60, -6, until=3600)
+    rise(engine, "over", 86, 1, until=3600)
+    rise(engine, "short", 50, 6, until=600)
+    assert engine.time_to_threshold("falling", now=3600) is None
+    assert engine.time_to_threshold("over", now=3600) == 0.0
+    assert engine.time_to_threshold("short", now=3600) is None
+    assert engine.time_to_threshold("unknown") is None
+
+
+def test_forecast_raises_a_warning_before_critical(engine):
+    engine.set_filtering(forecast=3600)
+    transitions = []
+    engine.transitions.subscribe(transitions.extend)
+    # 12 %/h from 50: critical is under an hour away from about 74 on
+    rise(engine, "a", 50, 12, until=3 * 3600)
+    assert changes(transitions)[0] == ("a", NORMAL, WARNING)
+    assert transitions[0].reason == FORECAST
+    assert transitions[0].level < 75
+    assert changes(transitions)[-1] == ("a", WARNING, CRITICAL)
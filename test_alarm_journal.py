@@ -0,0 +1,301 @@
+# test_alarm_journal.py
+import os
+import threading
+import numpy as np
+import pytest
+from alarm_engine import AlarmEngine, AlarmTransition, NORMAL, WARNING, CRITICAL, LEVEL
+from alarm_journal import (AlarmJournal, SQLiteAlarmJournal, journal_for_database,
+                           TRIGGER, CLEAR, ACKNOWLEDGE)
+from mock_database import MockDatabase
+from sqlite_database import SQLiteDatabase
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def open_journal(request, tmp_path):
+    """Opens journals of one backend on the same file and closes them afterwards"""
+    opened = []
+
+    def open_journal():
+        if request.param == "file":
+            journal = AlarmJournal(str(tmp_path / "alarm_journal.log"))
+        else:
+            journal = SQLiteAlarmJournal(str(tmp_path / "alarms.db"))
+        opened.append(journal)
+        return journal
+
+    yield open_journal
+    for journal in opened:
+        journal.close()
+
+
+@pytest.fixture
+def file_journal(tmp_path):
+    journal = AlarmJournal(str(tmp_path / "alarm_journal.log"))
+    yield journal
+    journal.close()
+
+
+def transition(sensor_id, new_state, ts, old_state=NORMAL, level=80.0):
+    return AlarmTransition(sensor_id, old_state, new_state, level, ts, LEVEL)
+
+
+def file_lines(journal):
+    with open(journal.filename, "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+
+def all_pages(journal, limit, **filters):
+    """Every event matching filters, fetched limit at a time"""
+    events, before = [], None
+    while True:
+        page = journal.query(before=before, limit=limit, **filters)
+        assert len(page) <= limit
+        events.extend(page)
+        if len(page) < limit:
+            return events
+        before = page[-1]
+
+
+def test_events_survive_reopen(open_journal):
+    journal = open_journal()
+    trigger = journal.append("Sensor 1", TRIGGER, WARNING, 80, "Warning water level", ts=100)
+    journal.append("Sensor 1", CLEAR, NORMAL, 60.5, "Back to normal", ts=200)
+    assert (trigger.ts, trigger.sensor_id, trigger.kind, trigger.state, trigger.level) == (
+        100.0, "Sensor 1", TRIGGER, WARNING, 80.0)
+    if hasattr(journal, "flush"):
+        assert journal.flush()
+    journal.close()
+
+    events = open_journal().query()
+    assert [(e.ts, e.kind, e.state, e.level, e.message) for e in events] == [
+        (200.0, CLEAR, NORMAL, 60.5, "Back to normal"),
+        (100.0, TRIGGER, WARNING, 80.0, "Warning water level")]
+    assert events[1].event_id == trigger.event_id
+
+
+def test_unknown_kind_is_rejected(open_journal):
+    with pytest.raises(ValueError):
+        open_journal().append("Sensor 1", "explode")
+
+
+def test_query_filters_and_count(open_journal):
+    journal = open_journal()
+    for i in range(30):
+        journal.append(f"Sensor {i % 3 + 1}", TRIGGER, WARNING, 80, ts=1000 + i)
+    assert journal.count() == 30
+    assert journal.count(["Sensor 1"]) == 10
+    assert journal.count(["Sensor 1", "Sensor 3", "Unknown"]) == 20
+    assert journal.count(start=1010, end=1020) == 10
+    assert journal.count(["Sensor 2"], start=1010, end=1020) == 4
+
+    events = journal.query(["Sensor 2"], start=1010, end=1020)
+    assert [e.ts for e in events] == [1019.0, 1016.0, 1013.0, 1010.0]
+    assert journal.query(["Unknown"]) == []
+    assert [e.ts for e in journal.query(limit=2)] == [1029.0, 1028.0]
+
+
+@pytest.mark.parametrize("sensor_ids", [None, ["Sensor 2"], ["Sensor 1", "Sensor 3"]])
+def test_pages_cover_every_event_once(open_journal, monkeypatch, sensor_ids):
+    # A small scan chunk makes sensor pages of the file journal span several chunks
+    monkeypatch.setattr(AlarmJournal, "SCAN_CHUNK", 4)
+    journal = open_journal()
+    expected = []
+    for i in range(60):
+        # Runs of equal times are ordered by event id
+        event = journal.append(f"Sensor {i % 3 + 1}", TRIGGER, WARNING, 80, ts=1000 + i // 4)
+        if sensor_ids is None or event.sensor_id in sensor_ids:
+            expected.append(event)
+    expected.reverse()
+
+    assert all_pages(journal, 7, sensor_ids=sensor_ids) == expected
+    assert all_pages(journal, 5, sensor_ids=sensor_ids, start=1003, end=1011) == [
+        e for e in expected if 1003 <= e.ts < 1011]
+
+
+def test_acknowledge_follows_the_newest_state(open_journal):
+    journal = open_journal()
+    assert journal.last_state("Sensor 1") == NORMAL
+    assert not journal.unacknowledged("Sensor 1")
+
+    journal.append("Sensor 1", TRIGGER, CRITICAL, 90, ts=100)
+    assert journal.unacknowledged("Sensor 1")
+    event = journal.acknowledge("Sensor 1", "Seen by operator")
+    assert (event.kind, event.state, event.message) == (ACKNOWLEDGE, CRITICAL, "Seen by operator")
+    assert journal.last_state("Sensor 1") == CRITICAL
+    assert not journal.unacknowledged("Sensor 1")
+
+    journal.append("Sensor 1", TRIGGER, WARNING, 80)
+    assert journal.unacknowledged("Sensor 1")
+    if hasattr(journal, "flush"):
+        assert journal.flush()
+    journal.close()
+
+    reopened = open_journal()
+    assert reopened.last_state("Sensor 1") == WARNING
+    assert reopened.unacknowledged("Sensor 1")
+
+
+def test_repeated_states_are_recorded_once(open_journal):
+    journal = open_journal()
+    journal.record([transition("Sensor 1", WARNING, 100), transition("Sensor 2", CRITICAL, 100)])
+    journal.record([transition("Sensor 1", WARNING, 110, old_state=CRITICAL)])
+    journal.record([transition("Sensor 1", NORMAL, 120, old_state=WARNING, level=50)])
+    assert [(e.sensor_id, e.kind, e.state) for e in journal.query()] == [
+        ("Sensor 1", CLEAR, NORMAL), ("Sensor 2", TRIGGER, CRITICAL), ("Sensor 1", TRIGGER, WARNING)]
+    assert journal.query()[0].message == "Water level back to normal: 50.00%"
+
+    # States at startup that the journal already holds are not recorded again
+    journal.record_states({"Sensor 1": (NORMAL, 50.0), "Sensor 2": (CRITICAL, 90.0),
+                           "Sensor 3": (WARNING, 77.0)})
+    assert journal.count() == 4
+    assert journal.query(limit=1)[0].message == "Warning at startup: 77.00%"
+
+
+def test_event_ids_are_byte_offsets(file_journal):
+    first = file_journal.append("Sensor 1", TRIGGER, WARNING, 80, "Tab\tand\nnewline", ts=100)
+    second = file_journal.append("Sensor 2", TRIGGER, CRITICAL, ts=101)
+    assert file_journal.flush()
+    lines = file_lines(file_journal)
+    assert len(lines) == 2
+    assert first.event_id == 0
+    assert second.event_id == len(lines[0])
+    assert first.message == "Tab and newline"
+    assert second.level is None and second.message == ""
+
+
+def test_unwritten_events_are_read_from_memory(file_journal, monkeypatch):
+    file_journal.append("Sensor 1", TRIGGER, WARNING, 80, ts=100)
+    assert file_journal.flush()
+
+    # Hold the writer thread until the events below have been queried
+    release = threading.Event()
+    write = file_journal._flush_pending
+
+    def held_write():
+        release.wait(5)
+        return write()
+
+    monkeypatch.setattr(file_journal._writer, "_flush_callback", held_write)
+    file_journal.append("Sensor 2", TRIGGER, CRITICAL, 90, ts=200)
+    file_journal.append("Sensor 1", CLEAR, NORMAL, 60, ts=150)
+    assert len(file_lines(file_journal)) == 1
+    assert [(e.sensor_id, e.ts) for e in file_journal.query()] == [
+        ("Sensor 2", 200.0), ("Sensor 1", 150.0), ("Sensor 1", 100.0)]
+    assert [e.ts for e in file_journal.query(["Sensor 1"])] == [150.0, 100.0]
+    assert file_journal.count() == 3
+
+    release.set()
+    assert file_journal.flush()
+    assert len(file_lines(file_journal)) == 3
+    assert file_journal._unwritten == {}
+    assert [e.ts for e in file_journal.query()] == [200.0, 150.0, 100.0]
+
+
+def test_index_stays_sorted_by_time(file_journal):
+    for ts in [300, 100, 200, 100, 400]:
+        file_journal.append("Sensor 1", TRIGGER, WARNING, ts=ts)
+    size = file_journal._size
+    assert size == 5
+    assert np.all(np.diff(file_journal._ts[:size]) >= 0)
+    # Equal times keep file order
+    assert list(file_journal._offsets[:size][file_journal._ts[:size] == 100]) == sorted(
+        file_journal._offsets[:size][file_journal._ts[:size] == 100])
+    assert [e.ts for e in file_journal.query()] == [400.0, 300.0, 200.0, 100.0, 100.0]
+
+
+def test_index_grows_past_its_capacity(file_journal):
+    for i in range(3000):
+        file_journal.append(f"Sensor {i % 2}", TRIGGER, WARNING, ts=i)
+    assert file_journal.count() == 3000
+    assert file_journal.count(["Sensor 1"], start=1000, end=2000) == 500
+    assert [e.ts for e in file_journal.query(["Sensor 0"], limit=3)] == [2998.0, 2996.0, 2994.0]
+
+
+def test_torn_last_line_is_cut_off_on_reopen(tmp_path, capsys):
+    filename = str(tmp_path / "alarm_journal.log")
+    journal = AlarmJournal(filename)
+    journal.append("Sensor 1", TRIGGER, WARNING, 80, ts=100)
+    journal.append("Sensor 1", CLEAR, NORMAL, 60, ts=200)
+    journal.close()
+    size = os.path.getsize(filename)
+    with open(filename, "ab") as f:
+        f.write(b"300.0\tSensor 1\ttrig")
+
+    journal = AlarmJournal(filename)
+    try:
+        assert os.path.getsize(filename) == size
+        assert journal.count() == 2
+        assert journal.last_state("Sensor 1") == NORMAL
+        # The next event starts where the torn line was
+        event = journal.append("Sensor 1", TRIGGER, CRITICAL, 90, ts=300)
+        assert event.event_id == size
+    finally:
+        journal.close()
+
+    journal = AlarmJournal(filename)
+    try:
+        assert [(e.ts, e.state) for e in journal.query()] == [
+            (300.0, CRITICAL), (200.0, NORMAL), (100.0, WARNING)]
+        assert journal.last_state("Sensor 1") == CRITICAL
+    finally:
+        journal.close()
+    assert "Error" not in capsys.readouterr().out
+
+
+class TornFile:
+    """Stands in for the journal file: writes half of the data, then fails"""
+
+    def __init__(self, f):
+        self._file = f
+
+    def write(self, data):
+        self._file.write(data[:len(data) // 2])
+        self._file.flush()
+        raise OSError("No space left on device")
+
+    def close(self):
+        self._file.close()
+
+
+def test_failed_write_is_truncated_and_retried(file_journal, capsys):
+    file_journal.append("Sensor 1", TRIGGER, WARNING, 80, ts=100)
+    assert file_journal.flush()
+    size = os.path.getsize(file_journal.filename)
+
+    file_journal._file = TornFile(file_journal._file)
+    event = file_journal.append("Sensor 2", TRIGGER, CRITICAL, 90, ts=200)
+    assert not file_journal.flush()
+    assert "Error writing alarm journal: No space left on device" in capsys.readouterr().out
+    # The partial line is gone and the event is still served from memory
+    assert os.path.getsize(file_journal.filename) == size
+    assert file_journal.query(limit=1) == [event]
+
+    # The retry appends the whole line where the torn one started
+    assert file_journal.flush()
+    lines = file_lines(file_journal)
+    assert len(lines) == 2 and len(lines[0]) == event.event_id
+    assert file_journal._parse(event.event_id, lines[1]) == event
+
+
+@pytest.mark.parametrize("backend", [MockDatabase, SQLiteDatabase])
+def test_journal_for_database_records_the_engine(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    db = backend()
+    try:
+        engine = AlarmEngine.for_database(db)
+        engine.set_filtering(deadband=0)
+        journal = journal_for_database(db)
+        assert journal_for_database(db) is journal
+        assert isinstance(journal, AlarmJournal if backend is MockDatabase else SQLiteAlarmJournal)
+        # States reached before the journal was opened are recorded at startup
+        alarms = {sensor_id for sensor_id, (state, _) in engine.states().items() if state != NORMAL}
+        assert {e.sensor_id for e in journal.query()} == alarms
+
+        engine.evaluate(["Sensor 9"], [90], ts=1000)
+        engine.evaluate(["Sensor 9"], [91], ts=1001)
+        engine.evaluate(["Sensor 9"], [40], ts=1002)
+        assert [(e.kind, e.state, e.ts) for e in journal.query(["Sensor 9"])] == [
+            (CLEAR, NORMAL, 1002.0), (TRIGGER, CRITICAL, 1000.0)]
+        journal.close()
+    finally:
+        db.close()
@@ -0,0 +1,57 @@
+# test_background_writer.py
+import threading
+from background_writer import BackgroundWriter
+
+
+def test_flush_waits_for_the_write():
+    written = []
+    writer = BackgroundWriter(lambda: written.append(1), interval=10)
+    writer.mark_dirty()
+    assert writer.flush(timeout=5)
+    assert written
+    assert writer.close()
+
+
+def test_marks_are_coalesced():
+    gate = threading.Event()
+    calls = []
+
+    def write():
+        gate.wait(5)
+        calls.append(1)
+
+    writer = BackgroundWriter(write, interval=0)
+    writer.mark_dirty()
+    for _ in range(10):
+        writer.mark_dirty()
+    gate.set()
+    assert writer.flush(timeout=5)
+    assert len(calls) <= 2
+    writer.close()
+
+
+def test_failed_write_is_not_reported_as_flushed():
+    results = [False]
+    calls = []
+
+    def write():
+        calls.append(1)
+        return results.pop(0) if results else True
+
+    writer = BackgroundWriter(write, interval=0.05)
+    writer.mark_dirty()
+    assert not writer.flush(timeout=5)
+    # The retry after the interval succeeds
+    assert writer.flush(timeout=5)
+    assert len(calls) == 2
+    assert writer.close()
+
+
+def test_exception_counts_as_failure():
+    def write():
+        raise OSError("disk full")
+
+    writer = BackgroundWriter(write, interval=0.05)
+    writer.mark_dirty()
+    assert not writer.flush(timeout=5)
+    assert not writer.close()
@@ -0,0 +1,50 @@
+# test_change_events.py
+from change_events import ChangeEvent, ChangeNotifier, READINGS_ADDED, SETTINGS_CHANGED, merge_events
+
+
+def test_listeners_are_called_in_order_and_first_goes_first():
+    notifier = ChangeNotifier()
+    calls = []
+    notifier.subscribe(lambda events: calls.append("a"))
+    notifier.subscribe(lambda events: calls.append("b"))
+    notifier.subscribe(lambda events: calls.append("first"), first=True)
+    notifier.publish([ChangeEvent(READINGS_ADDED, "Sensor 1")])
+    assert calls == ["first", "a", "b"]
+
+
+def test_empty_changes_are_not_published():
+    notifier = ChangeNotifier()
+    calls = []
+    notifier.subscribe(calls.append)
+    notifier.publish([])
+    assert calls == []
+
+
+def test_failing_listener_does_not_stop_the_others(capsys):
+    notifier = ChangeNotifier()
+    calls = []
+    notifier.subscribe(lambda events: 1 / 0)
+    notifier.subscribe(calls.append)
+    notifier.unsubscribe(print)  # Not subscribed: ignored
+    event = ChangeEvent(READINGS_ADDED, "Sensor 1")
+    notifier.publish([event])
+    assert calls == [[event]]
+    assert "Error in change listener" in capsys.readouterr().out
+
+    notifier.unsubscribe(calls.append)
+    notifier.publish([event])
+    assert calls == [[event]]
+
+
+def test_merged_events_join_their_readings():
+    events = merge_events([
+        ChangeEvent(READINGS_ADDED, "Sensor 1", ((1.0, 50.0),)),
+        ChangeEvent(SETTINGS_CHANGED, None),
+        ChangeEvent(READINGS_ADDED, "Sensor 2"),
+        ChangeEvent(READINGS_ADDED, "Sensor 1", ((2.0, 51.0), (3.0, 52.0))),
+        ChangeEvent(READINGS_ADDED, "Sensor 2", ((2.0, 40.0),)),
+        ChangeEvent(SETTINGS_CHANGED, None),
+    ])
+    assert events == [ChangeEvent(READINGS_ADDED, "Sensor 1", ((1.0, 50.0), (2.0, 51.0), (3.0, 52.0))),
+                      ChangeEvent(SETTINGS_CHANGED, None),
+                      ChangeEvent(READINGS_ADDED, "Sensor 2")]
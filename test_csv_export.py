@@ -0,0 +1,159 @@
+# test_csv_export.py
+import csv
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pytest
+from csv_export import HEADER, export_csv, local_stamps
+from mock_database import MockDatabase
+from sqlite_database import SQLiteDatabase
+
+T0 = 1700000000.0  # Long before the demo data
+
+
+@pytest.fixture(params=[MockDatabase, SQLiteDatabase])
+def db(request, tmp_path, monkeypatch):
+    """Each backend in a fresh directory, with ten readings per sensor from T0"""
+    monkeypatch.chdir(tmp_path)
+    db = request.param()
+    db.update_sensor_readings([(sensor_id, T0 + 60 * k, 40.0 + k + i, 90.0 - k)
+                               for i, sensor_id in enumerate(["Sensor 1", "Sensor 2", "Sensor 3"])
+                               for k in range(10)])
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def stockholm():
+    """Local time is Europe/Stockholm (UTC+1, DST from 2024-03-31 02:00)"""
+    saved = os.environ.get("TZ")
+    os.environ["TZ"] = "Europe/Stockholm"
+    time.tzset()
+    yield
+    if saved is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = saved
+    time.tzset()
+
+
+def read_csv(filename):
+    with open(filename, newline="") as f:
+        return list(csv.reader(f))
+
+
+def stamp(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def test_export_filters_sensors_and_time(db, tmp_path):
+    filename = str(tmp_path / "export.csv")
+    # Both ends are inclusive
+    assert export_csv(db, filename, ["Sensor 2", "Sensor 3"], T0 + 120, T0 + 240) == 6
+    rows = read_csv(filename)
+    assert rows[0] == HEADER == ["Sensor", "Date", "Water Level (%)", "Battery Level (%)"]
+    assert rows[1:] == [[name, stamp(T0 + 60 * k), str(40.0 + k + i), str(90.0 - k)]
+                        for i, name in [(1, "Reserve Tank"), (2, "Overflow Tank")]
+                        for k in range(2, 5)]
+    assert not os.path.exists(filename + ".part")
+
+
+def test_export_takes_time_strings_and_skips_unknown_sensors(db, tmp_path):
+    filename = str(tmp_path / "export.csv")
+    assert export_csv(db, filename, ["Sensor 1", "Sensor 9"], stamp(T0), stamp(T0 + 60)) == 2
+    assert [row[1] for row in read_csv(filename)[1:]] == [stamp(T0), stamp(T0 + 60)]
+
+
+def test_progress_is_reported_per_chunk(db, tmp_path):
+    calls = []
+    done = export_csv(db, str(tmp_path / "export.csv"), ["Sensor 1", "Sensor 2"], T0, T0 + 3600,
+                      progress=lambda done, total: calls.append((done, total)), chunk_size=4)
+    assert done == 20
+    assert calls == [(0, 20), (4, 20), (8, 20), (10, 20), (14, 20), (18, 20), (20, 20)]
+
+
+def test_cancel_removes_the_part_file(db, tmp_path):
+    filename = str(tmp_path / "export.csv")
+    checks = []
+
+    def cancelled():
+        checks.append(True)
+        # Stop before the second chunk, while the part file is open
+        return len(checks) > 1 and os.path.exists(filename + ".part")
+
+    assert export_csv(db, filename, start=T0, end=T0 + 3600, cancelled=cancelled,
+                      chunk_size=4) is None
+    assert len(checks) == 2
+    assert not os.path.exists(filename)
+    assert not os.path.exists(filename + ".part")
+
+    # The database method keeps its True/False contract
+    assert db.export_to_csv(filename, start=T0, cancelled=lambda: True) is False
+    assert not os.path.exists(filename) and not os.path.exists(filename + ".part")
+    assert db.export_to_csv(filename, start=T0, end=T0 + 3600) is True
+    assert len(read_csv(filename)) == 31
+
+
+def test_failed_export_removes_the_part_file(db, tmp_path):
+    filename = str(tmp_path / "export.csv")
+
+    def progress(done, total):
+        if done:
+            raise OSError("Disk full")
+
+    with pytest.raises(OSError):
+        export_csv(db, filename, start=T0, progress=progress)
+    assert not os.path.exists(filename) and not os.path.exists(filename + ".part")
+
+
+@pytest.mark.parametrize("count", [7, 8, 9])
+def test_history_chunks_split_at_the_chunk_size(db, count):
+    chunks = list(db.iter_history_arrays("Sensor 1", T0, T0 + 60 * (count - 1), chunk_size=4))
+    assert [len(ts) for ts, _, _ in chunks] == [4] * (count // 4) + ([count % 4] if count % 4 else [])
+    ts, water, battery = (np.concatenate(column) for column in zip(*chunks))
+    assert ts.tolist() == [T0 + 60 * k for k in range(count)]
+    assert water.tolist() == [40.0 + k for k in range(count)]
+    assert battery.tolist() == [90.0 - k for k in range(count)]
+
+
+def test_history_chunks_match_one_query(db):
+    chunks = list(db.iter_history_arrays("Sensor 3"))
+    assert len(chunks) == 1
+    ts, water, _ = db.get_history_arrays("Sensor 3")
+    assert chunks[0][0].tolist() == list(ts) and chunks[0][1].tolist() == list(water)
+    assert list(db.iter_history_arrays("Sensor 9")) == []
+    assert list(db.iter_history_arrays("Sensor 1", T0 - 100, T0 - 1)) == []
+
+
+def test_equal_timestamps_are_not_split_or_repeated(tmp_path, monkeypatch):
+    # The mock database keeps readings that share a timestamp
+    monkeypatch.chdir(tmp_path)
+    db = MockDatabase()
+    try:
+        times = [T0, T0 + 1, T0 + 1, T0 + 1, T0 + 1, T0 + 1, T0 + 2]
+        db.update_sensor_readings([("Sensor 1", t, 50.0 + k, 90.0) for k, t in enumerate(times)])
+        chunks = list(db.iter_history_arrays("Sensor 1", T0, T0 + 2, chunk_size=2))
+        assert np.concatenate([ts for ts, _, _ in chunks]).tolist() == times
+        assert sorted(np.concatenate([water for _, water, _ in chunks]).tolist()) == [
+            50.0 + k for k in range(len(times))]
+    finally:
+        db.close()
+
+
+def test_local_stamps_across_a_dst_change(stockholm):
+    # 2024-03-31 00:30 to 04:30 local time, clocks jump from 02:00 to 03:00
+    start = datetime(2024, 3, 31, 0, 30).timestamp()
+    ts = start + np.arange(0, 4 * 3600, 900.0)
+    stamps = local_stamps(ts)
+    assert stamps == [stamp(t) for t in ts.tolist()]
+    assert "2024-03-31 01:45:00" in stamps and "2024-03-31 03:00:00" in stamps
+    assert not any(s.startswith("2024-03-31 02:") for s in stamps)
+
+
+def test_local_stamps_of_one_offset_match_datetime(stockholm):
+    # Summer and winter chunks take the vectorized path; fractions are cut off
+    for start in [datetime(2024, 1, 15, 12).timestamp(), datetime(2024, 7, 15, 12).timestamp()]:
+        ts = start + np.arange(0, 86400, 3599.75)
+        assert local_stamps(ts) == [stamp(int(t)) for t in ts.tolist()]
+    assert local_stamps(np.empty(0)) == []
@@ -0,0 +1,125 @@
+# test_db_events.py
+import gc
+import threading
+import weakref
+import pytest
+from PyQt5.QtCore import QCoreApplication, QObject
+from change_events import (ChangeEvent, ChangeNotifier, READINGS_ADDED,
+                           SENSOR_CHANGED, SETTINGS_CHANGED)
+from db_events import DatabaseEvents
+
+
+class EventSource:
+    """Stands in for a database: DatabaseEvents only uses its events"""
+
+    def __init__(self):
+        self.events = ChangeNotifier()
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def source(app):
+    return EventSource()
+
+
+def readings(sensor_id):
+    return ChangeEvent(READINGS_ADDED, sensor_id)
+
+
+def test_events_of_one_tick_are_delivered_together(source):
+    bridge = DatabaseEvents(source)
+    delivered = []
+    bridge.subscribe(delivered.append)
+    source.events.publish([readings("Sensor 1")])
+    source.events.publish([readings("Sensor 1"), ChangeEvent(SENSOR_CHANGED, "Sensor 2")])
+    source.events.publish([ChangeEvent(SETTINGS_CHANGED, None), readings("Sensor 2")])
+    assert delivered == []  # Not before the event loop runs
+
+    QCoreApplication.processEvents()
+    assert delivered == [[readings("Sensor 1"), ChangeEvent(SENSOR_CHANGED, "Sensor 2"),
+                          ChangeEvent(SETTINGS_CHANGED, None), readings("Sensor 2")]]
+    QCoreApplication.processEvents()
+    assert len(delivered) == 1
+
+    source.events.publish([readings("Sensor 1")])
+    QCoreApplication.processEvents()
+    assert delivered[1:] == [[readings("Sensor 1")]]
+
+
+def test_events_from_another_thread_arrive_on_the_gui_thread(source):
+    bridge = DatabaseEvents(source)
+    threads = []
+    bridge.subscribe(lambda events: threads.append(threading.current_thread()))
+    writer = threading.Thread(target=source.events.publish, args=([readings("Sensor 1")],))
+    writer.start()
+    writer.join()
+    assert threads == []
+    QCoreApplication.processEvents()
+    assert threads == [threading.main_thread()]
+
+
+def test_subscribers_only_get_matching_events(source):
+    bridge = DatabaseEvents(source)
+    sensor_readings, sensor_two, everything = [], [], []
+    bridge.subscribe(sensor_readings.extend, sensor_ids=["Sensor 1"], kinds=[READINGS_ADDED])
+    bridge.subscribe(sensor_two.extend, sensor_ids=["Sensor 2"])
+    bridge.changed.connect(everything.extend)
+    events = [readings("Sensor 1"), readings("Sensor 2"), ChangeEvent(SENSOR_CHANGED, "Sensor 1"),
+              ChangeEvent(SETTINGS_CHANGED, None)]
+    source.events.publish(events)
+    QCoreApplication.processEvents()
+    assert sensor_readings == [readings("Sensor 1")]
+    # Settings belong to no sensor, so they pass a sensor filter
+    assert sensor_two == [readings("Sensor 2"), ChangeEvent(SETTINGS_CHANGED, None)]
+    assert everything == events
+
+
+def test_failing_subscriber_does_not_stop_the_others(source, capsys):
+    bridge = DatabaseEvents(source)
+    delivered = []
+    bridge.subscribe(lambda events: 1 / 0)
+    bridge.subscribe(delivered.extend)
+    source.events.publish([readings("Sensor 1")])
+    QCoreApplication.processEvents()
+    assert delivered == [readings("Sensor 1")]
+    assert "Error in change subscriber" in capsys.readouterr().out
+
+
+def test_subscription_ends_with_its_owner(source):
+    bridge = DatabaseEvents(source)
+    owner = QObject()
+    delivered = []
+    bridge.subscribe(delivered.append, owner=owner)
+    source.events.publish([readings("Sensor 1")])
+    QCoreApplication.processEvents()
+    assert len(delivered) == 1
+
+    del owner
+    gc.collect()
+    source.events.publish([readings("Sensor 1")])
+    QCoreApplication.processEvents()
+    assert len(delivered) == 1
+
+    bridge.subscribe(delivered.append)
+    bridge.unsubscribe(delivered.append)
+    source.events.publish([readings("Sensor 1")])
+    QCoreApplication.processEvents()
+    assert len(delivered) == 1
+
+
+def test_one_bridge_per_database_for_its_lifetime(app):
+    source = EventSource()
+    bridge = DatabaseEvents.for_database(source)
+    assert DatabaseEvents.for_database(source) is bridge
+    assert DatabaseEvents.for_database(EventSource()) is not bridge
+
+    bridges = len(DatabaseEvents._bridges)
+    ref = weakref.ref(bridge)
+    del bridge, source
+    gc.collect()
+    assert ref() is None
+    assert len(DatabaseEvents._bridges) == bridges - 1
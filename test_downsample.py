@@ -0,0 +1,55 @@
+# test_downsample.py
+import numpy as np
+from downsample import m4, visible_slice
+
+
+def series(count=100000, seed=5):
+    rng = np.random.default_rng(seed)
+    x = np.arange(count, dtype=np.float64)
+    y = np.cumsum(rng.normal(0, 1, count))
+    return x, y
+
+
+def test_short_series_is_returned_as_is():
+    x, y = series(count=30)
+    dx, dy = m4(x, y, buckets=10)
+    np.testing.assert_array_equal(dx, x)
+    np.testing.assert_array_equal(dy, y)
+
+
+def test_at_most_four_points_per_bucket():
+    x, y = series()
+    dx, dy = m4(x, y, buckets=500)
+    assert len(dx) <= 4 * 500 + 2
+    assert np.all(np.diff(dx) > 0)
+
+
+def test_first_last_min_and_max_of_every_bucket_are_kept():
+    x, y = series()
+    buckets = 250
+    dx, dy = m4(x, y, buckets)
+    kept = set(dx.tolist())
+    edges = np.linspace(x[0], x[-1], buckets + 1)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        inside = (x >= lo) & (x < hi)
+        if not inside.any():
+            continue
+        bx, by = x[inside], y[inside]
+        assert {bx[0], bx[-1], bx[np.argmin(by)], bx[np.argmax(by)]} <= kept
+
+
+def test_spikes_survive():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.zeros_like(x)
+    y[1234] = 100.0
+    y[8765] = -100.0
+    dx, dy = m4(x, y, buckets=50)
+    assert dy.max() == 100.0 and dy.min() == -100.0
+
+
+def test_visible_range_is_widened_by_one_point():
+    x, y = series(count=1000)
+    assert visible_slice(x, (100.5, 200.5)) == (100, 202)
+    assert visible_slice(x) == (0, 1000)
+    dx, _ = m4(x, y, buckets=10, x_range=(100.5, 200.5))
+    assert dx[0] == 100.0 and dx[-1] == 201.0
@@ -0,0 +1,94 @@
+# test_history_tiles.py
+import time
+import numpy as np
+from history_tiles import HistoryTiles
+
+
+class CountingDatabase:
+    """Serves get_rollup_arrays() from in-memory readings and counts the calls"""
+
+    def __init__(self, ts):
+        self.ts = np.asarray(ts, dtype=np.float64)
+        self.queries = []
+
+    def get_rollup_arrays(self, sensor_id, start=None, end=None, resolution=None):
+        self.queries.append((resolution, start, end))
+        inside = (self.ts >= start) & (self.ts <= end)
+        return {"resolution": resolution, "ts": self.ts[inside], "mean": self.ts[inside] / 1000}
+
+
+SPAN = HistoryTiles.RAW_TILE
+PAST = np.floor((time.time() - 30 * 86400) / SPAN) * SPAN  # Start of a tile well in the past
+
+
+def test_readings_on_a_tile_boundary_are_returned_once():
+    db = CountingDatabase(PAST + np.arange(0, 3 * SPAN, 600.0))  # One every 10 minutes
+    tiles = HistoryTiles(db, "Sensor 1")
+    ts, levels = tiles.get(PAST + 100, PAST + 2 * SPAN + 100, 0)
+    assert len(db.queries) == 3
+    np.testing.assert_array_equal(ts, db.ts)
+    np.testing.assert_array_equal(levels, db.ts / 1000)
+    assert np.count_nonzero(ts == PAST + SPAN) == 1
+
+
+def test_closed_tiles_are_reused():
+    db = CountingDatabase(PAST + np.arange(0, 4 * SPAN, 600.0))
+    tiles = HistoryTiles(db, "Sensor 1")
+    tiles.get(PAST, PAST + 2 * SPAN - 1, 0)
+    assert len(db.queries) == 2
+    # Panning over the same tiles, and one step further
+    tiles.get(PAST + 600, PAST + 2 * SPAN - 600, 0)
+    assert len(db.queries) == 2
+    tiles.get(PAST + SPAN, PAST + 3 * SPAN - 1, 0)
+    assert len(db.queries) == 3
+    assert tiles.fetches == 3
+
+
+def test_each_resolution_has_its_own_tiles():
+    db = CountingDatabase([PAST])
+    tiles = HistoryTiles(db, "Sensor 1")
+    tiles.get(PAST, PAST + 1, 0)
+    tiles.get(PAST, PAST + 1, 60)
+    tiles.get(PAST, PAST + 1, 0)
+    assert [query[0] for query in db.queries] == [0, 60]
+    assert db.queries[1][2] - db.queries[1][1] == 60 * HistoryTiles.POINTS_PER_TILE
+
+
+def test_least_recently_used_tile_is_dropped():
+    db = CountingDatabase([])
+    tiles = HistoryTiles(db, "Sensor 1", capacity=2)
+    first, second, third = PAST, PAST + SPAN, PAST + 2 * SPAN
+    tiles.get(first, first, 0)
+    tiles.get(second, second, 0)
+    tiles.get(first, first, 0)    # Used again: second is now the oldest
+    tiles.get(third, third, 0)
+    assert len(db.queries) == 3
+    tiles.get(first, first, 0)
+    assert len(db.queries) == 3
+    tiles.get(second, second, 0)
+    assert len(db.queries) == 4
+    assert db.queries[-1][1] == second
+
+
+def test_open_tiles_are_fetched_again_after_new_readings():
+    current = np.floor(time.time() / SPAN) * SPAN  # The tile still filling up
+    db = CountingDatabase([PAST + 60, current])
+    tiles = HistoryTiles(db, "Sensor 1")
+    tiles.get(PAST, PAST + 1, 0)
+    ts, _ = tiles.get(current, current + 1, 0)
+    assert ts.tolist() == [current]
+    assert len(db.queries) == 2
+
+    db.ts = np.append(db.ts, current + 1)
+    ts, _ = tiles.get(current, current + 1, 0)
+    assert ts.tolist() == [current]  # Still the cached tile
+    tiles.invalidate_open()
+    ts, _ = tiles.get(current, current + 1, 0)
+    assert ts.tolist() == [current, current + 1]
+    # The closed tile in the past was kept
+    tiles.get(PAST, PAST + 1, 0)
+    assert len(db.queries) == 3
+
+    tiles.clear()
+    tiles.get(PAST, PAST + 1, 0)
+    assert len(db.queries) == 4
@@ -0,0 +1,275 @@
+# test_mock_database.py
+import gc
+import json
+import os
+import weakref
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from mock_database import MockDatabase
+from time_series import SensorSeries
+from change_events import READINGS_ADDED, SENSOR_CHANGED, SETTINGS_CHANGED
+
+
+@pytest.fixture
+def open_db(tmp_path, monkeypatch):
+    """Opens MockDatabases on files in a fresh directory and closes them afterwards"""
+    monkeypatch.chdir(tmp_path)
+    opened = []
+
+    def open_db(**kwargs):
+        db = MockDatabase(**kwargs)
+        opened.append(db)
+        return db
+
+    yield open_db
+    for db in opened:
+        db.close()
+
+
+def log_lines(db):
+    if not os.path.exists(db.log_filename):
+        return []
+    with open(db.log_filename) as f:
+        return f.read().splitlines()
+
+
+def test_changes_are_replayed_from_the_log_after_a_crash(open_db):
+    db = open_db()
+    readings = len(db.get_sensor_data("Sensor 1")["readings"])
+    db.update_sensor_reading("Sensor 1", 42.5, 80)
+    db.save_settings({"warning_threshold": 60})
+    assert db.flush()
+    assert len(log_lines(db)) == 2
+
+    # Opened again without close(): the changes are only in the log
+    reopened = open_db()
+    assert reopened.get_current_level("Sensor 1") == 42.5
+    assert reopened.get_settings()["warning_threshold"] == 60
+    assert len(reopened.get_sensor_data("Sensor 1")["readings"]) == readings + 1
+
+
+def test_replayed_records_are_not_applied_twice(open_db):
+    db = open_db()
+    db.update_sensor_reading("Sensor 2", 33.0, 70)
+    assert db.flush()
+    first = open_db()
+    count = len(first.get_sensor_data("Sensor 2")["readings"])
+    second = open_db()
+    assert len(second.get_sensor_data("Sensor 2")["readings"]) == count
+
+
+def test_torn_log_line_is_ignored(open_db):
+    db = open_db()
+    db.update_sensor_reading("Sensor 1", 42.5, 80)
+    assert db.flush()
+    with open(db.log_filename, "a") as f:
+        f.write('{"op":"settings","values":{"warning_thr')
+
+    reopened = open_db()
+    assert reopened.get_current_level("Sensor 1") == 42.5
+    assert reopened.get_settings()["warning_threshold"] == 75
+
+
+def test_log_is_compacted_into_a_snapshot(open_db):
+    db = open_db()
+    db.COMPACT_AFTER = 3
+    for level in (10.0, 20.0, 30.0, 40.0, 50.0):
+        db.update_sensor_reading("Sensor 3", level, 60)
+        assert db.flush()
+    assert len(log_lines(db)) < db.COMPACT_AFTER
+    assert not os.path.exists(db.rotated_log_filename)
+
+    reopened = open_db()
+    levels = [reading["water_level"] for reading in reopened.get_sensor_data("Sensor 3")["readings"]]
+    assert levels[-5:] == [10.0, 20.0, 30.0, 40.0, 50.0]
+
+
+@pytest.mark.parametrize("snapshot_format", ["binary", "json"])
+def test_snapshot_mode_survives_reopen(open_db, snapshot_format):
+    db = open_db(persistence="snapshot", snapshot_format=snapshot_format)
+    db.save_settings({"update_interval": 5})
+    assert db.flush()
+    reopened = open_db(persistence="snapshot", snapshot_format=snapshot_format)
+    assert reopened.get_settings()["update_interval"] == 5
+
+
+def test_closed_database_is_not_kept_alive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = MockDatabase()
+    db.update_sensor_reading("Sensor 1", 42.5, 80)
+    assert db.close()
+    ref = weakref.ref(db)
+    del db
+    gc.collect()
+    assert ref() is None
+
+
+def test_get_range_selects_a_time_window(open_db):
+    db = open_db()
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = (today - timedelta(days=2)).strftime("%Y-%m-%d")
+    dates = [reading["date"] for reading in db.get_range("Sensor 1", start)]
+    assert dates == [(today - timedelta(days=days)).strftime("%Y-%m-%d") for days in (2, 1, 0)]
+    assert len(db.get_range("Sensor 1", today - timedelta(days=6), today - timedelta(days=5))) == 2
+    assert db.get_range("Unknown", start) == []
+
+
+def test_readings_keep_their_full_timestamp(open_db):
+    db = open_db()
+    before = datetime.now().timestamp()
+    db.update_sensor_reading("Sensor 1", 55.5, 90)
+    ts, water, _ = db.get_history_arrays("Sensor 1", before - 1)
+    assert len(ts) == 1 and ts[0] >= before
+    assert water[0] == 55.5
+
+
+def test_batch_is_persisted_as_one_log_record(open_db):
+    db = open_db()
+    start = datetime.now().timestamp() + 60
+    batch = [(f"Sensor {1 + i % 3}", start + i, 40 + i % 20, 80) for i in range(300)]
+    batch.append(("Sensor 7", start, 50, 50))
+    accepted, rejects = db.update_sensor_readings(batch)
+    assert (accepted, rejects) == (300, [(300, "Unknown sensor")])
+    assert db.flush()
+    assert len(log_lines(db)) == 1
+
+    # The newest reading of each sensor becomes its current value
+    assert db.get_current_level("Sensor 3") == 40 + 299 % 20  # Row 299 is Sensor 3's last
+    reopened = open_db()
+    assert reopened.count_readings("Sensor 1", start) == 100
+
+
+def test_batch_without_valid_rows_writes_nothing(open_db):
+    db = open_db()
+    assert db.update_sensor_readings([("Sensor 1", None, 500, 50)]) == (0, [(0, "Water level missing or out of range")])
+    assert db.flush()
+    assert log_lines(db) == []
+
+
+def test_transaction_is_persisted_as_one_record(open_db):
+    db = open_db()
+    published = []
+    db.events.subscribe(published.append)
+    with db.transaction():
+        db.save_settings({"warning_threshold": 70, "critical_threshold": 80})
+        db.update_sensor_settings("Sensor 2", {"enabled": False})
+        db.update_sensor_reading("Sensor 1", 12.0, 50)
+        assert published == []  # Announced only once committed
+    assert db.flush()
+    assert len(log_lines(db)) == 1
+    assert len(published) == 1
+    assert {event.kind for event in published[0]} == {READINGS_ADDED, SENSOR_CHANGED, SETTINGS_CHANGED}
+
+    reopened = open_db()
+    assert reopened.get_settings()["critical_threshold"] == 80
+    assert reopened.get_sensor_data("Sensor 2")["enabled"] is False
+    assert reopened.get_current_level("Sensor 1") == 12.0
+
+
+def test_failed_transaction_is_rolled_back(open_db):
+    db = open_db()
+    published = []
+    db.events.subscribe(published.append)
+    settings = dict(db.get_settings())
+    level = db.get_current_level("Sensor 1")
+    readings = db.count_readings("Sensor 1")
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.save_settings({"warning_threshold": 10, "new_setting": 1})
+            db.update_sensor_settings("Sensor 1", {"offset": 5})
+            db.update_sensor_readings([("Sensor 1", datetime.now().timestamp() - 3 * 86400, 99, 99)])
+            raise RuntimeError("cancelled")
+
+    assert db.get_settings() == settings
+    assert db.get_sensor_data("Sensor 1")["offset"] == 0
+    assert db.get_current_level("Sensor 1") == level
+    assert db.count_readings("Sensor 1") == readings
+    assert db.flush()
+    assert log_lines(db) == []
+    assert published == []
+
+
+def test_nested_transaction_joins_the_outer_one(open_db):
+    db = open_db()
+    with db.transaction():
+        db.save_settings({"update_interval": 3})
+        with db.transaction():
+            db.save_settings({"update_interval": 4})
+    assert db.flush()
+    assert len(log_lines(db)) == 1
+    assert db.get_settings()["update_interval"] == 4
+
+
+def history_files(db):
+    return sorted(name for name in os.listdir(db.HISTORY_DIR) if name.endswith(SensorSeries.FILE_SUFFIXES))
+
+
+def test_readings_round_trip_through_binary_column_files(open_db):
+    db = open_db(persistence="snapshot")
+    start = datetime.now().timestamp() + 60
+    db.update_sensor_readings([("Sensor 2", start + i, 20 + i % 50, 90 - i % 7) for i in range(500)])
+    assert db.flush()
+    expected = [column.copy() for column in db.get_history_arrays("Sensor 2")]
+    with open(db.header_filename) as f:
+        header = json.load(f)
+    assert header["sensors"]["Sensor 2"]["readings"]["rows"] == len(expected[0])
+    assert len(history_files(db)) == 3 * len(SensorSeries.FILE_SUFFIXES)
+
+    reopened = open_db(persistence="snapshot")
+    series = reopened.get_sensor_data("Sensor 2")["readings"].series
+    assert series.path is not None  # Served from the column files, not read
+    for column, other in zip(expected, reopened.get_history_arrays("Sensor 2")):
+        np.testing.assert_array_equal(column, other)
+
+
+def test_stale_column_files_are_removed(open_db):
+    db = open_db(persistence="snapshot")
+    db.update_sensor_reading("Sensor 1", 50.0, 90)
+    assert db.flush()
+    before = history_files(db)
+
+    # A late reading moves rows, so the series is written to new files
+    db.update_sensor_readings([("Sensor 1", datetime.now().timestamp() - 10 * 86400, 40.0, 90)])
+    assert db.get_sensor_data("Sensor 1")["readings"].series.path is None
+    assert db.flush()
+    after = history_files(db)
+    old_files = [name for name in before if name.startswith("00_")]  # Sensor 1
+    new_files = [name for name in after if name.startswith("00_")]
+    assert len(old_files) == len(new_files) == len(SensorSeries.FILE_SUFFIXES)
+    assert not set(old_files) & set(new_files)
+    assert set(after) == set(before) - set(old_files) | set(new_files)
+    assert db.get_sensor_data("Sensor 1")["readings"].series.path is not None
+
+
+def test_rows_appended_after_the_snapshot_are_replayed_once(open_db):
+    db = open_db()
+    db.update_sensor_reading("Sensor 3", 10.0, 90)
+    db.COMPACT_AFTER = 1
+    assert db.flush()  # Snapshot; the history is now memory-mapped
+    db.COMPACT_AFTER = 1000
+    count = db.count_readings("Sensor 3")
+
+    # Written into the mapped file and the log, but the header still
+    # records the old length when the process dies
+    db.update_sensor_reading("Sensor 3", 20.0, 90)
+    assert db.get_sensor_data("Sensor 3")["readings"].series.path is not None
+    assert db.flush()
+    reopened = open_db()
+    assert reopened.count_readings("Sensor 3") == count + 1
+    assert reopened.get_current_level("Sensor 3") == 20.0
+
+
+def test_column_files_shorter_than_the_header_are_not_used(open_db, capsys):
+    db = open_db(persistence="snapshot")
+    db.save_settings({"update_interval": 5})
+    assert db.flush()
+    with open(db.header_filename) as f:
+        prefix = json.load(f)["sensors"]["Sensor 1"]["readings"]["file"]
+    with open(os.path.join(db.HISTORY_DIR, prefix + ".water"), "r+b") as f:
+        f.truncate(8)
+
+    reopened = open_db(persistence="snapshot")
+    assert "Error loading binary snapshot" in capsys.readouterr().out
+    assert reopened.get_settings()["update_interval"] == 15  # Started over
+    assert reopened.count_readings("Sensor 1") == 7
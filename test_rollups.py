@@ -0,0 +1,116 @@
+# test_rollups.py
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pytest
+from rollups import RollupTier, RollupPyramid, align_buckets, bucket_starts
+from time_series import SensorSeries
+
+
+@pytest.fixture
+def stockholm():
+    """Local time is Europe/Stockholm (UTC+1, DST from 2024-03-31 02:00)"""
+    saved = os.environ.get("TZ")
+    os.environ["TZ"] = "Europe/Stockholm"
+    time.tzset()
+    yield
+    if saved is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = saved
+    time.tzset()
+
+
+def readings(count=2000, start=1_700_000_000.0, step=37.0, seed=3):
+    rng = np.random.default_rng(seed)
+    ts = start + np.arange(count) * step
+    return ts, rng.uniform(0, 100, count), rng.uniform(50, 100, count)
+
+
+def test_tier_matches_direct_aggregation_in_any_order():
+    ts, water, battery = readings()
+    order = np.random.default_rng(1).permutation(len(ts))
+    tier = RollupTier("hour", 3600)
+    # Added in two shuffled parts, so both new and existing buckets are hit
+    half = len(ts) // 2
+    tier.add(ts[order[half:]], water[order[half:]], battery[order[half:]])
+    tier.add(ts[order[:half]], water[order[:half]], battery[order[:half]])
+    result = tier.arrays(0, len(tier))
+
+    buckets = np.floor(ts / 3600) * 3600
+    starts = np.unique(buckets)
+    np.testing.assert_array_equal(result["ts"], starts)
+    for key, reduce in (("mean", np.mean), ("min", np.min), ("max", np.max)):
+        np.testing.assert_allclose(result[key], [reduce(water[buckets == s]) for s in starts])
+    np.testing.assert_array_equal(result["count"], [np.sum(buckets == s) for s in starts])
+    np.testing.assert_allclose(result["battery"], [battery[buckets == s].mean() for s in starts])
+
+
+@pytest.mark.parametrize("span, points, expected", [
+    (3600, 10, 60),          # 60 minutes
+    (3600, 100, 60),         # Fewer minutes than points: the finest tier
+    (7 * 86400, 100, 3600),  # 168 hours
+    (365 * 86400, 300, 86400),
+])
+def test_tier_for_span_picks_the_coarsest_tier_with_enough_buckets(span, points, expected):
+    assert RollupPyramid.tier_for_span(span, points) == expected
+
+
+def test_tier_for_span_fallback():
+    assert RollupPyramid.tier_for_span(3600, 100, fallback=0) == 0
+    assert RollupPyramid.tier_for_span(86400, 100, fallback=0) == 60
+
+
+def test_select_serves_raw_readings_within_the_budget():
+    ts, water, battery = readings(count=50)
+    series = SensorSeries.from_columns(ts, water, battery)
+    result = RollupPyramid.from_series(series).select(series, max_points=100)
+    assert result["resolution"] == 0
+    np.testing.assert_array_equal(result["mean"], water)
+
+
+def test_select_uses_the_coarsest_tier_that_fills_the_budget():
+    ts, water, battery = readings(count=20000, step=60.0)  # About 14 days
+    series = SensorSeries.from_columns(ts, water, battery)
+    pyramid = RollupPyramid.from_series(series)
+    assert pyramid.select(series, max_points=200)["resolution"] == 3600
+    assert pyramid.select(series, max_points=10)["resolution"] == 86400
+    assert pyramid.select(series, max_points=1000)["resolution"] == 60
+    day = pyramid.select(series, resolution=86400)
+    assert day["count"].sum() == len(ts)
+    with pytest.raises(ValueError):
+        pyramid.select(series, resolution=1234)
+
+
+def test_align_buckets_places_values_on_a_shared_grid():
+    grid, matrix = align_buckets([0, 1, 1], [3600, 0, 7200], [1.0, 2.0, 3.0], 2, 0, 7200, 3600)
+    np.testing.assert_array_equal(grid, [0, 3600, 7200])
+    np.testing.assert_array_equal(matrix, [[np.nan, 1.0, np.nan], [2.0, np.nan, 3.0]])
+
+
+def test_day_buckets_start_at_local_midnight(stockholm):
+    stamps = [datetime(2024, 3, 29, 23, 30), datetime(2024, 3, 30, 0, 30),
+              datetime(2024, 3, 31, 0, 10), datetime(2024, 3, 31, 23, 50),
+              datetime(2024, 4, 1, 0, 10)]
+    ts = np.array([moment.timestamp() for moment in stamps])
+    tier = RollupTier("day", 86400)
+    tier.add(ts, [10.0, 20.0, 30.0, 40.0, 50.0], [90.0] * 5)
+    result = tier.arrays(0, len(tier))
+    # 31 March is only 23 hours long
+    expected = [datetime(2024, 3, day).timestamp() for day in (29, 30, 31)] + [datetime(2024, 4, 1).timestamp()]
+    np.testing.assert_array_equal(result["ts"], expected)
+    np.testing.assert_array_equal(result["mean"], [10.0, 20.0, 35.0, 50.0])
+    assert tier.index_range(datetime(2024, 3, 31, 12).timestamp(), None) == (2, 4)
+
+    # Hours stay on whole UTC hours
+    np.testing.assert_array_equal(bucket_starts(ts, 3600) % 3600, 0)
+
+
+def test_align_buckets_follows_local_days(stockholm):
+    start = datetime(2024, 3, 30, 12).timestamp()
+    end = datetime(2024, 4, 1, 12).timestamp()
+    days = [datetime(2024, 3, day).timestamp() for day in (30, 31)] + [datetime(2024, 4, 1).timestamp()]
+    grid, matrix = align_buckets([0, 0], [days[0], days[2]], [1.0, 3.0], 1, start, end, 86400)
+    np.testing.assert_array_equal(grid, days)
+    np.testing.assert_array_equal(matrix, [[1.0, np.nan, 3.0]])
@@ -0,0 +1,154 @@
+# test_sqlite_database.py
+import json
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pytest
+from mock_database import MockDatabase
+from sqlite_database import SQLiteDatabase
+
+
+@pytest.fixture
+def backends(tmp_path, monkeypatch):
+    """A MockDatabase and a SQLiteDatabase in a fresh directory, same demo data"""
+    monkeypatch.chdir(tmp_path)
+    mock = MockDatabase()
+    sqlite = SQLiteDatabase(str(tmp_path / "sensor_data.db"))
+    yield mock, sqlite
+    mock.close()
+    sqlite.close()
+
+
+@pytest.fixture
+def stockholm():
+    """Local time is Europe/Stockholm (UTC+1, DST from 2024-03-31 02:00)"""
+    saved = os.environ.get("TZ")
+    os.environ["TZ"] = "Europe/Stockholm"
+    time.tzset()
+    yield
+    if saved is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = saved
+    time.tzset()
+
+
+def sample_batch(start, count=500, step=97.0):
+    """Readings of every demo sensor from start on, in mixed order"""
+    rng = np.random.default_rng(7)
+    rows = []
+    for i, sensor_id in enumerate(["Sensor 1", "Sensor 2", "Sensor 3"]):
+        levels = np.clip(50 + 20 * np.sin(np.arange(count) / 40 + i) + rng.normal(0, 2, count), 0, 100)
+        rows.extend((sensor_id, start + k * step, round(float(level), 2), 80.0 - k / 100)
+                    for k, level in enumerate(levels))
+    rng.shuffle(rows)
+    return rows
+
+
+def test_same_sensors_and_settings(backends):
+    mock, sqlite = backends
+    assert sqlite.get_sensors() == mock.get_sensors()
+    assert sqlite.get_settings() == mock.get_settings()
+    for sensor_id in mock.get_sensors():
+        assert sqlite.get_current_level(sensor_id) == mock.get_current_level(sensor_id)
+        assert sqlite.get_sensor_data(sensor_id)["name"] == mock.get_sensor_data(sensor_id)["name"]
+
+
+def test_batch_ingest_and_range_queries_match(backends):
+    mock, sqlite = backends
+    start = time.time() + 86400
+    batch = sample_batch(start) + [("Sensor 9", start, 50, 50), ("Sensor 1", start, 150, 50)]
+    results = [db.update_sensor_readings(batch) for db in backends]
+    assert results[0] == results[1]
+    assert results[0][0] == 1500 and len(results[0][1]) == 2
+
+    window = (start + 3600, start + 20 * 3600)
+    for sensor_id in mock.get_sensors():
+        expected = mock.get_history_arrays(sensor_id, *window)
+        actual = sqlite.get_history_arrays(sensor_id, *window)
+        for column, other in zip(expected, actual):
+            np.testing.assert_array_equal(column, other)
+        assert sqlite.get_range(sensor_id, *window) == mock.get_range(sensor_id, *window)
+        assert sqlite.count_readings(sensor_id, start) == mock.count_readings(sensor_id, start) == 500
+        assert sqlite.get_current_level(sensor_id) == mock.get_current_level(sensor_id)
+
+
+@pytest.mark.parametrize("resolution", [60, 3600, 86400])
+def test_rollups_match(backends, resolution):
+    mock, sqlite = backends
+    start = time.time() + 86400
+    for db in backends:
+        db.update_sensor_readings(sample_batch(start))
+    expected = mock.get_rollup_arrays("Sensor 2", start, start + 2 * 86400, resolution=resolution)
+    actual = sqlite.get_rollup_arrays("Sensor 2", start, start + 2 * 86400, resolution=resolution)
+    assert actual["resolution"] == expected["resolution"] == resolution
+    for key in ("ts", "mean", "min", "max", "count", "battery"):
+        np.testing.assert_allclose(actual[key], expected[key])
+
+
+def test_day_rollups_match_across_dst(backends, stockholm):
+    mock, sqlite = backends
+    start = datetime(2024, 3, 29).timestamp()
+    batch = sample_batch(start, count=300, step=1200.0)  # Until 2 April
+    for db in backends:
+        db.update_sensor_readings(batch)
+    expected = mock.get_rollup_arrays("Sensor 1", start, start + 4 * 86400, resolution=86400)
+    actual = sqlite.get_rollup_arrays("Sensor 1", start, start + 4 * 86400, resolution=86400)
+    assert actual["ts"][2] == datetime(2024, 3, 31).timestamp()
+    assert actual["count"][2] == 69  # 23 hours of readings every 20 minutes
+    for key in ("ts", "mean", "min", "max", "count", "battery"):
+        np.testing.assert_allclose(actual[key], expected[key])
+
+
+def test_aligned_history_matches(backends):
+    mock, sqlite = backends
+    start = time.time() + 86400
+    for db in backends:
+        db.update_sensor_readings(sample_batch(start))
+    sensor_ids = ["Sensor 3", "Sensor 1"]
+    expected = mock.get_aligned_history(sensor_ids, start, start + 86400, max_points=20)
+    actual = sqlite.get_aligned_history(sensor_ids, start, start + 86400, max_points=20)
+    assert actual["resolution"] == expected["resolution"] == 3600
+    np.testing.assert_array_equal(actual["ts"], expected["ts"])
+    np.testing.assert_allclose(actual["mean"], expected["mean"])
+
+
+def test_chunked_history_covers_the_window(backends):
+    mock, sqlite = backends
+    start = time.time() + 86400
+    for db in backends:
+        db.update_sensor_readings(sample_batch(start))
+    for db in backends:
+        chunks = list(db.iter_history_arrays("Sensor 1", start, chunk_size=64))
+        assert all(len(chunk[0]) <= 64 for chunk in chunks)
+        ts = np.concatenate([chunk[0] for chunk in chunks])
+        np.testing.assert_array_equal(ts, db.get_history_arrays("Sensor 1", start)[0])
+
+
+def test_transactions_match(backends):
+    for db in backends:
+        with db.transaction():
+            db.save_settings({"warning_threshold": 70})
+            db.update_sensor_settings("Sensor 2", {"max_level": 250})
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.save_settings({"warning_threshold": 10})
+                db.update_sensor_reading("Sensor 1", 5.0, 5.0)
+                raise RuntimeError("cancelled")
+    mock, sqlite = backends
+    assert sqlite.get_settings() == mock.get_settings()
+    assert mock.get_settings()["warning_threshold"] == 70
+    assert sqlite.get_sensor_data("Sensor 2")["max_level"] == mock.get_sensor_data("Sensor 2")["max_level"] == 250
+    assert sqlite.get_current_level("Sensor 1") == mock.get_current_level("Sensor 1") != 5.0
+
+
+def test_json_exports_match(backends, tmp_path):
+    mock, sqlite = backends
+    start = time.time() + 86400
+    for db in backends:
+        db.update_sensor_readings(sample_batch(start, count=20))
+    assert mock.export_to_json(str(tmp_path / "mock.json"))
+    assert sqlite.export_to_json(str(tmp_path / "sqlite.json"))
+    with open(tmp_path / "mock.json") as f, open(tmp_path / "sqlite.json") as g:
+        assert json.load(f) == json.load(g)
@@ -0,0 +1,143 @@
+# test_time_series.py
+import os
+from datetime import datetime
+import numpy as np
+import pytest
+from time_series import SensorSeries, to_epoch, validate_batch
+
+
+def test_to_epoch_accepts_datetimes_strings_and_numbers():
+    moment = datetime(2024, 3, 1, 12, 30, 15)
+    assert to_epoch(moment) == moment.timestamp()
+    assert to_epoch("2024-03-01 12:30:15") == moment.timestamp()
+    assert to_epoch("2024-03-01 12:30") == moment.replace(second=0).timestamp()
+    assert to_epoch("2024-03-01") == datetime(2024, 3, 1).timestamp()
+    assert to_epoch(1700000000.5) == 1700000000.5
+    assert to_epoch(None) is None
+    with pytest.raises(ValueError):
+        to_epoch("yesterday")
+
+
+def test_index_range_includes_both_ends():
+    series = SensorSeries.from_columns([10, 20, 30, 40], [1, 2, 3, 4], [0, 0, 0, 0])
+    assert series.index_range(20, 30) == (1, 3)
+    assert series.index_range(None, 25) == (0, 2)
+    assert series.index_range(35, None) == (3, 4)
+    assert series.index_range(50, 60) == (4, 4)
+
+
+def test_late_readings_are_kept_in_time_order():
+    series = SensorSeries(capacity=2)
+    for ts in (10.0, 30.0, 40.0):
+        series.append(ts, ts / 10, 0)
+    assert series.insert(20.0, 2.0, 0) == 1
+    series.extend([5.0, 50.0, 35.0], [0.5, 5.0, 3.5], [0, 0, 0])
+    ts, water, _ = series.columns()
+    assert ts.tolist() == [5.0, 10.0, 20.0, 30.0, 35.0, 40.0, 50.0]
+    assert water.tolist() == [0.5, 1.0, 2.0, 3.0, 3.5, 4.0, 5.0]
+
+
+def test_columns_are_read_only_views():
+    series = SensorSeries.from_columns([1, 2, 3], [4, 5, 6], [7, 8, 9])
+    ts, water, battery = series.columns(1, 3)
+    assert water.tolist() == [5.0, 6.0]
+    with pytest.raises(ValueError):
+        water[0] = 0.0
+    assert np.shares_memory(ts, series.columns()[0])
+
+
+def test_validate_batch_rejects_bad_rows_with_a_reason():
+    batch = [
+        ("Sensor 1", 100.0, 50.0, 90.0),
+        ("Sensor 9", 100.0, 50.0, 90.0),
+        ("Sensor 1", "not a time", 50.0, 90.0),
+        ("Sensor 1", 100.0, 101.0, 90.0),
+        ("Sensor 1", 100.0, None, 90.0),
+        ("Sensor 1", 100.0, 50.0, -1.0),
+        ("Sensor 1", 100.0),
+        ("Sensor 2", "2024-03-01 12:00:00", 0.0, 100.0),
+    ]
+    (sensor_ids, ts, water, battery), rejects = validate_batch(batch, ["Sensor 1", "Sensor 2"])
+    assert sensor_ids.tolist() == ["Sensor 1", "Sensor 2"]
+    assert ts.tolist() == [100.0, to_epoch("2024-03-01 12:00:00")]
+    assert water.tolist() == [50.0, 0.0]
+    assert battery.tolist() == [90.0, 100.0]
+    reasons = dict(rejects)
+    assert sorted(reasons) == [1, 2, 3, 4, 5, 6]
+    assert reasons[1] == "Unknown sensor"
+    assert reasons[2].startswith("Malformed row")
+    assert reasons[3] == reasons[4] == "Water level missing or out of range"
+    assert reasons[5] == "Battery level missing or out of range"
+    assert reasons[6].startswith("Malformed row")
+
+
+def test_validate_batch_uses_now_for_missing_times():
+    before = datetime.now().timestamp()
+    (_, ts, _, _), rejects = validate_batch([("Sensor 1", None, 10, 10)], ["Sensor 1"])
+    assert not rejects
+    assert before <= ts[0] <= datetime.now().timestamp()
+
+
+def mapped_series(tmp_path, count=10):
+    prefix = str(tmp_path / "sensor")
+    SensorSeries.from_columns(np.arange(count) * 60.0, np.arange(count) + 0.5, np.full(count, 90.0)).write_files(prefix)
+    return prefix, SensorSeries.map_files(prefix, count)
+
+
+def test_mapped_columns_round_trip(tmp_path):
+    prefix, series = mapped_series(tmp_path)
+    assert series.path == prefix and len(series.mapped_columns()) == 3
+    ts, water, battery = series.columns()
+    assert ts.tolist() == [i * 60.0 for i in range(10)]
+    assert water.tolist() == [i + 0.5 for i in range(10)]
+    assert battery.tolist() == [90.0] * 10
+
+
+def test_appends_grow_the_mapped_files_in_place(tmp_path):
+    prefix, series = mapped_series(tmp_path)
+    for i in range(10, 200):
+        series.append(i * 60.0, i + 0.5, 90.0)
+    assert series.path == prefix and series.rewrites == 0
+    assert os.path.getsize(prefix + ".ts") >= 200 * SensorSeries.FILE_DTYPE.itemsize
+    for column in series.mapped_columns():
+        column.flush()
+    reopened = SensorSeries.map_files(prefix, 200)
+    np.testing.assert_array_equal(reopened.columns()[1], np.arange(200) + 0.5)
+
+
+def test_moving_rows_detaches_the_mapping(tmp_path):
+    prefix, series = mapped_series(tmp_path)
+    assert series.insert(90.0, 99.0, 90.0) == 2
+    assert series.path is None and series.mapped_columns() == ()
+    assert series.rewrites == 1
+    assert series.columns()[1].tolist()[:4] == [0.5, 1.5, 99.0, 2.5]
+    # The files are left as they were
+    assert SensorSeries.map_files(prefix, 10).columns()[1].tolist()[:3] == [0.5, 1.5, 2.5]
+
+    series.extend([30.0], [1.0], [90.0])
+    assert series.rewrites == 2
+
+
+def test_attach_files_is_refused_after_rows_moved(tmp_path):
+    series = SensorSeries.from_columns([0.0, 60.0], [1.0, 2.0], [90.0, 90.0])
+    prefix = str(tmp_path / "sensor")
+    rewrites = series.rewrites
+    series.copy().write_files(prefix)
+    series.append(120.0, 3.0, 90.0)
+    assert series.attach_files(prefix, 2, rewrites)
+    assert series.path == prefix and series.columns()[1].tolist() == [1.0, 2.0, 3.0]
+
+    other = SensorSeries.from_columns([0.0, 60.0], [1.0, 2.0], [90.0, 90.0])
+    rewrites = other.rewrites
+    other.insert(30.0, 1.5, 90.0)
+    assert not other.attach_files(prefix, 2, rewrites)
+    assert other.path is None
+
+
+def test_mapping_files_shorter_than_the_header_fails(tmp_path):
+    prefix = str(tmp_path / "sensor")
+    SensorSeries.from_columns([0.0, 1.0, 2.0, 3.0, 4.0], [1] * 5, [2] * 5).write_files(prefix)
+    with pytest.raises(ValueError):
+        SensorSeries.map_files(prefix, 6)
+    # Rows past the recorded length are free space
+    assert len(SensorSeries.map_files(prefix, 3)) == 3
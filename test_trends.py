@@ -0,0 +1,55 @@
+# test_trends.py
+import numpy as np
+import pytest
+from trends import RollingRegression
+
+
+def test_slope_of_a_straight_line_is_exact():
+    trends = RollingRegression(window=3600)
+    for t in range(0, 3600, 60):
+        trends.add(0, 1_700_000_000.0 + t, 20.0 + 0.005 * t)
+        trends.add(1, 1_700_000_000.0 + t, 80.0 - 0.002 * t)
+    np.testing.assert_allclose(trends.slopes([0, 1]), [0.005, -0.002])
+    assert trends.span(0) == 3540.0
+
+
+def test_samples_leave_the_window():
+    trends = RollingRegression(window=600)
+    # A falling hour followed by ten rising minutes: only the rise is left
+    for t in range(0, 3600, 30):
+        trends.add(0, float(t), 100.0 - t / 60)
+    for t in range(3600, 4200 + 1, 30):
+        trends.add(0, float(t), 40.0 + (t - 3600) / 30)
+    assert trends.span(0) == 600.0
+    assert trends.slopes([0])[0] == pytest.approx(1 / 30)
+
+
+def test_out_of_order_samples_are_ignored():
+    trends = RollingRegression(window=3600)
+    trends.add(0, 100.0, 10.0)
+    trends.add(0, 200.0, 20.0)
+    trends.add(0, 150.0, 90.0)
+    trends.add(0, 200.0, 90.0)
+    assert trends.slopes([0])[0] == pytest.approx(0.1)
+    assert trends.span(0) == 100.0
+
+
+def test_slope_stays_accurate_over_a_long_run():
+    trends = RollingRegression(window=600)
+    # Many REBASE windows of a slow sine on top of a linear rise
+    t = 1_700_000_000.0
+    for _ in range(50000):
+        t += 10.0
+        trends.add(0, t, 0.001 * (t - 1_700_000_000.0) + np.sin(t / 1e5))
+    times = np.arange(t - 600, t + 1, 10.0)
+    expected = np.polyfit(times - times[0], 0.001 * (times - 1_700_000_000.0) + np.sin(times / 1e5), 1)[0]
+    assert trends.slopes([0])[0] == pytest.approx(expected, rel=1e-9)
+
+
+def test_slope_is_nan_without_two_samples():
+    trends = RollingRegression(window=3600)
+    trends.add(0, 100.0, 10.0)
+    slopes = trends.slopes([0, 1, 5])
+    assert np.isnan(slopes).all()
+    assert trends.span(0) == 0.0 and trends.span(5) == 0.0
+    np.testing.assert_array_equal(trends.spans([0, 5]), [0.0, 0.0])
@@ -0,0 +1,402 @@
+# time_series.py
+import os
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+import numpy as np
+
+
+def to_epoch(value):
+    """
+    Convert a datetime, "YYYY-MM-DD[ HH:MM:SS]" string or number of epoch
+    seconds to epoch seconds. None is passed through.
+    """
+    if value is None or isinstance(value, (int, float, np.number)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized time value: {value!r}")
+
+
+def to_epoch_array(ts):
+    """
+    Convert timestamps to a float array of epoch seconds: epoch seconds,
+    a datetime64 array (UTC) or datetime objects / strings (local time)
+    """
+    ts = np.asarray(ts)
+    if np.issubdtype(ts.dtype, np.datetime64):
+        return ts.astype('datetime64[us]').astype(np.int64) / 1e6
+    if ts.dtype == object or ts.dtype.kind == "U":
+        return np.array([to_epoch(t) for t in ts], dtype=float)
+    return ts.astype(float)
+
+
+def _utc_offset(t):
+    return datetime.fromtimestamp(t).astimezone().utcoffset().total_seconds()
+
+
+def utc_offsets(ts):
+    """
+    Local UTC offset (seconds) at each epoch time in ts. Looked up once per
+    UTC day, and per time only on days the offset changes (DST).
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    days, inverse = np.unique(np.floor(ts / 86400), return_inverse=True)
+    first = np.array([_utc_offset(day * 86400) for day in days.tolist()], dtype=np.float64)
+    last = np.array([_utc_offset(day * 86400 + 86399) for day in days.tolist()], dtype=np.float64)
+    offsets = first[inverse]
+    for i in np.flatnonzero((first != last)[inverse]).tolist():
+        offsets[i] = _utc_offset(ts[i])
+    return offsets
+
+
+def local_midnights(ts):
+    """Epoch seconds of the local midnight that starts the day of each time in ts"""
+    ts = np.asarray(ts, dtype=np.float64)
+    days, inverse = np.unique(np.floor((ts + utc_offsets(ts)) / 86400), return_inverse=True)
+    midnights = np.array([(datetime(1970, 1, 1) + timedelta(days=day)).timestamp()
+                          for day in days.tolist()], dtype=np.float64)
+    return midnights[inverse]
+
+
+def display_window(first, last):
+    """
+    Time window (epoch seconds) for showing readings from first to last,
+    rounded out to whole local days, or whole hours for less than a day,
+    so new readings usually fit without changing the window.
+    """
+    start = datetime.fromtimestamp(first)
+    end = datetime.fromtimestamp(last)
+    if last - first >= 86400:
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = end.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    else:
+        start = start.replace(minute=0, second=0, microsecond=0)
+        end = end.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return start.timestamp(), end.timestamp()
+
+
+def validate_batch(batch, known_sensors, level_range=(0, 100)):
+    """
+    Validate (sensor_id, ts, water_level, battery_level) rows in one pass.
+    A ts of None means "now".
+
+    Returns (accepted, rejects): accepted is a tuple of arrays
+    (sensor_ids, ts, water_levels, battery_levels) with the valid rows in
+    input order, rejects is a list of (row_index, reason).
+    """
+    rows = list(batch)
+    count = len(rows)
+    sensor_ids = np.empty(count, dtype=object)
+    ts = np.full(count, np.nan)
+    water = np.full(count, np.nan)
+    battery = np.full(count, np.nan)
+    reasons = [None] * count
+
+    now = datetime.now().timestamp()
+    for i, row in enumerate(rows):
+        try:
+            sensor_id, moment, water_level, battery_level = row
+            sensor_ids[i] = sensor_id
+            ts[i] = now if moment is None else to_epoch(moment)
+            water[i] = water_level
+            battery[i] = battery_level
+        except (TypeError, ValueError) as e:
+            reasons[i] = f"Malformed row: {e}"
+
+    low, high = level_range
+    checks = [
+        (~np.isin(sensor_ids, list(known_sensors)), "Unknown sensor"),
+        (~np.isfinite(ts), "Invalid timestamp"),
+        (~np.isfinite(water) | (water < low) | (water > high), "Water level missing or out of range"),
+        (~np.isfinite(battery) | (battery < low) | (battery > high), "Battery level missing or out of range"),
+    ]
+    valid = np.array([reason is None for reason in reasons], dtype=bool)
+    for failed, reason in checks:
+        for i in np.flatnonzero(failed & valid):
+            reasons[i] = reason
+        valid &= ~failed
+
+    rejects = [(i, reason) for i, reason in enumerate(reasons) if reason is not None]
+    return (sensor_ids[valid], ts[valid], water[valid], battery[valid]), rejects
+
+
+class SensorSeries:
+    """
+    Columnar storage for the readings of one sensor.
+    Timestamps (epoch seconds) and levels are kept in contiguous NumPy arrays
+    that are over-allocated and doubled when full, so appends are amortized O(1)
+    and a reading costs 24 bytes instead of a dict per sample.
+
+    The timestamp column is kept sorted, which makes it the time index:
+    index_range() finds a window with two binary searches.
+
+    The columns can also be memory-mapped from files (map_files()). Appends
+    then write straight into the mapped pages; anything that moves existing
+    rows first copies the series into memory (path becomes None), so the
+    files only ever change past the rows a snapshot has recorded.
+    """
+
+    DTYPE = np.float64
+
+    def __init__(self, capacity=64):
+        capacity = max(1, int(capacity))
+        self._ts = np.empty(capacity, dtype=self.DTYPE)
+        self._water = np.empty(capacity, dtype=self.DTYPE)
+        self._battery = np.empty(capacity, dtype=self.DTYPE)
+        self._size = 0
+        self.path = None    # File prefix while the columns are memory-mapped
+        self.rewrites = 0   # Number of times existing rows were moved
+
+    @classmethod
+    def from_columns(cls, ts, water_level, battery_level):
+        """Create a series from three equally long sequences"""
+        ts = np.asarray(ts, dtype=cls.DTYPE)
+        series = cls(capacity=len(ts) * 2)
+        series._size = len(ts)
+        order = np.argsort(ts, kind="stable")
+        series._ts[:series._size] = ts[order]
+        series._water[:series._size] = np.asarray(water_level, dtype=cls.DTYPE)[order]
+        series._battery[:series._size] = np.asarray(battery_level, dtype=cls.DTYPE)[order]
+        return series
+
+    @classmethod
+    def from_records(cls, readings):
+        """Create a series from the legacy list of reading dicts"""
+        ts = [to_epoch(r.get("timestamp", r["date"])) for r in readings]
+        water = [r["water_level"] for r in readings]
+        battery = [r["battery_level"] for r in readings]
+        return cls.from_columns(ts, water, battery)
+
+    def __len__(self):
+        return self._size
+
+    def copy(self):
+        """Independent copy of the series"""
+        return SensorSeries.from_columns(*self.columns())
+
+    def _grow(self, needed):
+        capacity = len(self._ts)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        if self.path is not None:
+            self._map(self.path, capacity)
+            return
+        for name in ("_ts", "_water", "_battery"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=self.DTYPE)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def append(self, ts, water_level, battery_level):
+        """Append one reading at the end of the series"""
+        self._grow(self._size + 1)
+        i = self._size
+        self._ts[i] = ts
+        self._water[i] = water_level
+        self._battery[i] = battery_level
+        self._size += 1
+
+    def insert(self, ts, water_level, battery_level):
+        """
+        Add one reading at its place in time order and return its index.
+        In-order readings take the append fast path.
+        """
+        if self._size == 0 or ts >= self._ts[self._size - 1]:
+            self.append(ts, water_level, battery_level)
+            return self._size - 1
+
+        i = int(np.searchsorted(self._ts[:self._size], ts, side="right"))
+        self._detach()
+        self._grow(self._size + 1)
+        for column, value in ((self._ts, ts), (self._water, water_level),
+                              (self._battery, battery_level)):
+            column[i + 1:self._size + 1] = column[i:self._size]
+            column[i] = value
+        self._size += 1
+        return i
+
+    def extend(self, ts, water_level, battery_level):
+        """
+        Add many readings at once. Rows newer than the series are copied in
+        one block; otherwise the new rows are merged in time order.
+        """
+        ts = np.asarray(ts, dtype=self.DTYPE)
+        water_level = np.asarray(water_level, dtype=self.DTYPE)
+        battery_level = np.asarray(battery_level, dtype=self.DTYPE)
+        if not len(ts):
+            return
+
+        order = np.argsort(ts, kind="stable")
+        ts, water_level, battery_level = ts[order], water_level[order], battery_level[order]
+        size = self._size
+        if size and ts[0] < self._ts[size - 1]:
+            self._detach()
+        self._grow(size + len(ts))
+
+        if size == 0 or ts[0] >= self._ts[size - 1]:
+            self._ts[size:size + len(ts)] = ts
+            self._water[size:size + len(ts)] = water_level
+            self._battery[size:size + len(ts)] = battery_level
+        else:
+            merged_ts = np.concatenate((self._ts[:size], ts))
+            merge = np.argsort(merged_ts, kind="stable")
+            self._ts[:size + len(ts)] = merged_ts[merge]
+            self._water[:size + len(ts)] = np.concatenate((self._water[:size], water_level))[merge]
+            self._battery[:size + len(ts)] = np.concatenate((self._battery[:size], battery_level))[merge]
+        self._size = size + len(ts)
+
+    def index_range(self, start=None, end=None):
+        """
+        Return (lo, hi) so that [lo:hi] holds the readings with
+        start <= ts <= end. Binary search, O(log n).
+        """
+        ts = self._ts[:self._size]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = self._size if end is None else int(np.searchsorted(ts, end, side="right"))
+        return lo, max(lo, hi)
+
+    def columns(self, lo=0, hi=None):
+        """
+        Return (timestamps, water_levels, battery_levels) as read-only views
+        into the storage, optionally limited to rows [lo:hi]. No data is
+        copied; the views stay valid until the series is modified.
+        """
+        hi = self._size if hi is None else min(hi, self._size)
+        views = (self._ts[lo:hi], self._water[lo:hi], self._battery[lo:hi])
+        for view in views:
+            view.flags.writeable = False
+        return views
+
+    def to_dict(self):
+        """Columnar, JSON-serializable representation"""
+        ts, water, battery = self.columns()
+        return {
+            "ts": ts.tolist(),
+            "water_level": water.tolist(),
+            "battery_level": battery.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, columns):
+        return cls.from_columns(columns["ts"], columns["water_level"],
+                                columns["battery_level"])
+
+    # Binary column files: raw little-endian float64, one file per column
+    FILE_DTYPE = np.dtype("<f8")
+    FILE_SUFFIXES = (".ts", ".water", ".battery")
+
+    def write_files(self, prefix):
+        """Write the columns to <prefix>.ts/.water/.battery and fsync them"""
+        for suffix, column in zip(self.FILE_SUFFIXES, self.columns()):
+            with open(prefix + suffix, 'wb') as f:
+                column.astype(self.FILE_DTYPE, copy=False).tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @classmethod
+    def map_files(cls, prefix, rows):
+        """
+        Open a series written by write_files() with memory-mapped columns.
+        Nothing is read up front; pages are loaded as they are accessed.
+        `rows` is the length recorded with the files; anything stored past
+        it is treated as free space.
+        """
+        itemsize = cls.FILE_DTYPE.itemsize
+        if any(os.path.getsize(prefix + suffix) < rows * itemsize
+               for suffix in cls.FILE_SUFFIXES):
+            raise ValueError(f"History files {prefix}.* are shorter than {rows} rows")
+        series = cls(capacity=1)
+        series._map(prefix, max(rows, 64))
+        series._size = rows
+        return series
+
+    def attach_files(self, prefix, rows, rewrites):
+        """
+        Switch an in-memory series over to files that write_files() wrote
+        from its first `rows` rows; rows appended since are copied over.
+        Returns False and keeps the series in memory if rows were moved in
+        the meantime (rewrites no longer matches).
+        """
+        if self.path is not None or self.rewrites != rewrites or self._size < rows:
+            return False
+        old = (self._ts, self._water, self._battery)
+        self._map(prefix, max(len(self._ts), 64))
+        for column, previous in zip((self._ts, self._water, self._battery), old):
+            column[rows:self._size] = previous[rows:self._size]
+        return True
+
+    def mapped_columns(self):
+        """The memory-mapped column arrays, or () for an in-memory series"""
+        if self.path is None:
+            return ()
+        return (self._ts, self._water, self._battery)
+
+    def _map(self, prefix, capacity):
+        """Map the column files, extending them (sparsely) to hold capacity rows"""
+        size = capacity * self.FILE_DTYPE.itemsize
+        columns = []
+        for suffix in self.FILE_SUFFIXES:
+            filename = prefix + suffix
+            if os.path.getsize(filename) < size:
+                with open(filename, 'r+b') as f:
+                    f.truncate(size)
+            columns.append(np.memmap(filename, dtype=self.FILE_DTYPE, mode='r+', shape=(capacity,)))
+        self._ts, self._water, self._battery = columns
+        self.path = prefix
+
+    def _detach(self):
+        """Existing rows are about to move: copy mapped columns into memory"""
+        self.rewrites += 1
+        if self.path is None:
+            return
+        capacity = max(self._size * 2, 64)
+        for name in ("_ts", "_water", "_battery"):
+            column = np.empty(capacity, dtype=self.DTYPE)
+            column[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, column)
+        self.path = None
+
+
+class ReadingsView(Sequence):
+    """
+    Read-only list-of-dicts view over a SensorSeries, so code written for
+    sensor["readings"] keeps working. Dicts are built on access only.
+    """
+
+    def __init__(self, series):
+        self.series = series
+
+    def __len__(self):
+        return len(self.series)
+
+    @staticmethod
+    def _record(ts, water_level, battery_level):
+        moment = datetime.fromtimestamp(ts)
+        return {
+            "date": moment.strftime("%Y-%m-%d"),
+            "timestamp": moment.strftime("%Y-%m-%d %H:%M:%S"),
+            "water_level": water_level,
+            "battery_level": battery_level
+        }
+
+    def __getitem__(self, index):
+        ts, water, battery = self.series.columns()
+        if isinstance(index, slice):
+            return [self._record(*row) for row in
+                    zip(ts[index].tolist(), water[index].tolist(), battery[index].tolist())]
+        return self._record(float(ts[index]), float(water[index]), float(battery[index]))
+
+    def __iter__(self):
+        ts, water, battery = self.series.columns()
+        for row in zip(ts.tolist(), water.tolist(), battery.tolist()):
+            yield self._record(*row)
+
+    def __repr__(self):
+        return f"ReadingsView({len(self)} readings)"
@@ -0,0 +1,81 @@
+# trends.py
+from collections import deque
+import numpy as np
+
+
+class RollingRegression:
+    """
+    Least-squares slope of each sensor's (time, level) samples over a
+    rolling time window, kept up to date incrementally: every sample adds
+    to running sums and samples leaving the window are subtracted again,
+    so an update is O(1) however many samples the window holds.
+
+    Sensors are rows (0, 1, 2...); slopes() computes any set of rows in
+    one vectorized step. Times are stored relative to a per-row origin
+    that is moved up to the oldest sample (and the sums recomputed) once
+    it lags more than REBASE windows behind, which keeps the squared
+    times small and stops rounding errors from piling up.
+    """
+
+    REBASE = 10
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = []          # Per row: deque of (t, y) in the window
+        self._origin = np.empty(0)  # Per row: time subtracted from its samples
+        self._sums = np.empty((0, 5))  # Per row: n, St, Sy, Stt, Sty
+
+    def _ensure(self, row):
+        while len(self._samples) <= row:
+            self._samples.append(deque())
+            self._origin = np.append(self._origin, np.nan)
+            self._sums = np.vstack((self._sums, np.zeros((1, 5))))
+
+    def add(self, row, t, y):
+        """Add a sample; samples must arrive in time order per row"""
+        self._ensure(row)
+        samples = self._samples[row]
+        if samples and t <= samples[-1][0]:
+            return
+        if not samples:
+            self._origin[row] = t
+            self._sums[row] = 0.0
+        elif t - self._origin[row] > self.REBASE * self.window:
+            self._rebase(row)
+        samples.append((t, y))
+        x = t - self._origin[row]
+        self._sums[row] += (1.0, x, y, x * x, x * y)
+        # Drop samples that have left the window
+        while samples[0][0] < t - self.window:
+            old_t, old_y = samples.popleft()
+            x = old_t - self._origin[row]
+            self._sums[row] -= (1.0, x, old_y, x * x, x * old_y)
+
+    def _rebase(self, row):
+        """Recompute a row's sums relative to its oldest sample"""
+        times, levels = np.array(self._samples[row], dtype=np.float64).T
+        self._origin[row] = times[0]
+        x = times - times[0]
+        self._sums[row] = (len(x), x.sum(), levels.sum(), (x * x).sum(), (x * levels).sum())
+
+    def span(self, row):
+        """Seconds between the oldest and newest sample of a row"""
+        if row >= len(self._samples) or not self._samples[row]:
+            return 0.0
+        return self._samples[row][-1][0] - self._samples[row][0][0]
+
+    def spans(self, rows):
+        """span() of each row, as an array"""
+        return np.array([self.span(row) for row in rows], dtype=np.float64)
+
+    def slopes(self, rows):
+        """Slope (level per second) of each row; NaN for rows with under 2 samples"""
+        rows = np.asarray(rows, dtype=np.int64)
+        result = np.full(len(rows), np.nan)
+        inside = rows < len(self._samples)
+        n, st, sy, stt, sty = self._sums[rows[inside]].T
+        denominator = n * stt - st * st
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (n * sty - st * sy) / denominator
+        result[inside] = np.where((n >= 2) & (denominator > 0), slope, np.nan)
+        return result
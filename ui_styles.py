@@ -0,0 +1,54 @@
+# ui_styles.py
+from PyQt5.QtWidgets import QApplication
+
+
+def install_style(sheet):
+    """
+    Add a widget class's stylesheet to the application stylesheet, once.
+    Every instance is then styled from that single parsed sheet instead of
+    parsing and polishing a copy of its own; per-instance looks come from
+    dynamic properties (see set_style_state). Rules should be scoped to
+    the class, e.g. "SensorCard QLabel", as they apply application-wide.
+    """
+    app = QApplication.instance()
+    if app is None or sheet in app.styleSheet():
+        return
+    app.setStyleSheet(app.styleSheet() + sheet)
+
+
+def set_style_state(widget, name, value):
+    """
+    Set a dynamic property that the stylesheet selects on, e.g.
+    QFrame[status="Critical"], and re-polish the widget so the matching
+    rules apply. Does nothing if the property already has that value, so
+    repeated updates with an unchanged state cost no styling work.
+    Returns True if the state changed.
+    """
+    if widget.property(name) == value:
+        return False
+    widget.setProperty(name, value)
+    style = widget.style()
+    style.unpolish(widget)
+    style.polish(widget)
+    widget.update()
+    return True
+
+
+def set_text(label, text):
+    """Set a label's text only if it differs (avoids relayout and repaint)"""
+    if label.text() == text:
+        return False
+    label.setText(text)
+    return True
+
+
+def format_duration(seconds):
+    """Short text for a duration, such as 45 min, 2 h 10 min or 3 d 4 h"""
+    minutes = int(round(seconds / 60.0))
+    if minutes < 60:
+        return f"{max(minutes, 1)} min"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours} h {minutes} min" if minutes else f"{hours} h"
+    days, hours = divmod(hours, 24)
+    return f"{days} d {hours} h" if hours else f"{days} d"
@@ -1,22 +1,69 @@
 # water_level_chart.py
 import sys
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QApplication, QMainWindow
-import matplotlib.pyplot as plt
+from PyQt5.QtCore import pyqtSignal
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+import matplotlib.dates as mdates
+from dateutil import tz
+from downsample import m4
+from time_series import to_epoch, to_epoch_array, display_window
 import numpy as np
 from datetime import datetime, timedelta
 
+# Matplotlib date number of the Unix epoch (x = epoch / 86400 + this)
+_EPOCH_DATENUM = mdates.date2num(np.datetime64("1970-01-01T00:00:00"))
+
+
+def epoch_to_datenum(epoch):
+    """Matplotlib date number(s) for epoch seconds (a number or an array)"""
+    return epoch / 86400.0 + _EPOCH_DATENUM
+
+
+def datenum_to_epoch(x):
+    """Epoch seconds for matplotlib date number(s)"""
+    return (x - _EPOCH_DATENUM) * 86400.0
+
+
 class WaterLevelChart(QWidget):
     """
     Displays a chart showing water level history over the past 7 days.
     Can use real data or placeholder data depending on availability.
+
+    The axes, level line, threshold lines and legend are created once.
+    Updates only change their data: when the axes layout (time window,
+    title, thresholds) is unchanged the level line is redrawn by blitting
+    it onto a cached background, otherwise one full redraw is done.
+
+    The full series is kept and the line only gets an M4-decimated copy of
+    the visible part, about two points per pixel column, with every peak
+    and dip kept. It is decimated again when the view is zoomed or resized.
+
+    The x-axis is a real time axis in local time: readings may be irregular
+    or many per day, and an automatic date locator keeps the number of
+    ticks bounded however long the history is.
+
+    After enable_navigation() the mouse wheel zooms the time axis around
+    the cursor and dragging pans it; view_changed reports the new range.
     """
 
+    # Visible time range (epoch seconds) after any change of the x-limits
+    view_changed = pyqtSignal(float, float)
+
+    MARKER_LIMIT = 60  # Show point markers only up to this many plotted points
+    MIN_SPAN = 600     # Narrowest zoom, seconds
+    ZOOM_STEP = 1.25   # Span factor per wheel step
+
     def __init__(self, parent=None):
         super().__init__(parent)
         # Default thresholds matching alarm system
         self.warning_threshold = 75
         self.critical_threshold = 85
+        self._drawn = None       # Axes state at the last full draw
+        self._drag = None        # (pixel x, xlim) while panning
+        self._background = None  # Canvas without the level line, for blitting
+        self._x = np.empty(0)    # Full series (date numbers) behind the level line
+        self._y = np.empty(0)
         self.init_ui()
 
     def init_ui(self):
@@ -25,14 +72,54 @@ class WaterLevelChart(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
 
         # Create matplotlib figure and canvas
-        self.figure = plt.figure(figsize=(6, 4), dpi=100)
+        self.figure = Figure(figsize=(6, 4), dpi=100)
         self.canvas = FigureCanvas(self.figure)
 
         layout.addWidget(self.canvas)
-        
+
+        self.create_artists()
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self.canvas.mpl_connect("resize_event", self._on_resize)
+        # Zooming changes what is visible: decimate again for the new range
+        self.ax.callbacks.connect("xlim_changed", self._on_xlim_changed)
+
         # Draw initial chart
         self.update_chart()
 
+    def create_artists(self):
+        """Create the axes and everything on them, once"""
+        ax = self.ax = self.figure.add_subplot(111)
+
+        # The level line is animated: left out of full draws and blitted on top
+        self.level_line, = ax.plot([], [], marker='o', linestyle='-', color='dodgerblue',
+                                   linewidth=2, label='Water Level', animated=True)
+
+        # Add threshold lines
+        self.warning_line = ax.axhline(y=self.warning_threshold, color='orange', linestyle='--',
+                                       linewidth=1.5, alpha=0.8, label='Warning')
+        self.critical_line = ax.axhline(y=self.critical_threshold, color='red', linestyle='--',
+                                        linewidth=1.5, alpha=0.8, label='Critical')
+        self.empty_text = ax.text(0.5, 0.5, "No data available",
+                                  horizontalalignment='center',
+                                  verticalalignment='center',
+                                  transform=ax.transAxes, visible=False)
+
+        # Configure chart
+        ax.set_xlabel('Date', fontsize=10)
+        ax.set_ylabel('Water Level (%)', fontsize=10)
+        ax.set_ylim(0, 105)
+        ax.grid(True, linestyle=':', alpha=0.6)
+        self.legend = ax.legend(fontsize=9)
+
+        # Tick spacing follows the visible span (days, hours, minutes...)
+        local_tz = tz.tzlocal()
+        locator = mdates.AutoDateLocator(tz=local_tz, minticks=3, maxticks=8)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator, tz=local_tz))
+
+        # Ensure proper layout
+        self.figure.tight_layout()
+
     def update_chart(self, sensor_id=None):
         """
         Updates the chart with random data for the specified sensor.
@@ -40,99 +127,141 @@ class WaterLevelChart(QWidget):
         Args:
             sensor_id: Optional ID to generate consistent data for a specific sensor
         """
-        # Clear previous plot
-        self.figure.clear()
-
-        # Create subplot
-        ax = self.figure.add_subplot(111)
-
         # Generate dates for x-axis (last 7 days)
         today = datetime.now()
-        dates = [today - timedelta(days=i) for i in range(6, -1, -1)]
-        date_labels = [date.strftime('%m-%d') for date in dates]
+        dates = [(today - timedelta(days=i)).timestamp() for i in range(6, -1, -1)]
 
         # Generate placeholder water level data
         seed = 42 if sensor_id is None else (sensor_id % 1000) + 42
         np.random.seed(seed)
         water_levels = np.random.uniform(50, 80, size=7)
 
-        # Plot the data
-        ax.plot(date_labels, water_levels, marker='o', linestyle='-', 
-               color='dodgerblue', linewidth=2, label='Water Level')
-
-        # Add threshold lines
-        ax.axhline(y=self.warning_threshold, color='orange', linestyle='--',
-                  linewidth=1.5, alpha=0.8, label=f'Warning ({self.warning_threshold}%)')
-        ax.axhline(y=self.critical_threshold, color='red', linestyle='--',
-                  linewidth=1.5, alpha=0.8, label=f'Critical ({self.critical_threshold}%)')
-
-        # Configure chart
         title = 'Water Level - Past 7 Days'
         if sensor_id:
             title += f" (Sensor {sensor_id})"
-        ax.set_title(title, fontsize=12)
-        ax.set_xlabel('Date', fontsize=10)
-        ax.set_ylabel('Water Level (%)', fontsize=10)
-        ax.set_ylim(0, 105)
-        ax.grid(True, linestyle=':', alpha=0.6)
-        ax.legend(fontsize=9)
+        self.set_series(dates, water_levels, title)
 
-        # Improve date label readability
-        self.figure.autofmt_xdate()
-        
-        # Ensure proper layout
-        self.figure.tight_layout()
-        
-        # Update the canvas
-        self.canvas.draw()
-        
     def update_chart_with_data(self, history_data):
         """Update chart with actual historical data"""
-        # Clear previous plot
-        self.figure.clear()
-        
-        # Create new subplot
-        ax = self.figure.add_subplot(111)
-        
-        if not history_data:
-            # No data, show empty chart
-            ax.text(0.5, 0.5, "No data available", 
-                    horizontalalignment='center',
-                    verticalalignment='center',
-                    transform=ax.transAxes)
-            self.canvas.draw()
+        # Extract times and water levels
+        times = [to_epoch(item.get('timestamp', item['date'])) for item in history_data or []]
+        water_levels = [item['water_level'] for item in history_data or []]
+        self.set_series(times, water_levels, 'Water Level - Past 7 Days')
+
+    def set_series(self, ts, water_levels, title=None, keep_view=False):
+        """
+        Show a water level series. ts holds epoch seconds, a datetime64
+        array (UTC) or datetime objects (local time), in any order.
+        The view is fitted to the data unless keep_view is set.
+        Blits when only the level line changed.
+        """
+        epoch = to_epoch_array(ts)
+        order = np.argsort(epoch, kind="stable")
+        epoch = epoch[order]
+        self._x = epoch_to_datenum(epoch)
+        self._y = np.asarray(water_levels, dtype=float)[order]
+        if title is None:
+            title = self.ax.get_title()
+
+        xlim = None if keep_view else self._window(epoch)
+        if xlim is not None and xlim != self.ax.get_xlim():
+            self.ax.set_xlim(*xlim)
+        self._plot_visible()
+
+        state = (tuple(self.ax.get_xlim()), title, self.warning_threshold,
+                 self.critical_threshold, not len(epoch))
+        if state == self._drawn and self._background is not None:
+            self._blit()
             return
-            
-        # Extract dates and water levels
-        dates = [item['date'] for item in history_data]
-        water_levels = [item['water_level'] for item in history_data]
-        
-        # Plot the data
-        ax.plot(dates, water_levels, marker='o', linestyle='-',
-                color='dodgerblue', linewidth=2, label='Water Level')
-        
-        # Add threshold lines
-        ax.axhline(y=self.warning_threshold, color='orange', linestyle='--',
-                  linewidth=1.5, alpha=0.8, label=f'Warning ({self.warning_threshold}%)')
-        ax.axhline(y=self.critical_threshold, color='red', linestyle='--',
-                  linewidth=1.5, alpha=0.8, label=f'Critical ({self.critical_threshold}%)')
-        
-        # Configure chart
-        ax.set_title('Water Level - Past 7 Days', fontsize=12)
-        ax.set_xlabel('Date', fontsize=10)
-        ax.set_ylabel('Water Level (%)', fontsize=10)
-        ax.set_ylim(0, 105)
-        ax.grid(True, linestyle=':', alpha=0.6)
-        ax.legend(fontsize=9)
-        
-        # Improve date label readability
-        self.figure.autofmt_xdate()
-        
-        # Ensure proper layout
+
+        self.empty_text.set_visible(not len(epoch))
+        self.ax.set_title(title, fontsize=12)
+        self.warning_line.set_ydata([self.warning_threshold] * 2)
+        self.critical_line.set_ydata([self.critical_threshold] * 2)
+        legend_texts = self.legend.get_texts()
+        legend_texts[1].set_text(f'Warning ({self.warning_threshold}%)')
+        legend_texts[2].set_text(f'Critical ({self.critical_threshold}%)')
+        self.canvas.draw_idle()
+
+    @staticmethod
+    def _window(epoch):
+        """x-limits around the data (see display_window), None when there is no data"""
+        if not len(epoch):
+            return None
+        return tuple(epoch_to_datenum(t) for t in display_window(epoch[0], epoch[-1]))
+
+    def _plot_visible(self):
+        """Give the level line the decimated visible part of the series"""
+        width = max(2, int(self.ax.bbox.width))
+        x, y = m4(self._x, self._y, width // 2, self.ax.get_xlim())
+        self.level_line.set_data(x, y)
+        self.level_line.set_marker('o' if len(x) <= self.MARKER_LIMIT else 'None')
+
+    def _on_resize(self, event):
         self.figure.tight_layout()
-        
-        # Update the canvas
-        self.canvas.draw()
+        self._plot_visible()
+
+    def view_range(self):
+        """Visible time range as (start, end) in epoch seconds"""
+        low, high = self.ax.get_xlim()
+        return datenum_to_epoch(low), datenum_to_epoch(high)
+
+    def set_view(self, start, end):
+        """Show the time range start..end (epoch seconds)"""
+        self.ax.set_xlim(epoch_to_datenum(start), epoch_to_datenum(end))
+        self.canvas.draw_idle()
+
+    def enable_navigation(self):
+        """Zoom the time axis with the mouse wheel and pan it by dragging"""
+        self.canvas.mpl_connect("scroll_event", self._on_scroll)
+        self.canvas.mpl_connect("button_press_event", self._on_press)
+        self.canvas.mpl_connect("motion_notify_event", self._on_motion)
+        self.canvas.mpl_connect("button_release_event", self._on_release)
+
+    def _on_scroll(self, event):
+        if event.inaxes is not self.ax:
+            return
+        low, high = self.ax.get_xlim()
+        factor = self.ZOOM_STEP ** -event.step
+        span = max((high - low) * factor, self.MIN_SPAN / 86400.0)
+        # Keep the time under the cursor in place
+        share = (event.xdata - low) / (high - low)
+        low = event.xdata - share * span
+        self.ax.set_xlim(low, low + span)
+        self.canvas.draw_idle()
+
+    def _on_press(self, event):
+        if event.inaxes is self.ax and event.button == 1:
+            self._drag = (event.x, self.ax.get_xlim())
+
+    def _on_motion(self, event):
+        if self._drag is None or event.x is None:
+            return
+        start_x, (low, high) = self._drag
+        shift = (event.x - start_x) * (high - low) / self.ax.bbox.width
+        self.ax.set_xlim(low - shift, high - shift)
+        self.canvas.draw_idle()
+
+    def _on_release(self, event):
+        self._drag = None
+
+    def _on_xlim_changed(self, ax):
+        self._plot_visible()
+        self.view_changed.emit(*self.view_range())
+
+    def _on_draw(self, event):
+        """After a full draw: keep the background and draw the level line on top"""
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._drawn = (tuple(self.ax.get_xlim()), self.ax.get_title(),
+                       self.warning_line.get_ydata()[0], self.critical_line.get_ydata()[0],
+                       self.empty_text.get_visible())
+        self.ax.draw_artist(self.level_line)
+
+    def _blit(self):
+        """Redraw only the level line over the cached background"""
+        self.canvas.restore_region(self._background)
+        self.ax.draw_artist(self.level_line)
+        self.canvas.blit(self.ax.bbox)
 
 
 # Test code